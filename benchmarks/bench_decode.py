@@ -0,0 +1,110 @@
+'''
+Microbenchmark of appdetails decoding, the first step of every scraped app.
+
+Compares DecodeAppDetails, which decodes straight into the typed records of
+records.py, with json.loads into nested dicts, over real appdetails responses read
+from a response cache directory filled by `steam_scraper.py --cache`. Without a
+cache, a built-in response in the style of the Steam store is used. Besides the
+decode time, the memory kept alive per decoded app is reported.
+
+Usage:
+    python benchmarks/bench_decode.py [--cache-dir cache] [--repeat 5]
+'''
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scraper')))
+
+from records import DecodeAppDetails
+
+SAMPLE_DATA = {
+    'type': 'game', 'name': 'Counter-Strike', 'steam_appid': 10, 'required_age': 0, 'is_free': False,
+    'detailed_description': '<p>Play the world\'s number 1 online action game.</p>' * 20,
+    'about_the_game': '<p>Play the world\'s number 1 online action game.</p>' * 20,
+    'short_description': 'Play the world\'s number 1 online action game.',
+    'supported_languages': 'English<strong>*</strong>, French<strong>*</strong>, German<strong>*</strong><br><strong>*</strong>languages with full audio support',
+    'header_image': 'https://cdn.akamai.steamstatic.com/steam/apps/10/header.jpg?t=1666823513',
+    'pc_requirements': {'minimum': '<strong>Minimum:</strong> 500 mhz processor, 96mb ram, 16mb video card'},
+    'mac_requirements': {'minimum': 'Minimum: OS X Snow Leopard 10.6.3, 1GB RAM, 4GB Hard Drive Space'},
+    'developers': ['Valve'], 'publishers': ['Valve'],
+    'price_overview': {'currency': 'USD', 'initial': 999, 'final': 999, 'discount_percent': 0, 'initial_formatted': '', 'final_formatted': '$9.99'},
+    'packages': [7, 29],
+    'package_groups': [{'name': 'default', 'title': 'Buy Counter-Strike', 'description': '', 'selection_text': 'Select a purchase option',
+                        'subs': [{'packageid': 7, 'option_text': 'Counter-Strike - $9.99', 'option_description': '', 'price_in_cents_with_discount': 999}]}],
+    'platforms': {'windows': True, 'mac': True, 'linux': True},
+    'metacritic': {'score': 88, 'url': 'https://www.metacritic.com/game/pc/counter-strike'},
+    'categories': [{'id': 1, 'description': 'Multi-player'}, {'id': 8, 'description': 'Valve Anti-Cheat enabled'}],
+    'genres': [{'id': '1', 'description': 'Action'}],
+    'screenshots': [{'id': i, 'path_thumbnail': f'https://cdn.akamai.steamstatic.com/steam/apps/10/{i}.600x338.jpg',
+                     'path_full': f'https://cdn.akamai.steamstatic.com/steam/apps/10/{i}.1920x1080.jpg'} for i in range(12)],
+    'recommendations': {'total': 150000},
+    'release_date': {'coming_soon': False, 'date': '1 Nov, 2000'},
+    'content_descriptors': {'ids': [2, 5], 'notes': 'Includes intense violence and blood.'},
+}
+
+def load_bodies(cache_dir):
+    '''
+    Collect every appdetails response body in the cache with its appID.
+    '''
+    bodies = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if not name.endswith('.gz'):
+                continue
+            try:
+                with gzip.open(os.path.join(root, name), 'rb') as f:
+                    content = f.read()
+                body = json.loads(content)
+            except (OSError, ValueError):
+                continue
+            if isinstance(body, dict) and len(body) == 1:
+                appID, response = next(iter(body.items()))
+                if isinstance(response, dict) and isinstance(response.get('data'), dict) and 'type' in response['data']:
+                    bodies.append((content, appID))
+    return bodies
+
+def decode_json(content, appID):
+    app = json.loads(content).get(str(appID), {})
+    return app.get('data') if app.get('success') else None
+
+def bench(function, bodies, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content, appID in bodies:
+            function(content, appID)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def retained(function, bodies):
+    '''
+    Bytes kept alive per app once its decoded payload is stored, as the scraper does.
+    '''
+    tracemalloc.start()
+    apps = [function(content, appID) for content, appID in bodies]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(apps)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='appdetails decoding microbenchmark.')
+    parser.add_argument('--cache-dir', type=str, default='cache', help='Response cache with appdetails payloads')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per implementation (the best is reported)')
+    args = parser.parse_args()
+
+    bodies = load_bodies(args.cache_dir) if os.path.isdir(args.cache_dir) else []
+    source = f'{len(bodies)} responses from {args.cache_dir}'
+    if not bodies:
+        bodies = [(json.dumps({'10': {'success': True, 'data': SAMPLE_DATA}}).encode('utf-8'), '10')] * 2000
+        source = f'{len(bodies)} copies of the built-in sample response'
+    size = sum(len(content) for content, _ in bodies) / 1024 ** 2
+
+    print(f'{source}, {size:.1f} MB')
+    for name, function in [('json.loads', decode_json), ('DecodeAppDetails', DecodeAppDetails)]:
+        seconds = bench(function, bodies, args.repeat)
+        print(f'{name:>16}: {seconds * 1000:8.1f} ms  {size / seconds:6.1f} MB/s  {retained(function, bodies) / 1024:6.1f} KB/app')
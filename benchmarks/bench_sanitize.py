@@ -0,0 +1,98 @@
+'''
+Microbenchmark of the HTML sanitizer used by ParseSteamGame.
+
+Compares SanitizeText with the previous two-pass regex implementation over the text
+fields of real appdetails responses, read from a response cache directory
+filled by `steam_scraper.py --cache`. Without a cache, a built-in description
+in the style of the Steam store is used.
+
+Usage:
+    python benchmarks/bench_sanitize.py [--cache-dir cache] [--repeat 5]
+'''
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scraper')))
+
+from utils import SanitizeText
+
+TEXT_FIELDS = ['detailed_description', 'about_the_game', 'short_description']
+
+SAMPLE_DESCRIPTION = (
+    '<h2 class="bb_tag">About the Game</h2><img src="https://cdn.akamai.steamstatic.com/steam/apps/10/extras/header.gif?t=1" />'
+    '<br><br>Play the world\'s number 1 online action game. Engage in an incredibly realistic brand of terrorist '
+    'warfare in this wildly popular team-based game. &quot;Ally with teammates&quot; to complete strategic missions.'
+    '<ul class="bb_ul"><li>Take out enemy sites.<br></li><li>Rescue hostages.<br></li>'
+    '<li>Your role affects your team&#39;s success &amp; your team&#39;s success affects your role.</li></ul>'
+    '<p class="bb_paragraph">  Features:\r\n\t<strong>20+ maps</strong>&nbsp;&nbsp;and <i>modes</i> &ndash; more!</p>'
+)
+
+def two_pass_sanitize(text):
+    '''
+    The regex sanitizer SanitizeText replaced, for comparison.
+    '''
+    if text:
+        text = re.sub('<[^<]+?>', '', text)
+        text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+def load_texts(cache_dir):
+    '''
+    Collect the text fields of every appdetails response in the cache.
+    '''
+    texts = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if not name.endswith('.gz'):
+                continue
+            try:
+                with gzip.open(os.path.join(root, name), 'rb') as f:
+                    body = json.loads(f.read())
+            except (OSError, ValueError):
+                continue
+            if not isinstance(body, dict):
+                continue
+            for response in body.values():
+                data = response.get('data') if isinstance(response, dict) else None
+                if isinstance(data, dict):
+                    texts.extend(data[field] for field in TEXT_FIELDS if data.get(field))
+                    for package in data.get('package_groups', []):
+                        texts.append(package.get('description', ''))
+                        texts.extend(sub.get('option_text', '') for sub in package.get('subs', []))
+    return [text for text in texts if text]
+
+def bench(function, texts, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sanitizer microbenchmark.')
+    parser.add_argument('--cache-dir', type=str, default='cache', help='Response cache with appdetails payloads')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per implementation (the best is reported)')
+    args = parser.parse_args()
+
+    texts = load_texts(args.cache_dir) if os.path.isdir(args.cache_dir) else []
+    source = f'{len(texts)} texts from {args.cache_dir}'
+    if not texts:
+        # The sample with its entities, and with them written out
+        texts = [SAMPLE_DESCRIPTION, SAMPLE_DESCRIPTION.replace('&', 'and ')] * 1000
+        source = f'{len(texts)} copies of the built-in sample description'
+    size = sum(len(text) for text in texts) / 1024 ** 2
+
+    same = sum(two_pass_sanitize(text) == SanitizeText(text) for text in texts if '&' not in text)
+    without_entities = sum('&' not in text for text in texts)
+    print(f'{source}, {size:.1f} MB')
+    print(f'Identical output on {same}/{without_entities} texts without HTML entities')
+    for name, function in [('two-pass', two_pass_sanitize), ('SanitizeText', SanitizeText)]:
+        seconds = bench(function, texts, args.repeat)
+        print(f'{name:>12}: {seconds * 1000:8.1f} ms  {size / seconds:6.1f} MB/s')
@@ -0,0 +1,137 @@
+'''
+End-to-end throughput benchmark of Scraper().
+
+Runs a full scrape, chunk uploads and merge included, against local stand-ins for
+the Steam store, Steam Web API, SteamSpy and S3 (see mock_services.py), and
+reports apps per second, per-app latency from fetch to write (p50/p99), peak RSS
+and bytes written to S3. Responses are replayed from a response cache directory
+filled by `steam_scraper.py --cache` when one is given, and synthesized otherwise.
+
+Arguments after `--` are passed to the scraper, so the effect of a change can be
+measured before it goes to production, e.g.:
+
+    python benchmarks/bench_scraper.py --apps 2000 --latency 0.2 -- --concurrency 8
+    python benchmarks/bench_scraper.py --apps 2000 --latency 0.2 -- --concurrency 32
+    python benchmarks/bench_scraper.py --burst-every 100 --burst-length 5 --error-rate 0.01 -- --parse-workers 0
+
+The Steam and SteamSpy rate limits are lifted unless --store-rate and
+--steamspy-rate are passed to the scraper.
+'''
+import argparse
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scraper')))
+
+import api
+import config
+import metrics
+import steam_scraper
+import utils
+from cache import ResponseCache
+from engine import Pipeline
+from mock_services import Fixtures, Faults, MockAPI, MockS3, route_to
+
+BUCKET = 'bench'
+
+class TimedPipeline(Pipeline):
+    '''
+    Pipeline recording the time of every app from the start of its fetch to the
+    end of its write.
+    '''
+    latencies = []
+    last = None
+
+    def __init__(self, fetch, parse, on_result, *args, **kwargs):
+        started = {}
+        TimedPipeline.last = self
+
+        def timed_fetch(appID):
+            started[appID] = time.monotonic()
+            return fetch(appID)
+
+        def timed_on_result(appID, result):
+            try:
+                return on_result(appID, result)
+            finally:
+                TimedPipeline.latencies.append(time.monotonic() - started.pop(appID))
+
+        super().__init__(timed_fetch, parse, timed_on_result, *args, **kwargs)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+def peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+def run(args, scraper_args):
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.burst_every, args.burst_length, args.retry_after)
+    api_server = MockAPI(Fixtures(args.apps, args.cache_dir), {None: faults})
+    s3_server = MockS3()
+    utils.s3_client = s3_server.client()
+
+    scraper_args = steam_scraper.build_parser().parse_args(
+        ['--bucket', BUCKET, '--metrics-port', '0', '--metrics-file', '',
+         '--store-rate', '1000', '--steamspy-rate', '1000'] + scraper_args)
+    api.get_session = route_to(api_server, scraper_args.concurrency)
+    api.set_pool_size(scraper_args.concurrency)
+    for host, rate in [('store.steampowered.com', scraper_args.store_rate), ('steamspy.com', scraper_args.steamspy_rate)]:
+        steam_scraper.set_rate_limit(host, rate, config.RATE_LIMITS[host][1])
+    if scraper_args.cache or scraper_args.replay:
+        api.set_cache(ResponseCache(os.path.abspath(scraper_args.cache_dir), scraper_args.cache_ttl), replay=scraper_args.replay)
+    config.STEAMSPY_PAGE_SLEEP = 0
+    steam_scraper.Pipeline = TimedPipeline
+    os.environ.pop('STEAM_API_KEY', None)
+
+    start = time.perf_counter()
+    try:
+        steam_scraper.Scraper(None, [], [], scraper_args)
+        elapsed = time.perf_counter() - start
+    finally:
+        api_server.close()
+        s3_server.close()
+
+    latencies = TimedPipeline.latencies
+    scraped = len(latencies)
+    print(f'Apps: {scraped} processed in {elapsed:.2f} s, {scraped / elapsed:.1f} apps/s')
+    print(f'Per-app latency: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms')
+    print(f'Peak RSS: {peak_rss_mb(resource.RUSAGE_SELF):.1f} MB (parse workers: {peak_rss_mb(resource.RUSAGE_CHILDREN):.1f} MB)')
+    print(f'S3: {s3_server.stats.get("bytes_written", 0) / 1024 ** 2:.2f} MB written in {s3_server.stats.get("put", 0)} PUTs, '
+          f'{s3_server.stats.get("bytes_read", 0) / 1024 ** 2:.2f} MB read')
+    served = {host: count for host, count in api_server.stats.items() if '.' in host}
+    print(f'API: {served} responses, {api_server.stats.get("bytes", 0) / 1024 ** 2:.2f} MB, '
+          f'{api_server.stats.get("429", 0)} rate limited, {api_server.stats.get("500", 0)} errors, '
+          f'{sum(metrics.RETRIES.values.values())} retries')
+    for stage, stats in TimedPipeline.last.stats().items():
+        print(f'{stage:>6} stage: {stats["utilization"]:.0%} utilization over {stats["items"]} items')
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    scraper_args = argv[argv.index('--') + 1:] if '--' in argv else []
+    argv = argv[:argv.index('--')] if '--' in argv else argv
+
+    parser = argparse.ArgumentParser(description='End-to-end scraper benchmark against local mock services.')
+    parser.add_argument('--apps',         type=int,   default=1000, help='Number of apps in the mock app list')
+    parser.add_argument('--cache-dir',    type=str,   default=None, help='Response cache with recorded responses to replay')
+    parser.add_argument('--latency',      type=float, default=0.05, help='Seconds added to every mock API response')
+    parser.add_argument('--jitter',       type=float, default=0.0,  help='Maximum random seconds added to the latency')
+    parser.add_argument('--error-rate',   type=float, default=0.0,  help='Fraction of mock API requests answered with a 500')
+    parser.add_argument('--burst-every',  type=int,   default=0,    help='Start a burst of 429 responses every this many requests')
+    parser.add_argument('--burst-length', type=int,   default=0,    help='Number of 429 responses per burst')
+    parser.add_argument('--retry-after',  type=float, default=None, help='Retry-After seconds sent with the 429 responses')
+    parser.add_argument('--verbose',      action='store_true',      help='Keep the scraper log')
+    args = parser.parse_args(argv)
+    args.cache_dir = os.path.abspath(args.cache_dir) if args.cache_dir else None
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # Keep the scraper's local files out of the working tree
+        run(args, scraper_args)
@@ -0,0 +1,110 @@
+'''
+Benchmark of the Polars transformer: wall time and peak RSS of transform() on the
+merged steam_games.json, on the chunk files and on newline-delimited JSON.
+
+The games are read from a merged JSON file when one is given, and synthesized
+otherwise with the value distributions of the Steam catalog (genres, languages,
+developers, review counts). Each input is transformed in a fresh process, so the
+peak RSS of one run does not hide another's.
+
+Usage:
+    python benchmarks/bench_transformer.py [--games 100000] [--data data/steam_games.json]
+'''
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'transformer')))
+
+GENRES = ['Indie', 'Casual', 'Action', 'Adventure', 'Simulation', 'Strategy', 'RPG', 'Early Access', 'Free to Play', 'Sports', 'Racing', 'Massively Multiplayer']
+LANGUAGES = ['English', 'French', 'German', 'Spanish - Spain', 'Japanese', 'Russian', 'Simplified Chinese', 'Italian', 'Korean', 'Portuguese - Brazil']
+CATEGORIES = ['Single-player', 'Multi-player', 'Steam Achievements', 'Steam Cloud', 'Full controller support', 'Steam Trading Cards', 'PvP', 'Co-op']
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+OWNERS = ['0 - 20000', '20000 - 50000', '50000 - 100000', '100000 - 200000', '1000000 - 2000000', '10000000 - 20000000']
+
+def synthesize(count, seed=0):
+    rng = random.Random(seed)
+    developers = [f'Studio {i}' for i in range(count // 3 + 1)]
+    games = {}
+    for appID in range(10, 10 + 10 * count, 10):
+        languages = rng.sample(LANGUAGES, rng.randint(1, len(LANGUAGES)))
+        games[str(appID)] = {
+            'name': f'Game {appID}', 'release_date': f'{rng.choice(MONTHS)} {rng.randint(1, 28)}, {rng.randint(2000, 2024)}',
+            'required_age': rng.choice([0, 0, 0, 0, 12, 16, 18]), 'price': rng.choice([0.0, 0.99, 4.99, 9.99, 19.99, 59.99]),
+            'dlc_count': int(rng.expovariate(0.5)), 'windows': True, 'mac': rng.random() < 0.25, 'linux': rng.random() < 0.15,
+            'metacritic_score': rng.choice([0] * 9 + [rng.randint(40, 95)]), 'achievements': rng.randint(0, 100),
+            'recommendations': int(rng.paretovariate(1.2)) - 1,
+            'supported_languages': languages, 'full_audio_languages': languages[:rng.randint(0, len(languages))],
+            'developers': rng.sample(developers, rng.choice([1, 1, 1, 2])), 'publishers': rng.sample(developers, 1),
+            'categories': rng.sample(CATEGORIES, rng.randint(1, 5)), 'genres': rng.sample(GENRES, rng.randint(1, 4)),
+            'user_score': 0, 'score_rank': '', 'positive': int(rng.paretovariate(1.1)) - 1, 'negative': int(rng.paretovariate(1.3)) - 1,
+            'estimated_owners': rng.choice(OWNERS), 'average_playtime_forever': rng.randint(0, 5000), 'average_playtime_2weeks': 0,
+            'median_playtime_forever': rng.randint(0, 3000), 'median_playtime_2weeks': 0, 'peak_ccu': int(rng.paretovariate(1.5)) - 1,
+        }
+    return games
+
+def write_inputs(games, directory, chunk_size=2000):
+    '''
+    Write the games as a merged file, as chunk files with a manifest and as
+    newline-delimited JSON, and return the path of each by name.
+    '''
+    merged = os.path.join(directory, 'steam_games.json')
+    with open(merged, 'w') as f:
+        json.dump(games, f, indent=4)
+
+    chunks = os.path.join(directory, 'chunks')
+    os.makedirs(chunks)
+    items, keys = list(games.items()), []
+    for start in range(0, len(items), chunk_size):
+        keys.append(f'chunk_{len(keys) + 1}.json')
+        with open(os.path.join(chunks, keys[-1]), 'w') as f:
+            json.dump(dict(items[start:start + chunk_size]), f, separators=(',', ':'))
+    with open(os.path.join(chunks, 'manifest.json'), 'w') as f:
+        json.dump({'chunks': keys}, f)
+
+    ndjson = os.path.join(directory, 'steam_games.jsonl')
+    with open(ndjson, 'w') as f:
+        for appID, game in items:
+            f.write(json.dumps({'app_id': appID, **game}) + '\n')
+    return {'merged': merged, 'chunks': chunks, 'ndjson': ndjson}
+
+def run_once(path, output_dir):
+    from polars_transformer import transform
+    start = time.perf_counter()
+    transform(path, output_dir)
+    elapsed = time.perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'seconds': elapsed, 'rss_mb': rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024}))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the Polars transformer.')
+    parser.add_argument('--games', type=int, default=100000, help='Number of synthesized games')
+    parser.add_argument('--data',  type=str, default=None,   help='Merged JSON file to read the games from')
+    parser.add_argument('--run',   nargs=2, metavar=('PATH', 'OUTPUT_DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_once(*args.run)
+        sys.exit()
+
+    if args.data:
+        with open(args.data, 'r') as f:
+            games = json.load(f)
+    else:
+        games = synthesize(args.games)
+    with tempfile.TemporaryDirectory() as directory:
+        inputs = write_inputs(games, directory)
+        size = os.path.getsize(inputs['merged']) / 1024 ** 2
+        print(f'{len(games)} games, merged file {size:.1f} MB')
+        del games
+        for name, path in inputs.items():
+            output = subprocess.run([sys.executable, __file__, '--run', path, os.path.join(directory, f'out_{name}')],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f'{name:>7}: {result["seconds"]:.2f} s, peak RSS {result["rss_mb"]:.0f} MB')
@@ -0,0 +1,396 @@
+'''
+Local stand-ins for the services the scraper talks to, for benchmarks.
+
+MockAPI answers the Steam store (appdetails), Steam Web API (GetAppList) and
+SteamSpy endpoints from recorded fixtures, with configurable latency, bursts of
+429 responses and random server errors. MockS3 is an in-memory S3-compatible
+server covering the calls made by utils.py (objects, listing, batch delete and
+multipart uploads).
+
+The scraper's hard-coded URLs are sent to MockAPI by `route_to`, which mounts a
+requests adapter rewriting https://host/path into http://mock/https/host/path.
+'''
+import hashlib
+import json
+import random
+import re
+import sys
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, unquote
+from xml.sax.saxutils import escape
+import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scraper')))
+
+from cache import ResponseCache
+
+SAMPLE_APP = {
+    'type': 'game', 'required_age': 0, 'is_free': False,
+    'detailed_description': '<h2 class="bb_tag">About</h2><p>Play the world&#39;s number 1 online action game.</p>' * 20,
+    'about_the_game': '<p>Play the world\'s number 1 online action game.</p>' * 20,
+    'short_description': 'Play the world\'s number 1 online action game.',
+    'supported_languages': 'English<strong>*</strong>, French<strong>*</strong>, German<br><strong>*</strong>languages with full audio support',
+    'header_image': 'https://cdn.akamai.steamstatic.com/steam/apps/10/header.jpg?t=1666823513',
+    'pc_requirements': {'minimum': '<strong>Minimum:</strong> 500 mhz processor, 96mb ram, 16mb video card'},
+    'developers': ['Valve'], 'publishers': ['Valve'],
+    'price_overview': {'currency': 'USD', 'initial': 999, 'final': 999, 'discount_percent': 0, 'initial_formatted': '', 'final_formatted': '$9.99'},
+    'package_groups': [{'name': 'default', 'title': 'Buy the game', 'description': '', 'selection_text': 'Select a purchase option',
+                        'subs': [{'packageid': 7, 'option_text': 'The game - $9.99', 'option_description': '', 'price_in_cents_with_discount': 999}]}],
+    'platforms': {'windows': True, 'mac': True, 'linux': False},
+    'metacritic': {'score': 88, 'url': 'https://www.metacritic.com/game/pc/the-game'},
+    'categories': [{'id': 1, 'description': 'Multi-player'}, {'id': 8, 'description': 'Valve Anti-Cheat enabled'}],
+    'genres': [{'id': '1', 'description': 'Action'}],
+    'screenshots': [{'id': i, 'path_full': f'https://cdn.akamai.steamstatic.com/steam/apps/10/{i}.1920x1080.jpg'} for i in range(12)],
+    'recommendations': {'total': 1500},
+    'release_date': {'coming_soon': False, 'date': '1 Nov, 2000'},
+    'content_descriptors': {'ids': [2, 5], 'notes': 'Includes intense violence and blood.'},
+}
+
+class Fixtures:
+    '''
+    Response bodies served by MockAPI. Responses found in a response cache directory
+    (filled by `steam_scraper.py --cache`) are replayed as recorded; other apps get
+    a synthetic response built from SAMPLE_APP. Synthetic apps are games, except
+    for a stable `discarded` fraction of DLCs and a `coming_soon` fraction of not
+    released games.
+
+    :param apps: Number of apps in the app list, or a list of appIDs.
+    :param cache_dir: Response cache to replay, or None.
+    '''
+    def __init__(self, apps=1000, cache_dir=None, discarded=0.1, coming_soon=0.05):
+        self.app_ids = [int(appID) for appID in apps] if not isinstance(apps, int) else list(range(10, 10 * (apps + 1), 10))
+        self.cache = ResponseCache(cache_dir, ttl=None, max_bytes=None) if cache_dir else None
+        self.discarded = discarded
+        self.coming_soon = coming_soon
+
+    def _fraction(self, appID):
+        return int(hashlib.md5(str(appID).encode()).hexdigest()[:8], 16) / 0xffffffff
+
+    def recorded(self, url, params):
+        return self.cache.get(url, params, ignore_ttl=True) if self.cache else None
+
+    def appdetails(self, appID):
+        fraction = self._fraction(appID)
+        data = dict(SAMPLE_APP, name=f'Game {appID}', steam_appid=int(appID))
+        if fraction < self.discarded:
+            data['type'] = 'dlc'
+        elif fraction < self.discarded + self.coming_soon:
+            data['release_date'] = {'coming_soon': True, 'date': 'Q4 2030'}
+        return json.dumps({str(appID): {'success': True, 'data': data}}).encode('utf-8')
+
+    def steamspy(self, appID):
+        return {'appid': int(appID), 'name': f'Game {appID}', 'developer': 'Valve', 'publisher': 'Valve',
+                'positive': 1000, 'negative': 100, 'userscore': 0, 'owners': '1,000,000 .. 2,000,000',
+                'average_forever': 300, 'average_2weeks': 10, 'median_forever': 200, 'median_2weeks': 5,
+                'ccu': int(self._fraction(appID) * 10000), 'tags': {'Action': 100}}
+
+    def steamspy_page(self, page, size=1000):
+        return {str(appID): self.steamspy(appID) for appID in self.app_ids[page * size:(page + 1) * size]}
+
+class Faults:
+    '''
+    Failures injected into MockAPI responses.
+
+    :param latency: Seconds added to every response.
+    :param jitter: Maximum random seconds added on top of `latency`.
+    :param error_rate: Fraction of requests answered with a 500.
+    :param burst_every: Every this many requests, a burst of 429 responses ends (0 for none).
+    :param burst_length: Number of 429 responses in a burst. Each burst takes the last
+                         requests of its period, so the first requests of a run are
+                         answered normally.
+    :param retry_after: Retry-After seconds sent with the 429 responses (None for no header).
+    '''
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, burst_every=0, burst_length=0, retry_after=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def next(self):
+        '''
+        Return (delay, status) for the next request; status None means a normal response.
+        '''
+        with self.lock:
+            self.requests += 1
+            count = self.requests
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+        if self.burst_every and count % self.burst_every >= self.burst_every - self.burst_length:
+            return delay, 429
+        return delay, 500 if failed else None
+
+class MockServer(ThreadingHTTPServer):
+    '''
+    Threaded local HTTP server on a free port, serving from a background thread.
+    '''
+    daemon_threads = True
+
+    def __init__(self, handler):
+        super().__init__(('127.0.0.1', 0), handler)
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def count(self, name, amount=1):
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + amount
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=b'', content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def body(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if 'aws-chunked' in (self.headers.get('Content-Encoding') or ''):
+            data = _decode_aws_chunked(data)
+        return data
+
+def _decode_aws_chunked(data):
+    out, position = bytearray(), 0
+    while position < len(data):
+        end = data.index(b'\r\n', position)
+        size = int(data[position:end].split(b';')[0], 16)
+        if size == 0:
+            break
+        out += data[end + 2:end + 2 + size]
+        position = end + 4 + size
+    return bytes(out)
+
+class MockAPI(MockServer):
+    '''
+    Stand-in for the Steam store, Steam Web API and SteamSpy endpoints.
+
+    :param fixtures: Fixtures to serve.
+    :param faults: Faults to inject, per host; the key None applies to every other host.
+    '''
+    def __init__(self, fixtures, faults=None):
+        self.fixtures = fixtures
+        self.faults = faults or {}
+        super().__init__(_APIHandler)
+
+class _APIHandler(_Handler):
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        scheme, host, path = (parts.path.lstrip('/').split('/', 2) + ['', ''])[:3]
+        url = f'{scheme}://{host}/{path}'
+        params = dict(parse_qsl(parts.query))
+
+        faults = server.faults.get(host, server.faults.get(None))
+        if faults is not None:
+            delay, status = faults.next()
+            if delay:
+                time.sleep(delay)
+            if status == 429:
+                server.count('429')
+                headers = {'Retry-After': str(faults.retry_after)} if faults.retry_after is not None else None
+                return self.reply(429, b'Too Many Requests', 'text/plain', headers)
+            if status:
+                server.count('500')
+                return self.reply(status, b'Internal Server Error', 'text/plain')
+
+        server.count(host)
+        body = server.fixtures.recorded(url, params)
+        if body is None:
+            body = self.generate(host, path, params)
+        if body is None:
+            return self.reply(404, b'{}')
+        server.count('bytes', len(body))
+        self.reply(200, body)
+
+    def generate(self, host, path, params):
+        fixtures = self.server.fixtures
+        if host == 'store.steampowered.com' and path.startswith('api/appdetails'):
+            return fixtures.appdetails(params.get('appids'))
+        if path.startswith('ISteamApps/GetAppList'):
+            return json.dumps({'applist': {'apps': [{'appid': appID, 'name': f'Game {appID}'} for appID in fixtures.app_ids]}}).encode('utf-8')
+        if path.startswith('IStoreService/GetAppList'):
+            last = int(params.get('last_appid', 0))
+            size = int(params.get('max_results', 50000))
+            apps = [appID for appID in fixtures.app_ids if appID > last][:size]
+            more = bool(apps) and apps[-1] != fixtures.app_ids[-1]
+            data = {'apps': [{'appid': appID, 'last_modified': 1700000000} for appID in apps], 'have_more_results': more}
+            if more:
+                data['last_appid'] = apps[-1]
+            return json.dumps({'response': data}).encode('utf-8')
+        if host == 'steamspy.com':
+            if params.get('request') == 'all':
+                return json.dumps(fixtures.steamspy_page(int(params.get('page', 0)))).encode('utf-8')
+            return json.dumps(fixtures.steamspy(params.get('appid'))).encode('utf-8')
+        return None
+
+class MockS3(MockServer):
+    '''
+    In-memory S3-compatible server (path-style addressing), with counters of the
+    requests and of the bytes written.
+    '''
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+        super().__init__(_S3Handler)
+
+    def client(self):
+        '''
+        Return a boto3 S3 client for this server.
+        '''
+        import boto3
+        from botocore.config import Config
+        options = {'s3': {'addressing_style': 'path'}, 'retries': {'max_attempts': 1}}
+        try:
+            config = Config(request_checksum_calculation='when_required', response_checksum_validation='when_required', **options)
+        except TypeError:  # botocore before 1.36
+            config = Config(**options)
+        return boto3.client('s3', endpoint_url=self.url, region_name='us-east-1',
+                            aws_access_key_id='bench', aws_secret_access_key='bench', config=config)
+
+NOT_FOUND = b'<?xml version="1.0" encoding="UTF-8"?><Error><Code>NoSuchKey</Code><Message>The specified key does not exist.</Message></Error>'
+
+class _S3Handler(_Handler):
+    def target(self):
+        parts = urlsplit(self.path)
+        bucket, _, key = parts.path.lstrip('/').partition('/')
+        return bucket, unquote(key), dict(parse_qsl(parts.query, keep_blank_values=True))
+
+    def xml(self, body, status=200):
+        self.reply(status, ('<?xml version="1.0" encoding="UTF-8"?>' + body).encode('utf-8'), 'application/xml')
+
+    def do_PUT(self):
+        server = self.server
+        bucket, key, query = self.target()
+        data = self.body()
+        server.count('put')
+        server.count('bytes_written', len(data))
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        with server.lock:
+            if 'uploadId' in query:
+                server.uploads[query['uploadId']][int(query['partNumber'])] = data
+            else:
+                server.objects[(bucket, key)] = data
+        self.reply(200, headers={'ETag': etag})
+
+    def do_GET(self):
+        server = self.server
+        bucket, key, query = self.target()
+        server.count('get')
+        if not key:
+            prefix = query.get('prefix', '')
+            with server.lock:
+                keys = sorted((k, len(v)) for (b, k), v in server.objects.items() if b == bucket and k.startswith(prefix))
+            contents = ''.join(f'<Contents><Key>{escape(k)}</Key><Size>{size}</Size></Contents>' for k, size in keys)
+            return self.xml(f'<ListBucketResult><Name>{bucket}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(keys)}</KeyCount>'
+                            f'<IsTruncated>false</IsTruncated>{contents}</ListBucketResult>')
+        with server.lock:
+            data = server.objects.get((bucket, key))
+        if data is None:
+            return self.reply(404, b'' if self.command == 'HEAD' else NOT_FOUND, 'application/xml')
+        status, headers = 200, {'ETag': '"' + hashlib.md5(data).hexdigest() + '"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT',
+                                'Accept-Ranges': 'bytes'}
+        byte_range = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+        if byte_range:
+            start = int(byte_range.group(1))
+            end = int(byte_range.group(2)) if byte_range.group(2) else len(data) - 1
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+            data, status = data[start:end + 1], 206
+        server.count('bytes_read', len(data) if self.command == 'GET' else 0)
+        self.reply(status, data, 'application/octet-stream', headers)
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        server = self.server
+        bucket, key, query = self.target()
+        data = self.body()
+        if 'delete' in query:
+            keys = re.findall(rb'<Key>(.*?)</Key>', data)
+            with server.lock:
+                for k in keys:
+                    server.objects.pop((bucket, k.decode('utf-8')), None)
+            return self.xml('<DeleteResult></DeleteResult>')
+        if 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            with server.lock:
+                server.uploads[upload_id] = {}
+            return self.xml(f'<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{escape(key)}</Key>'
+                            f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+        if 'uploadId' in query:
+            with server.lock:
+                parts = server.uploads.pop(query['uploadId'])
+                server.objects[(bucket, key)] = b''.join(parts[number] for number in sorted(parts))
+            return self.xml(f'<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{escape(key)}</Key>'
+                            f'<ETag>"{uuid.uuid4().hex}-{len(parts)}"</ETag></CompleteMultipartUploadResult>')
+        self.reply(400)
+
+    def do_DELETE(self):
+        server = self.server
+        bucket, key, query = self.target()
+        with server.lock:
+            if 'uploadId' in query:
+                server.uploads.pop(query['uploadId'], None)
+            else:
+                server.objects.pop((bucket, key), None)
+        self.reply(204)
+
+class RoutingAdapter(HTTPAdapter):
+    '''
+    Sends every request to a mock server, keeping the original scheme and host in
+    the path: https://host/path?query becomes {base}/https/host/path?query.
+    '''
+    def __init__(self, base, **kwargs):
+        super().__init__(**kwargs)
+        self.base = base
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = f'{self.base}/{parts.scheme}/{parts.netloc}{parts.path}' + (f'?{parts.query}' if parts.query else '')
+        return super().send(request, **kwargs)
+
+def route_to(server, pool_size=10):
+    '''
+    Return a function to use as api.get_session, routing every host to the mock
+    server through one pooled session per host, as get_session does.
+    '''
+    sessions, lock = {}, threading.Lock()
+
+    def get_session(url):
+        host = urlsplit(url).hostname
+        with lock:
+            if host not in sessions:
+                session = requests.Session()
+                adapter = RoutingAdapter(server.url, pool_connections=1, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                sessions[host] = session
+            return sessions[host]
+    return get_session
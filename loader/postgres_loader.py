@@ -21,7 +21,13 @@ def save_to_postgres(df, table_name, conn_params):
         'Time': 'TIME',
     }
     
-    columns = ', '.join([f"{col} {type_mapping.get(str(dtype), 'TEXT')}" for col, dtype in zip(df.columns, df.dtypes)])
+    def sql_type(dtype):
+        # List columns (genres, developers, ...) become arrays, categoricals text
+        if dtype.base_type() == pl.List:
+            return sql_type(dtype.inner) + '[]'
+        return type_mapping.get(str(dtype), 'TEXT')
+
+    columns = ', '.join([f"{col} {sql_type(dtype)}" for col, dtype in zip(df.columns, df.dtypes)])
     data = [tuple(row) for row in df.rows()]
     columns_str = ', '.join(df.columns)
     query = f"INSERT INTO {table_name} ({columns_str}) VALUES %s"
@@ -1,85 +1,253 @@
-import sys
 import re
+import datetime as dt
+from email.utils import parsedate_to_datetime
 import requests
-from utils import SanitizeText, Log, PriceToFloat
+import threading
+from requests.adapters import HTTPAdapter
+from utils import SanitizeText, Log, PriceToFloat, HTML_TAG_RE
 from ssl import SSLError
 import time
 import traceback
+import msgspec
 import config
+from ratelimit import get_controller, host_of
+from cache import CachedResponse
+from records import DecodeAppDetails, AsAppDetails
+from metrics import REQUEST_SECONDS, RESPONSE_BYTES, RETRIES, RATE_LIMITED, BACKOFF_SECONDS, RATE_WAIT_SECONDS
 from requests.exceptions import HTTPError, ConnectionError, Timeout, RequestException
 
 
-def DoRequest(url, parameters=None, retryTime=5, successCount=0, errorCount=0, retries=0, headers=None):
+_sessions = {}
+_sessions_lock = threading.Lock()
+_pool_size = config.DEFAULT_CONCURRENCY
+
+def set_pool_size(size):
     '''
-    Makes a Web request. If an error occurs, retry.
+    Set the number of keep-alive connections kept per host. Should match the
+    scraper concurrency so that no thread has to open a fresh connection.
+    '''
+    global _pool_size
+    with _sessions_lock:
+        _pool_size = size
+        _sessions.clear()
+
+def get_session(url):
+    '''
+    Return the pooled keep-alive session for the host of the given URL.
+    '''
+    host = host_of(url)
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+        return session
+
+class RetriesExhausted(Exception):
+    '''
+    Raised by DoRequest when a request still fails after all retries.
+    '''
+
+_deadline = None
+
+def set_deadline(deadline):
+    '''
+    Make DoRequest give up, rather than wait for a retry, once the retry would
+    end after `deadline` (a time.monotonic() value). None removes the deadline.
+    '''
+    global _deadline
+    _deadline = deadline
+
+def ParseRetryAfter(response):
+    '''
+    Return the delay in seconds requested by a Retry-After header, or None.
+    The header may hold either a number of seconds or an HTTP date.
     '''
-    response = None
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not isinstance(value, str) or not value.strip():
+        return None
     try:
-        # Make request with custom headers
-        response = requests.get(url=url, params=parameters, timeout=config.DEFAULT_TIMEOUT, allow_redirects=True, headers=headers)
-        response.raise_for_status()  # Raise HTTPError for bad responses
-    except (HTTPError, ConnectionError, Timeout, RequestException, SSLError) as ex:
-        Log(config.EXCEPTION, f'An exception of type {type(ex).__name__} occurred: {ex}')
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - dt.datetime.now(dt.timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def DoRequest(url, parameters=None, retries=0, headers=None, throttled=None):
+    '''
+    Makes a Web request. If an error occurs, retry.
+
+    Connections are reused through a pooled session per host, and pacing, retry
+    delays and the circuit breaker come from the host's shared RateController.
+    A Retry-After header on 429/503 responses is honoured.
+
+    :param retries: Number of retries, or 0 to retry until the request succeeds.
+    :param throttled: Optional function that flags a 200 response as rate limited.
+    :raises RetriesExhausted: If the request failed and no retries are left, or
+        the next retry, or the host's pause (open circuit, Retry-After), would
+        end after the deadline set by set_deadline.
+    '''
+    controller = get_controller(url)
+    host = host_of(url)
+    attempt = 0
+    while True:
         response = None
+        try:
+            # Wait for the host's rate controller, then make request with custom headers
+            waited = time.monotonic()
+            if not controller.acquire(_deadline):
+                raise RetriesExhausted(f'No time left to wait for {host} after {attempt} attempts')
+            start = time.monotonic()
+            RATE_WAIT_SECONDS.inc(start - waited, host=host)
+            response = get_session(url).get(url=url, params=parameters, timeout=config.DEFAULT_TIMEOUT, allow_redirects=True, headers=headers)
+            response.raise_for_status()  # Raise HTTPError for bad responses
+        except (HTTPError, ConnectionError, Timeout, RequestException, SSLError) as ex:
+            Log(config.EXCEPTION, f'An exception of type {type(ex).__name__} occurred: {ex}')
+            if not isinstance(ex, HTTPError):
+                response = None
+        REQUEST_SECONDS.observe(time.monotonic() - start, host=host, status=response.status_code if response is not None else 'error')
+        if response is not None:
+            RESPONSE_BYTES.inc(len(response.content), host=host)
+
+        if response is not None and response.status_code == 200 and not (throttled and throttled(response)):
+            controller.on_success()
+            return response
 
-    if response and response.status_code == 200:
-        errorCount = 0
-        successCount += 1
-        if successCount > retryTime:
-            retryTime = min(5, retryTime / 2)
-            successCount = 0
-    else:
-        if retries == 0 or errorCount < retries:
-            errorCount += 1
-            successCount = 0
-            retryTime = min(retryTime * 2, 500)
-            if response is not None:
-                Log(config.WARNING, f'{response.reason}, retrying in {retryTime} seconds')
-            else:
-                Log(config.WARNING, f'Request failed, retrying in {retryTime} seconds.')
-
-            time.sleep(retryTime)
-            return DoRequest(url, parameters, retryTime, successCount, errorCount, retries, headers)
+        if response is not None and response.status_code in (200, 429, 503):
+            RATE_LIMITED.inc(host=host)  # A 200 that got here was flagged as throttled
+        RETRIES.inc(host=host)
+        retryAfter = ParseRetryAfter(response) if response is not None and response.status_code in (429, 503) else None
+        attempt += 1
+        retryTime = controller.on_failure(retryAfter, attempt)
+        if retries and attempt > retries:
+            raise RetriesExhausted(f'No more retries for {url} after {attempt} attempts')
+        if _deadline is not None and time.monotonic() + retryTime > _deadline:
+            raise RetriesExhausted(f'No time left to retry {url} after {attempt} attempts')
+
+        if retryAfter:
+            Log(config.WARNING, f'Rate limited by {host_of(url)}, retrying in {retryTime:.1f} seconds')
+        elif response is not None:
+            Log(config.WARNING, f'{response.reason}, retrying in {retryTime:.1f} seconds')
         else:
-            print('[!] No more retries.')
-            sys.exit()
+            Log(config.WARNING, f'Request failed, retrying in {retryTime:.1f} seconds.')
+        BACKOFF_SECONDS.inc(retryTime, host=host)
+        time.sleep(retryTime)
+
+class CacheMiss(Exception):
+    '''
+    Raised in replay mode when a response is not in the response cache.
+    '''
+
+_cache = None
+_replay = False
+
+def set_cache(cache, replay=False):
+    '''
+    Enable the on-disk response cache for Steam and SteamSpy requests.
 
+    :param cache: A ResponseCache, or None to disable caching.
+    :param replay: Serve every request from the cache, whatever its age, and never
+                   touch the network. Missing entries raise CacheMiss.
+    '''
+    global _cache, _replay
+    _cache, _replay = cache, replay
+
+def CachedRequest(url, parameters=None, retries=0, headers=None, throttled=None):
+    '''
+    DoRequest through the response cache, when one is enabled. Fresh responses are
+    stored as they arrive so that the data can be re-parsed later without scraping.
+    '''
+    if _cache is not None:
+        content = _cache.get(url, parameters, ignore_ttl=_replay)
+        if content is not None:
+            return CachedResponse(content)
+        if _replay:
+            raise CacheMiss(f'No cached response for {url} {parameters}')
+
+    response = DoRequest(url, parameters, retries, headers, throttled)
+    if _cache is not None and response:
+        _cache.put(url, parameters, response.content)
     return response
 
-def SteamRequest(appID, retryTime, successRequestCount, errorRequestCount, retries, currency=config.DEFAULT_CURRENCY, language=config.DEFAULT_LANGUAGE):
+def SteamRequest(appID, retries=config.DEFAULT_RETRIES, currency=config.DEFAULT_CURRENCY, language=config.DEFAULT_LANGUAGE):
   '''
   Request and parse information about a Steam app.
+
+  :return: The app's AppDetails record, or None if it is not a game or is discarded.
+  :raises RetriesExhausted: If the response body is not JSON (e.g. truncated), so the
+                            app is retried on a later run instead of being discarded.
   '''
   url = "https://store.steampowered.com/api/appdetails/"  # Use HTTPS
   params = {"appids": appID, "cc": currency, "l": language}
-  response = DoRequest(url, params, retryTime, successRequestCount, errorRequestCount, retries)
+  response = CachedRequest(url, params, retries)
   
   if not response:
       Log(config.ERROR, 'Bad response')
       return None
 
   try:
-      data = response.json()
-      app = data.get(str(appID), {})
-      
-      if not app.get('success'):
+      app_data = DecodeAppDetails(response.content, appID)
+      if app_data is None:
           return None
 
-      app_data = app.get('data', {})
-      
-      if (app_data.get('type') != 'game' or
-          (not app_data.get('is_free') and 
-           'price_overview' in app_data and 
-           app_data['price_overview'].get('final_formatted') == '') or
-          not app_data.get('developers')):
+      if (app_data.type != 'game' or
+          (not app_data.is_free and
+           app_data.price_overview is not None and
+           app_data.price_overview.final_formatted == '') or
+          not app_data.developers):
           return None
 
       return app_data
+  except msgspec.DecodeError as ex:
+      if _cache is not None:
+          _cache.delete(url, params)
+      raise RetriesExhausted(f'Undecodable appdetails response for {appID}: {ex}')
   except Exception as ex:
       Log(config.EXCEPTION, f'An exception occurred: {ex}. Traceback: {traceback.format_exc()}')
       return None
 
-def SteamSpyRequest(appID, retryTime, successRequestCount, errorRequestCount, retries):
+def PriceRequest(appIDs, currency=config.DEFAULT_CURRENCY, retries=config.DEFAULT_RETRIES):
+  '''
+  Request the current price of several Steam apps in a single call.
+
+  Only the price_overview filter accepts more than one appID per request.
+
+  :param appIDs: List of appIDs.
+  :param currency: Steam country code ('cc') the prices are requested for.
+  :return: Dict mapping appID to its price_overview. Free and unavailable apps are left out.
+  '''
+  url = "https://store.steampowered.com/api/appdetails/"
+  params = {"appids": ','.join(str(appID) for appID in appIDs), "cc": currency, "filters": "price_overview"}
+  response = DoRequest(url, params, retries)
+
+  if not response:
+      Log(config.ERROR, 'Bad response')
+      return {}
+
+  try:
+      prices = {}
+      for appID, app in (response.json() or {}).items():
+          data = app.get('data') if app.get('success') else None
+          # Apps without a price return an empty list instead of a dict
+          if isinstance(data, dict) and data.get('price_overview'):
+              prices[appID] = data['price_overview']
+      return prices
+  except Exception as ex:
+      Log(config.EXCEPTION, f'An exception occurred: {ex}. Traceback: {traceback.format_exc()}')
+      return {}
+
+def SteamSpyThrottled(response):
+    '''
+    SteamSpy answers 200 with a "Too many connections" body when it is overloaded.
+    '''
+    return "Too many connections" in response.text
+
+def SteamSpyRequest(appID, retries=config.DEFAULT_RETRIES):
     '''
     Request and parse information about a Steam app using SteamSpy, handling rate limiting and connection errors.
     '''
@@ -90,7 +258,7 @@ def SteamSpyRequest(appID, retryTime, successRequestCount, errorRequestCount, re
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36'
     }
     
-    response = DoRequest(url, params, retryTime, successRequestCount, errorRequestCount, retries, headers)
+    response = CachedRequest(url, params, retries, headers, throttled=SteamSpyThrottled)
     if not response:
         Log(config.ERROR, 'Bad response from SteamSpy API')
         return None
@@ -98,10 +266,6 @@ def SteamSpyRequest(appID, retryTime, successRequestCount, errorRequestCount, re
     try:
         response_text = response.text.strip()
 
-        if "Too many connections" in response_text:
-            Log(config.WARNING, f"Rate limit exceeded for appID {appID}. Retrying after a delay.")
-            return None
-
         if not response_text:
             Log(config.WARNING, f"Empty response for appID {appID}")
             return None
@@ -113,77 +277,122 @@ def SteamSpyRequest(appID, retryTime, successRequestCount, errorRequestCount, re
         Log(config.EXCEPTION, f'An exception occurred while parsing JSON for appID {appID}: {ex}')
         return None
 
-def ParseSteamGame(app):
+def SteamSpyPageRequest(page, retries=config.DEFAULT_RETRIES):
+    '''
+    Request one page (about 1000 apps) of SteamSpy's bulk listing.
+
+    :return: Dict mapping appID to SteamSpy data, empty once past the last page, or None on a bad response.
+    '''
+    url = "https://steamspy.com/api.php"
+    params = {"request": "all", "page": page}
+
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36'
+    }
+
+    response = CachedRequest(url, params, retries, headers, throttled=SteamSpyThrottled)
+    if not response:
+        Log(config.ERROR, 'Bad response from SteamSpy API')
+        return None
+
+    try:
+        if not response.text.strip():
+            return {}
+        data = response.json()
+        return data if isinstance(data, dict) else {}
+    except Exception as ex:
+        Log(config.EXCEPTION, f'An exception occurred while parsing JSON for SteamSpy page {page}: {ex}')
+        return None
+
+def ReleaseDate(app):
+  '''
+  Return the release date of an app as Steam formats it, or '' if it is coming soon.
+  '''
+  app = AsAppDetails(app)
+  return app.release_date.date if not app.release_date.coming_soon else ''
+
+def _packages(app):
+  packages = []
+  for package in app.package_groups:
+      subs = [
+          {
+              'text': SanitizeText(sub.option_text),
+              'description': sub.option_description,
+              'price': round(float(sub.price_in_cents_with_discount) * 0.01, 2)
+          }
+          for sub in package.subs
+      ]
+      packages.append({
+          'title': SanitizeText(package.title),
+          'description': SanitizeText(package.description),
+          'subs': subs
+      })
+  return packages
+
+# Fields produced by ParseSteamGame, in output order, with the function computing
+# each from an AppDetails record. The language fields are filled in together.
+STEAM_FIELDS = {
+    # Basic Info
+    'name': lambda app: app.name.strip(),
+    'release_date': ReleaseDate,
+    'required_age': lambda app: safe_int(app.required_age),
+
+    # Pricing and DLC
+    'price': lambda app: 0.0 if app.is_free or app.price_overview is None else PriceToFloat(app.price_overview.final_formatted),
+    'dlc_count': lambda app: len(app.dlc),
+
+    # Descriptions
+    'detailed_description': lambda app: SanitizeText(app.detailed_description.strip()),
+    'about_the_game': lambda app: SanitizeText(app.about_the_game.strip()),
+    'short_description': lambda app: SanitizeText(app.short_description.strip()),
+
+    # Technical Details
+    'windows': lambda app: app.platforms.windows,
+    'mac': lambda app: app.platforms.mac,
+    'linux': lambda app: app.platforms.linux,
+    'metacritic_score': lambda app: int(app.metacritic.score),
+    'achievements': lambda app: int(app.achievements.total),
+    'recommendations': lambda app: app.recommendations.total,
+    'notes': lambda app: SanitizeText(app.content_descriptors.notes),
+
+    # Languages
+    'supported_languages': None,
+    'full_audio_languages': None,
+
+    # Packages
+    'packages': _packages,
+
+    # Developers, Publishers, Categories, Genres
+    'developers': lambda app: [developer.strip() for developer in app.developers],
+    'publishers': lambda app: [publisher.strip() for publisher in app.publishers],
+    'categories': lambda app: [category.description for category in app.categories],
+    'genres': lambda app: [genre.description for genre in app.genres],
+}
+
+def ParseSteamGame(app, fields=None):
   '''
   Parse game info.
+
+  :param app: AppDetails record from SteamRequest, or the equivalent dict.
+  :param fields: Collection of the fields to produce, or None for all of STEAM_FIELDS.
+                 Other fields are neither computed nor sanitized.
   '''
+  app = AsAppDetails(app)
   game = {
-      # Basic Info
-      'name': app.get('name', '').strip(),
-      'release_date': app.get('release_date', {}).get('date', '') if not app.get('release_date', {}).get('coming_soon', False) else '',
-      'required_age': safe_int(app.get('required_age', 0)),
-
-      # Pricing and DLC
-      'price': 0.0 if app.get('is_free') else PriceToFloat(app.get('price_overview', {}).get('final_formatted', '')),
-      'dlc_count': len(app.get('dlc', [])),
-
-      # Descriptions
-      'detailed_description': app.get('detailed_description', '').strip(),
-      'about_the_game': app.get('about_the_game', '').strip(),
-      'short_description': app.get('short_description', '').strip(),
-
-      # Technical Details
-      'windows': app.get('platforms', {}).get('windows', False),
-      'mac': app.get('platforms', {}).get('mac', False),
-      'linux': app.get('platforms', {}).get('linux', False),
-      'metacritic_score': int(app.get('metacritic', {}).get('score', 0)),
-      'achievements': int(app.get('achievements', {}).get('total', 0)),
-      'recommendations': app.get('recommendations', {}).get('total', 0),
-      'notes': app.get('content_descriptors', {}).get('notes', ''),
-
-      # Languages
-      'supported_languages': [],
-      'full_audio_languages': [],
-
-      # Packages
-      'packages': [],
-
-      # Developers, Publishers, Categories, Genres
-      'developers': [developer.strip() for developer in app.get('developers', [])],
-      'publishers': [publisher.strip() for publisher in app.get('publishers', [])],
-      'categories': [category.get('description', '') for category in app.get('categories', [])],
-      'genres': [genre.get('description', '') for genre in app.get('genres', [])],
+      field: parse(app) if parse else []
+      for field, parse in STEAM_FIELDS.items()
+      if fields is None or field in fields
   }
 
   # Languages
-  if 'supported_languages' in app:
-      languagesApp = re.sub('<[^<]+?>', '', app['supported_languages'])
+  if app.supported_languages is not None and ('supported_languages' in game or 'full_audio_languages' in game):
+      languagesApp = HTML_TAG_RE.sub('', app.supported_languages)
       languagesApp = languagesApp.replace('languages with full audio support', '')
       for lang in languagesApp.split(', '):
           clean_lang = lang.replace('*', '')
-          game['supported_languages'].append(clean_lang)
+          game.get('supported_languages', []).append(clean_lang)
           if '*' in lang:
-              game['full_audio_languages'].append(clean_lang)
-
-  # Packages
-  for package in app.get('package_groups', []):
-      subs = [
-          {
-              'text': SanitizeText(sub['option_text']),
-              'description': sub.get('option_description', ''),
-              'price': round(float(sub.get('price_in_cents_with_discount', 0)) * 0.01, 2)
-          }
-          for sub in package.get('subs', [])
-      ]
-      game['packages'].append({
-          'title': SanitizeText(package.get('title', '')),
-          'description': SanitizeText(package.get('description', '')),
-          'subs': subs
-      })
-
-  # Sanitize descriptions
-  for key in ['detailed_description', 'about_the_game', 'short_description', 'notes']:
-      game[key] = SanitizeText(game[key])
+              game.get('full_audio_languages', []).append(clean_lang)
 
   return game
 
@@ -191,4 +400,24 @@ def safe_int(value, default=0):
     try:
         return int(str(value).replace('+', ''))
     except ValueError:
-        return default
\ No newline at end of file
+        return default
+
+QUARTER_RE = re.compile(r'Q([1-4])\s+(\d{4})')
+RELEASE_DATE_FORMATS = ['%d %b, %Y', '%b %d, %Y', '%d %B, %Y', '%B %d, %Y', '%B %Y', '%b %Y', '%Y']
+
+def ExpectedReleaseDate(app):
+    '''
+    Return the announced release date of an app that is coming soon, as a Unix
+    timestamp, or None if Steam gives no usable date ('Coming soon', 'To be
+    announced'). Quarters ('Q3 2026') map to the first day of the quarter.
+    '''
+    text = AsAppDetails(app).release_date.date.strip()
+    quarter = QUARTER_RE.fullmatch(text)
+    if quarter:
+        return dt.datetime(int(quarter.group(2)), 3 * int(quarter.group(1)) - 2, 1, tzinfo=dt.timezone.utc).timestamp()
+    for fmt in RELEASE_DATE_FORMATS:
+        try:
+            return dt.datetime.strptime(text, fmt).replace(tzinfo=dt.timezone.utc).timestamp()
+        except ValueError:
+            continue
+    return None
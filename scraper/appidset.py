@@ -0,0 +1,153 @@
+import struct
+import zlib
+from collections.abc import MutableSet
+
+MAGIC = b'AIDS'
+VERSION = 1
+HEADER = struct.Struct('<4sBI')  # Magic, format version, number of appIDs
+
+class AppIDSet(MutableSet):
+    '''
+    Set of Steam appIDs stored as a bitmap, one bit per possible appID.
+
+    AppIDs are accepted as ints or numeric strings and are yielded as strings,
+    like the appIDs in the JSON files. Union, difference and intersection with
+    another AppIDSet are computed on the whole bitmap at once.
+
+    The binary format (see to_bytes) is a header with a magic number, a format
+    version and the number of appIDs, followed by the zlib-compressed bitmap.
+
+    :param ids: Iterable of appIDs to start with.
+    '''
+    def __init__(self, ids=()):
+        self.bits = bytearray()
+        self.count = 0
+        self.update(ids)
+
+    @staticmethod
+    def _index(appID):
+        index = int(appID)
+        if index < 0:
+            raise ValueError(f'Invalid appID {appID!r}')
+        return index
+
+    @classmethod
+    def _from_int(cls, value):
+        result = cls()
+        result.bits = bytearray(value.to_bytes((value.bit_length() + 7) // 8, 'little'))
+        result.count = bin(value).count('1')  # int.bit_count needs Python 3.10
+        return result
+
+    @classmethod
+    def _from_iterable(cls, ids):
+        return cls(ids)
+
+    def _to_int(self):
+        return int.from_bytes(self.bits, 'little')
+
+    def __contains__(self, appID):
+        try:
+            index = self._index(appID)
+        except (TypeError, ValueError):
+            return False
+        byte = index >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (index & 7)))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for byte, value in enumerate(self.bits):
+            if value:
+                for bit in range(8):
+                    if value & (1 << bit):
+                        yield str(byte * 8 + bit)
+
+    def __repr__(self):
+        return f'AppIDSet({len(self)} appIDs)'
+
+    def add(self, appID):
+        index = self._index(appID)
+        byte, mask = index >> 3, 1 << (index & 7)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        if not self.bits[byte] & mask:
+            self.bits[byte] |= mask
+            self.count += 1
+
+    def discard(self, appID):
+        if appID in self:
+            index = self._index(appID)
+            self.bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+            self.count -= 1
+
+    def update(self, ids):
+        if isinstance(ids, AppIDSet):
+            self |= ids
+        else:
+            for appID in ids:
+                self.add(appID)
+
+    def copy(self):
+        return self._from_int(self._to_int())
+
+    def __or__(self, other):
+        if isinstance(other, AppIDSet):
+            return self._from_int(self._to_int() | other._to_int())
+        return super().__or__(other)
+
+    def __and__(self, other):
+        if isinstance(other, AppIDSet):
+            return self._from_int(self._to_int() & other._to_int())
+        return super().__and__(other)
+
+    def __sub__(self, other):
+        if isinstance(other, AppIDSet):
+            return self._from_int(self._to_int() & ~other._to_int())
+        return super().__sub__(other)
+
+    def __ior__(self, other):
+        if isinstance(other, AppIDSet):
+            result = self | other
+            self.bits, self.count = result.bits, result.count
+            return self
+        return super().__ior__(other)
+
+    def __iand__(self, other):
+        if isinstance(other, AppIDSet):
+            result = self & other
+            self.bits, self.count = result.bits, result.count
+            return self
+        return super().__iand__(other)
+
+    def __isub__(self, other):
+        if isinstance(other, AppIDSet):
+            result = self - other
+            self.bits, self.count = result.bits, result.count
+            return self
+        return super().__isub__(other)
+
+    def to_bytes(self):
+        '''
+        Serialize the set in the versioned binary format.
+        '''
+        return HEADER.pack(MAGIC, VERSION, self.count) + zlib.compress(bytes(self.bits))
+
+    @classmethod
+    def from_bytes(cls, data):
+        '''
+        Load a set serialized by to_bytes.
+
+        :raises ValueError: If the data is not an AppIDSet or has an unknown version.
+        '''
+        if len(data) < HEADER.size:
+            raise ValueError('Truncated AppIDSet data')
+        magic, version, count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('Not AppIDSet data')
+        if version != VERSION:
+            raise ValueError(f'Unsupported AppIDSet version {version}')
+        result = cls()
+        result.bits = bytearray(zlib.decompress(data[HEADER.size:]))
+        result.count = count
+        return result
@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import config
+from utils import Log
+
+class ResponseCache:
+    '''
+    On-disk cache of raw API responses.
+
+    Each response body is stored gzip-compressed in a file named after the SHA-256 of
+    its endpoint and sorted parameters, so the same request always maps to the same
+    file. Entries older than `ttl` seconds are ignored (unless the caller asks for
+    them anyway, as replay mode does), and the least recently used entries are
+    evicted once the cache grows past `max_bytes`.
+
+    :param directory: Directory the cache files are stored in.
+    :param ttl: Maximum age of an entry in seconds, or None for no limit.
+    :param max_bytes: Maximum total size of the cache files, or None for no limit.
+    '''
+    def __init__(self, directory=config.CACHE_DIR, ttl=config.CACHE_TTL, max_bytes=config.CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self._files())
+
+    @staticmethod
+    def key(url, params=None):
+        '''
+        Return the cache key of a request: a hash of the endpoint and its parameters.
+        '''
+        request = json.dumps([url, sorted((str(k), str(v)) for k, v in (params or {}).items())])
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.gz')
+
+    def _files(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.gz'):
+                    yield os.path.join(root, name)
+
+    def get(self, url, params=None, ignore_ttl=False):
+        '''
+        Return the cached response body of a request, or None if it is missing or expired.
+        '''
+        path = self.path(self.key(url, params))
+        try:
+            if not ignore_ttl and self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with gzip.open(path, 'rb') as f:
+                content = f.read()
+            os.utime(path, (time.time(), os.path.getmtime(path)))  # Record the access for LRU eviction
+            return content
+        except (FileNotFoundError, OSError, EOFError):
+            return None
+
+    def put(self, url, params, content):
+        '''
+        Store the response body of a request, replacing any previous entry.
+        '''
+        path = self.path(self.key(url, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(gzip.compress(content))
+        with self.lock:
+            try:
+                self.size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp, path)
+            self.size += os.path.getsize(path)
+            if self.max_bytes is not None and self.size > self.max_bytes:
+                self._evict()
+
+    def delete(self, url, params=None):
+        '''
+        Remove the cached response of a request, e.g. a body that turned out to be unusable.
+        '''
+        path = self.path(self.key(url, params))
+        with self.lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                pass
+
+    def _evict(self):
+        '''
+        Remove the least recently used entries until the cache is below 90% of max_bytes.
+        Must be called with the lock held.
+        '''
+        entries = sorted((os.stat(path).st_atime, path) for path in self._files())
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, path in entries:
+            if self.size <= target:
+                break
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.size -= size
+            removed += 1
+        Log(config.INFO, f'Evicted {removed} entries from the response cache ({self.size} bytes left)')
+
+class CachedResponse:
+    '''
+    Stand-in for a requests.Response built from a cached body.
+    '''
+    status_code = 200
+    reason = 'OK'
+
+    def __init__(self, content):
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def __bool__(self):
+        return True
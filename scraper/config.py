@@ -5,6 +5,13 @@ APPLIST_FILE = 'applist.json'
 DISCARDED_FILE = 'discarded.json'
 NOTRELEASED_FILE = 'notreleased.json'
 METADATA_FILE = 'metadata_index.json'
+STATE_FILE = 'app_state.json'
+MANIFEST_FILE = 'manifest.json'
+SHARDS_PREFIX = 'shards/'
+STEAMSPY_CACHE_FILE = 'steamspy_cache.json'
+STEAMSPY_PREFETCH_FILE = 'steamspy_prefetch.json'
+PRICES_PREFIX = 'prices/'
+APPID_SET_EXTENSION = '.bin'  # The appID lists above are saved as binary AppIDSets with this extension
 
 # Default settings
 DEFAULT_SLEEP = 1.5
@@ -12,6 +19,87 @@ DEFAULT_RETRIES = 4
 DEFAULT_TIMEOUT = 10
 DEFAULT_CURRENCY = 'us'
 DEFAULT_LANGUAGE = 'en'
+DEFAULT_CONCURRENCY = 8
+PARSE_WORKERS = None    # Processes parsing and sanitizing responses (None for one per CPU, 0 to parse on a thread)
+
+# Chunk buffering and background upload
+CHUNK_MAX_BYTES = 16 * 1024 ** 2  # A chunk is uploaded once its serialized records reach this size
+UPLOAD_QUEUE_SIZE = 2             # Chunks waiting for upload before the scrape is held back
+UPLOAD_RETRIES = 3                # Retries of a failed chunk or journal segment upload
+UPLOAD_BACKOFF = 2                # Seconds before the first upload retry, doubled for each further one
+
+# Progress journal
+JOURNAL_PREFIX = 'journal/'  # Segments of per-app outcomes, folded into the index files at the end of a scrape
+JOURNAL_SEGMENT_SIZE = 500   # Entries per journal segment
+
+# Output schema: the fields written for each game (see schema.py)
+OUTPUT_FIELDS = 'all'  # 'all', a preset below, or a comma-separated list of fields and presets
+FIELD_PRESETS = {
+    # The fields read by transformer/polars_transformer.py: no descriptions, notes, packages or tags
+    'analytics': [
+        'name', 'release_date', 'required_age', 'price', 'dlc_count', 'windows', 'mac', 'linux',
+        'metacritic_score', 'achievements', 'recommendations', 'supported_languages', 'full_audio_languages',
+        'developers', 'publishers', 'categories', 'genres',
+        'user_score', 'score_rank', 'positive', 'negative', 'estimated_owners',
+        'average_playtime_forever', 'average_playtime_2weeks', 'median_playtime_forever', 'median_playtime_2weeks', 'peak_ccu',
+    ],
+}
+
+# Merging chunks into the output file
+MERGE_WORKERS = 4                       # Chunks downloaded in parallel (and held in memory)
+MULTIPART_PART_SIZE = 8 * 1024 ** 2     # Size of the parts streamed to S3 (at least 5 MB)
+
+# Time-budgeted runs (--time-budget, e.g. one AWS Lambda invocation)
+TIME_BUDGET_RESERVE = 30  # Seconds kept at the end of the budget for the apps in flight and the checkpoint
+SETUP_BUDGET_SHARE = 0.5  # Fraction of the budget the change-time listing and SteamSpy prefetch may use
+
+# Incremental refresh
+REFRESH_MAX_AGE_DAYS = 30  # Scraped apps older than this are fetched again by --refresh
+APP_LIST_PAGE_SIZE = 50000
+
+# Scrape scheduling (see scheduler.py)
+PRIORITY_NEW = 100.0        # Priority of apps never scraped; refreshes and re-polls rank below it
+RELEASE_WINDOW_DAYS = 7     # Not released apps are polled from this many days before their announced date
+NOTRELEASED_POLL_DAYS = 30  # Not released apps without an announced date are polled again after this many days
+
+# Price refresh
+PRICE_CURRENCIES = ['us', 'gb', 'de', 'jp', 'br']  # Steam country codes ('cc') prices are refreshed for
+PRICE_BATCH_SIZE = 100                             # AppIDs per price_overview request
+
+# On-disk response cache
+CACHE_DIR = 'cache'
+CACHE_TTL = 7 * 24 * 3600       # Seconds before a cached response is fetched again
+CACHE_MAX_BYTES = 5 * 1024 ** 3  # Least recently used responses are evicted beyond this size
+
+# SteamSpy bulk listing ('request=all')
+STEAMSPY_PAGE_SLEEP = 60          # SteamSpy allows one 'all' request per minute
+STEAMSPY_CACHE_TTL = 24 * 3600    # Seconds before the bulk cache is fetched again
+STEAMSPY_MAX_PAGES = 1000         # Safety stop for the page loop
+
+# Per-host rate limits as (requests per second, burst size). Other hosts are not limited.
+RATE_LIMITS = {
+    'store.steampowered.com': (0.66, 4),  # appdetails allows ~200 requests per 5 minutes
+    'steamspy.com': (1.0, 1),             # SteamSpy allows 1 request per second
+}
+
+# Adaptive (AIMD) tuning of the per-host request rate
+RATE_INCREASE = 0.01   # Requests per second added after each success
+RATE_DECREASE = 0.5    # Factor applied to the rate after a failure
+MAX_RATE_FACTOR = 2.0  # The learned rate never exceeds this multiple of the configured rate
+MIN_RATE = 0.05
+DEFAULT_BACKOFF = 5    # Seconds before the first retry of a request, doubled for each further attempt
+MAX_BACKOFF = 500
+
+# Per-host circuit breaker and retry budget
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failures before a host is paused
+CIRCUIT_COOLDOWN = 60          # Seconds a host is paused when its circuit opens (doubles while it keeps failing)
+CIRCUIT_PROBE_WAIT = 1         # Seconds other requests wait while a half-open probe is in flight
+RETRY_BUDGET = 0.1             # Warn when retries exceed this fraction of a host's requests
+
+# Metrics (see metrics.py)
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108           # Port of the Prometheus endpoint (0 to disable)
+METRICS_FILE = 'metrics.prom'  # File the metrics are written to when the scraper exits ('' to disable)
 
 # Logging settings
 LOG_ICON = ['i', 'W', 'E', '!']
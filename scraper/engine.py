@@ -0,0 +1,184 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+_DONE = object()  # Marks the end of the apps to scrape
+
+async def ScrapeAsync(apps, process, on_result, concurrency):
+    '''
+    Process appIDs concurrently, keeping up to `concurrency` apps in flight.
+
+    `process` is a blocking function (it makes its requests with the `requests`
+    library) and runs on a thread pool; pacing is done by the per-host token
+    buckets in DoRequest, so the Steam and SteamSpy requests of different apps
+    overlap. `on_result` is always called from the event loop thread, so it can
+    update shared state without locking. If it returns False, no new apps are
+    started and the apps already in flight are allowed to finish.
+
+    :param apps: Iterable of appIDs to process.
+    :param process: Blocking function called as process(appID).
+    :param on_result: Function called as on_result(appID, result).
+    :param concurrency: Maximum number of apps processed at the same time.
+    '''
+    loop = asyncio.get_running_loop()
+    pending = iter(apps)
+    stopped = False
+
+    async def worker(executor):
+        nonlocal stopped
+        # Check before taking the next app, so an app popped from a Schedule
+        # is never dropped
+        while not stopped:
+            appID = next(pending, _DONE)
+            if appID is _DONE:
+                break
+            result = await loop.run_in_executor(executor, process, appID)
+            if on_result(appID, result) is False:
+                stopped = True
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        await asyncio.gather(*(worker(executor) for _ in range(max(1, concurrency))))
+
+def RunScrape(apps, process, on_result, concurrency):
+    '''
+    Blocking entry point for ScrapeAsync.
+    '''
+    asyncio.run(ScrapeAsync(apps, process, on_result, concurrency))
+
+class StageStats:
+    '''
+    Counters of one pipeline stage: items done, time its workers were busy and the
+    depth of the queue feeding it.
+    '''
+    def __init__(self, workers, queue=None):
+        self.workers = workers
+        self.queue = queue
+        self.items = 0
+        self.busy = 0.0
+        self.active = 0
+        self.start_time = time.monotonic()
+
+    def snapshot(self):
+        '''
+        Return the stage's counters. Utilization is the fraction of the workers'
+        time spent working since the stage started.
+        '''
+        elapsed = max(time.monotonic() - self.start_time, 1e-9)
+        return {
+            'workers': self.workers,
+            'active': self.active,
+            'items': self.items,
+            'queue': self.queue.qsize() if self.queue is not None else 0,
+            'utilization': min(1.0, self.busy / (elapsed * self.workers)),
+        }
+
+class Pipeline:
+    '''
+    Staged scrape: fetch workers, a parse stage and a single writer, connected by
+    bounded queues so a slow stage holds the ones before it back.
+
+    `fetch(appID)` is blocking I/O and runs on a thread pool of `fetch_workers`.
+    It returns (result, work): if `work` is None, `result` goes straight to the
+    writer; otherwise the writer gets `parse(work)`, which runs on a process pool
+    of `parse_workers` (on a thread if 0), so parsing uses other cores while the
+    next apps are fetched. `parse` and `work` must be picklable. `on_result(appID,
+    result)` runs on a single writer thread, so it can update shared state
+    without locking; if it returns False, no new apps are fetched and the apps
+    already in the pipeline are allowed to finish.
+
+    :param queue_size: Capacity of each queue between two stages.
+    '''
+    def __init__(self, fetch, parse, on_result, fetch_workers, parse_workers=None, queue_size=None):
+        self.fetch = fetch
+        self.parse = parse
+        self.on_result = on_result
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = (os.cpu_count() or 1) if parse_workers is None else parse_workers
+        self.queue_size = queue_size or 2 * self.fetch_workers
+        self.stages = {}
+        self.stopped = False
+
+    def stats(self):
+        '''
+        Return the counters of every stage by name ('fetch', 'parse', 'write'). Safe
+        to call from any thread while the pipeline runs.
+        '''
+        return {name: stage.snapshot() for name, stage in list(self.stages.items())}
+
+    async def run_async(self, apps):
+        loop = asyncio.get_running_loop()
+        pending = iter(apps)
+        parse_queue, write_queue = asyncio.Queue(self.queue_size), asyncio.Queue(self.queue_size)
+        parsers = max(1, self.parse_workers)
+        self.stages = {
+            'fetch': StageStats(self.fetch_workers),
+            'parse': StageStats(parsers, parse_queue),
+            'write': StageStats(1, write_queue),
+        }
+        live = {'fetch': self.fetch_workers, 'parse': parsers}
+
+        async def timed(stage, executor, function, *args):
+            stats = self.stages[stage]
+            stats.active += 1
+            start = time.monotonic()
+            try:
+                return await loop.run_in_executor(executor, function, *args)
+            finally:
+                stats.busy += time.monotonic() - start
+                stats.items += 1
+                stats.active -= 1
+
+        async def fetcher(executor):
+            while not self.stopped:
+                appID = next(pending, _DONE)
+                if appID is _DONE:
+                    break
+                result, work = await timed('fetch', executor, self.fetch, appID)
+                await parse_queue.put((appID, result, work))
+            live['fetch'] -= 1
+            if not live['fetch']:
+                for _ in range(parsers):
+                    await parse_queue.put(None)
+
+        async def parser(executor):
+            while (item := await parse_queue.get()) is not None:
+                appID, result, work = item
+                if work is not None:
+                    result = await timed('parse', executor, self.parse, work)
+                await write_queue.put((appID, result))
+            live['parse'] -= 1
+            if not live['parse']:
+                await write_queue.put(None)
+
+        async def writer(executor):
+            while (item := await write_queue.get()) is not None:
+                if await timed('write', executor, self.on_result, *item) is False:
+                    self.stopped = True
+
+        if self.parse_workers:
+            parse_executor = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            parse_executor = ThreadPoolExecutor(max_workers=1)
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as fetch_executor, parse_executor, \
+             ThreadPoolExecutor(max_workers=1) as write_executor:
+            tasks = [asyncio.create_task(fetcher(fetch_executor)) for _ in range(self.fetch_workers)]
+            tasks += [asyncio.create_task(parser(parse_executor)) for _ in range(parsers)]
+            tasks.append(asyncio.create_task(writer(write_executor)))
+            try:
+                # Stop every stage as soon as one fails, rather than leaving the
+                # others blocked on a queue that is no longer drained
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    task.result()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self, apps):
+        '''
+        Run every app through the pipeline, blocking until all are written.
+        '''
+        asyncio.run(self.run_async(apps))
@@ -0,0 +1,127 @@
+import time
+import datetime as dt
+import config
+from api import SteamSpyPageRequest
+from utils import load_from_s3, save_to_s3, delete_from_s3, Log
+
+# SteamSpy fields kept in the cache, as (SteamSpy field, game field, default)
+STEAMSPY_FIELDS = [
+    ('userscore', 'user_score', 0),
+    ('score_rank', 'score_rank', ""),
+    ('positive', 'positive', 0),
+    ('negative', 'negative', 0),
+    ('owners', 'estimated_owners', "0 - 0"),
+    ('average_forever', 'average_playtime_forever', 0),
+    ('average_2weeks', 'average_playtime_2weeks', 0),
+    ('median_forever', 'median_playtime_forever', 0),
+    ('median_2weeks', 'median_playtime_2weeks', 0),
+    ('ccu', 'peak_ccu', 0),
+]
+
+def apply_steamspy(game, extra, fields=None):
+    '''
+    Add SteamSpy data to a parsed game, using defaults when there is none.
+
+    :param game: The game dict produced by ParseSteamGame.
+    :param extra: SteamSpy data for the app (per-app or bulk format), or None.
+    :param fields: Collection of the game fields to produce, or None for all.
+    :return: The updated game.
+    '''
+    extra = extra or {}
+    for source, target, default in STEAMSPY_FIELDS:
+        if fields is None or target in fields:
+            game[target] = extra.get(source, default)
+    if 'estimated_owners' in game:
+        game['estimated_owners'] = game['estimated_owners'].replace(',', '').replace('..', '-')
+    if fields is None or 'tags' in fields:
+        game['tags'] = extra.get('tags', [])
+    return game
+
+def PrefetchSteamSpy(retries=config.DEFAULT_RETRIES, sleep=None, progress=None, deadline=None, on_page=None):
+    '''
+    Download SteamSpy's paged bulk listing into a dict keyed by appID.
+
+    Only the fields used by apply_steamspy are kept. Apps without a developer are
+    left out, as SteamSpyRequest does for single apps.
+
+    :param retries: Number of retries per page.
+    :param sleep: Seconds to wait between pages (config.STEAMSPY_PAGE_SLEEP by default).
+    :param progress: {'page': next page, 'apps': apps read so far} of an earlier
+                     prefetch to resume, or None to start from the first page.
+    :param deadline: time.monotonic() value by which to stop, leaving the rest of
+                     the listing to a later prefetch. None for no limit.
+    :param on_page: Function called as on_page(progress) after every page read,
+                    e.g. to save it.
+    :return: Dict mapping appID (str) to SteamSpy data, or None if a page could
+        not be read or the deadline came first, since the listing would be
+        incomplete.
+    '''
+    sleep = config.STEAMSPY_PAGE_SLEEP if sleep is None else sleep
+    first = progress['page'] if progress else 0
+    apps = dict(progress['apps']) if progress else {}
+    for page in range(first, config.STEAMSPY_MAX_PAGES):
+        if page:
+            if deadline is not None and time.monotonic() + sleep > deadline:
+                Log(config.INFO, f'No time left for SteamSpy page {page}, resuming the prefetch on a later run')
+                return None
+            time.sleep(sleep)
+        data = SteamSpyPageRequest(page, retries)
+        if data is None:
+            Log(config.WARNING, f'SteamSpy page {page} could not be read, abandoning the prefetch')
+            return None
+        if not data:
+            break
+        for appID, extra in data.items():
+            if extra.get('developer'):
+                apps[str(appID)] = {source: extra[source] for source, _, _ in STEAMSPY_FIELDS if source in extra}
+        Log(config.INFO, f'SteamSpy page {page}: {len(data)} apps, {len(apps)} cached so far')
+        if on_page:
+            on_page({'page': page + 1, 'apps': apps})
+    return apps
+
+def load_steamspy_cache(bucket_name, retries=config.DEFAULT_RETRIES, ttl=config.STEAMSPY_CACHE_TTL, fetch=True, deadline=None):
+    '''
+    Return the SteamSpy bulk cache, reusing the copy in S3 while it is younger than
+    `ttl` seconds and prefetching (and saving) a new one otherwise.
+
+    The prefetch saves its progress to config.STEAMSPY_PREFETCH_FILE after every
+    page, so a prefetch cut short by `deadline` or by a failed page is resumed by
+    the next call instead of starting over.
+
+    :param fetch: If False, never prefetch; return an empty cache instead.
+    :param deadline: time.monotonic() value by which the prefetch must stop.
+    :return: Dict mapping appID (str) to SteamSpy data. If the prefetch did not
+        complete, the expired copy if there is one, else None: apps then get
+        per-app SteamSpy requests.
+    '''
+    cache, expired = load_from_s3(bucket_name, config.STEAMSPY_CACHE_FILE), None
+    if cache:
+        age = (dt.datetime.now() - dt.datetime.fromisoformat(cache['fetched_at'])).total_seconds()
+        if age < ttl:
+            Log(config.INFO, f'SteamSpy cache with {len(cache["apps"])} apps loaded from S3')
+            return cache['apps']
+        expired = cache['apps']
+    if not fetch:
+        return {}
+
+    progress = load_from_s3(bucket_name, config.STEAMSPY_PREFETCH_FILE)
+    if progress and (dt.datetime.now() - dt.datetime.fromisoformat(progress['started_at'])).total_seconds() >= ttl:
+        progress = None  # Too old to be completed into a fresh listing
+    started_at = progress['started_at'] if progress else dt.datetime.now().isoformat()
+    if progress:
+        Log(config.INFO, f'Resuming the SteamSpy prefetch from page {progress["page"]}')
+    else:
+        Log(config.INFO, 'Prefetching SteamSpy bulk listing')
+
+    def save_progress(page_progress):
+        save_to_s3(bucket_name, config.STEAMSPY_PREFETCH_FILE, {'started_at': started_at, **page_progress})
+
+    apps = PrefetchSteamSpy(retries, progress=progress, deadline=deadline, on_page=save_progress)
+    if apps is None:
+        if expired:
+            Log(config.INFO, f'Using the expired SteamSpy cache with {len(expired)} apps until the prefetch completes')
+        return expired
+    if apps:
+        if save_to_s3(bucket_name, config.STEAMSPY_CACHE_FILE, {'fetched_at': started_at, 'apps': apps}):
+            delete_from_s3(bucket_name, [config.STEAMSPY_PREFETCH_FILE])
+    return apps
@@ -0,0 +1,160 @@
+import json
+import config
+from utils import (Log, load_from_s3, save_to_s3, load_bytes_from_s3, list_s3_keys, delete_from_s3,
+                   load_metadata_index, save_metadata_index, load_app_ids, save_app_ids,
+                   load_app_state, save_app_state)
+
+# Journal entry statuses
+ADDED, NOT_RELEASED, DISCARDED, STATE = 'added', 'not_released', 'discarded', 'state'
+
+def segment_key(prefix, number):
+    return f'{prefix}{config.JOURNAL_PREFIX}segment_{number:06d}.ndjson'
+
+def segment_number(key):
+    return int(key.rsplit('_', 1)[1].split('.')[0])
+
+class Journal:
+    '''
+    Append-only log of per-app scrape outcomes, written to S3 in small NDJSON
+    segments under `{prefix}journal/`.
+
+    Each entry records one app: 'added' (with the chunk holding its record),
+    'not_released', 'discarded', or 'state' for a scrape that only moved the
+    app's state forward. Segments are uploaded through the ChunkUploader queue,
+    so a segment is never saved before the chunks it refers to. Replaying the
+    journal on top of the index files restores the progress of an interrupted
+    scrape, and compact() folds it into the index files.
+
+    :param uploader: The ChunkUploader the segments are queued on.
+    :param prefix: Key prefix, e.g. a shard's namespace.
+    :param segments: Keys of the segments already in S3 that are not compacted yet.
+    :param segment_size: Number of entries per segment.
+    '''
+    def __init__(self, uploader, prefix='', segments=(), segment_size=config.JOURNAL_SEGMENT_SIZE):
+        self.uploader = uploader
+        self.prefix = prefix
+        self.segments = list(segments)
+        self.segment_size = segment_size
+        self.entries = []
+
+    def record(self, appID, status, chunk=None, state=None):
+        '''
+        Add an entry, and queue a segment once `segment_size` entries are buffered.
+        '''
+        entry = {'app': appID, 'status': status}
+        if chunk is not None:
+            entry['chunk'] = chunk
+        if state is not None:
+            entry['state'] = dict(state)
+        self.entries.append(entry)
+        if len(self.entries) >= self.segment_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Queue the buffered entries for upload as a new segment.
+        '''
+        if not self.entries:
+            return
+        number = segment_number(self.segments[-1]) + 1 if self.segments else 1
+        key = segment_key(self.prefix, number)
+        data = b''.join(json.dumps(entry, separators=(',', ':')).encode('utf-8') + b'\n' for entry in self.entries)
+        self.uploader.save_bytes(key, data)
+        self.segments.append(key)
+        self.entries = []
+
+    def compact(self, bucket_name, metadata, discarded, notreleased, state, manifest):
+        '''
+        Save the index files, which already include every journal entry, and
+        delete the segments. The journal must have been flushed and its uploads
+        waited for. A crash in between, or an index file that could not be
+        saved, leaves the segments in place, and replaying them again is harmless.
+
+        :return: True if the journal was compacted.
+        '''
+        if not save_snapshot(bucket_name, self.prefix, metadata, discarded, notreleased, state, manifest):
+            Log(config.WARNING, f'Keeping {len(self.segments)} journal segment(s), the index files could not be saved')
+            return False
+        if self.segments:
+            delete_from_s3(bucket_name, self.segments)
+            Log(config.INFO, f'Compacted {len(self.segments)} journal segment(s)')
+        self.segments = []
+        return True
+
+def load_journal(bucket_name, prefix=''):
+    '''
+    Load the journal segments under a prefix.
+
+    :return: The tuple (entries in journal order, segment keys).
+    '''
+    keys = [key for key in list_s3_keys(bucket_name, prefix + config.JOURNAL_PREFIX) if key.endswith('.ndjson')]
+    keys.sort(key=segment_number)
+    entries = []
+    for key in keys:
+        for line in (load_bytes_from_s3(bucket_name, key) or b'').splitlines():
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                Log(config.WARNING, f'Skipping a malformed entry in journal segment {key}')
+    return entries, keys
+
+def replay_journal(entries, metadata, discarded, notreleased, state, manifest):
+    '''
+    Apply journal entries, in order, to the loaded indexes and manifest. Replaying
+    an entry twice has no further effect.
+    '''
+    chunks = set(manifest['chunks'])
+    for entry in entries:
+        appID, status = entry['app'], entry['status']
+        if 'state' in entry:
+            state[appID] = entry['state']
+        if status == ADDED:
+            metadata.add(appID)
+            notreleased.discard(appID)
+            chunk_key = entry.get('chunk')
+            if chunk_key and chunk_key not in chunks:
+                manifest['chunks'].append(chunk_key)
+                chunks.add(chunk_key)
+        elif status == NOT_RELEASED:
+            notreleased.add(appID)
+        elif status == DISCARDED:
+            discarded.add(appID)
+
+def save_snapshot(bucket_name, prefix, metadata, discarded, notreleased, state, manifest):
+    '''
+    Save the index files and the manifest under a prefix.
+
+    :return: True if every file was saved.
+    '''
+    saved = [
+        save_app_ids(bucket_name, prefix + config.DISCARDED_FILE, discarded),
+        save_app_ids(bucket_name, prefix + config.NOTRELEASED_FILE, notreleased),
+        save_metadata_index(bucket_name, metadata, prefix),
+        save_app_state(bucket_name, state, prefix),
+        save_to_s3(bucket_name, prefix + config.MANIFEST_FILE, manifest),
+    ]
+    return all(saved)
+
+def compact_journal(bucket_name, prefix=''):
+    '''
+    Fold the journal under a prefix into its index files, e.g. after a scrape
+    that did not finish.
+
+    :return: The number of journal entries folded in, 0 if the index files
+        could not be saved (the segments are kept).
+    '''
+    entries, segments = load_journal(bucket_name, prefix)
+    if not segments:
+        return 0
+    metadata = load_metadata_index(bucket_name, prefix)
+    discarded = load_app_ids(bucket_name, prefix + config.DISCARDED_FILE)
+    notreleased = load_app_ids(bucket_name, prefix + config.NOTRELEASED_FILE)
+    state = load_app_state(bucket_name, prefix)
+    manifest = load_from_s3(bucket_name, prefix + config.MANIFEST_FILE) or {'chunks': []}
+    replay_journal(entries, metadata, discarded, notreleased, state, manifest)
+    if not save_snapshot(bucket_name, prefix, metadata, discarded, notreleased, state, manifest):
+        Log(config.WARNING, f'Keeping {len(segments)} journal segment(s) under {prefix or "/"}, the index files could not be saved')
+        return 0
+    delete_from_s3(bucket_name, segments)
+    Log(config.INFO, f'Compacted {len(entries)} journal entries from {len(segments)} segment(s) under {prefix or "/"}')
+    return len(entries)
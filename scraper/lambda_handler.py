@@ -0,0 +1,37 @@
+import os
+import tempfile
+import config
+from steam_scraper import Scraper, build_parser, configure
+from utils import Log, load_app_ids
+
+def handler(event, context):
+    '''
+    AWS Lambda entry point: run one time-budgeted scrape and return its summary.
+
+    The event may hold the scraper's command line arguments as a list under
+    'args', e.g. {"args": ["--bucket", "my-bucket", "--concurrency", "16"]}.
+    Unless --time-budget is given, the budget is the time left in the
+    invocation, so the scrape stops early, checkpoints and returns before Lambda
+    kills it; the next invocation resumes from the checkpoint. Parsing runs on a
+    thread unless --parse-workers is given, as Lambda has no /dev/shm for a
+    process pool.
+
+    :return: The summary returned by Scraper(), e.g. {'finished': 812,
+        'remaining': 10400, 'complete': False, ...}.
+    '''
+    argv = list((event or {}).get('args', []))
+    if '--parse-workers' not in argv:
+        argv += ['--parse-workers', '0']
+    args = build_parser().parse_args(argv)
+    if args.time_budget is None and context is not None:
+        args.time_budget = context.get_remaining_time_in_millis() / 1000
+
+    # The deployment package is read-only, local files (response cache) go to /tmp
+    os.chdir(tempfile.gettempdir())
+    configure(args)
+
+    notreleased = load_app_ids(args.bucket, config.NOTRELEASED_FILE)
+    discarded = load_app_ids(args.bucket, config.DISCARDED_FILE)
+    summary = Scraper(None, notreleased, discarded, args)
+    Log(config.INFO, f'Invocation finished {summary["finished"]} apps, {summary["remaining"]} remaining')
+    return summary
@@ -0,0 +1,298 @@
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+from utils import Log
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    '''
+    A named family of samples, one per combination of label values. Updates are
+    thread-safe.
+
+    :param name: Metric name, e.g. 'scraper_requests_total'.
+    :param help: One-line description.
+    :param labels: Names of the labels every sample carries.
+    '''
+    type = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        '''
+        Yield (suffix, label names, label values, value) for every sample.
+        '''
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield '', self.labels, key, value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for suffix, names, values, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_labels(names, values)} {_number(value)}')
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    '''
+    A value that only goes up.
+    '''
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+class Gauge(Metric):
+    '''
+    A value that goes up and down. A gauge can also be computed when it is read,
+    from a function set with set_function.
+    '''
+    type = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.functions = {}
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        '''
+        Compute the sample from function() whenever the metric is read; None
+        removes it.
+        '''
+        with self.lock:
+            if function is None:
+                self.functions.pop(self._key(labels), None)
+            else:
+                self.functions[self._key(labels)] = function
+
+    def get(self, **labels):
+        key = self._key(labels)
+        function = self.functions.get(key)
+        return function() if function else self.values.get(key, 0)
+
+    def samples(self):
+        yield from super().samples()
+        with self.lock:
+            functions = list(self.functions.items())
+        for key, function in functions:
+            try:
+                value = function()
+            except Exception:
+                continue
+            if value is not None:
+                yield '', self.labels, key, value
+
+class Histogram(Metric):
+    '''
+    Counts observations in cumulative buckets, with their count and sum.
+
+    :param buckets: Increasing upper bounds of the buckets; +Inf is added.
+    '''
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self.values.get(self._key(labels), ((), 0.0))
+        return sum(counts)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self.values.items()]
+        names = self.labels + ('le',)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield '_bucket', names, key + (_number(bound),), cumulative
+            yield '_count', self.labels, key, cumulative
+            yield '_sum', self.labels, key, total
+
+class Registry:
+    '''
+    The metrics of a process, rendered together in the Prometheus text format.
+    '''
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels=(), **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labels, **kwargs)
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+REGISTRY = Registry()
+
+# Requests (DoRequest)
+REQUEST_SECONDS = REGISTRY.histogram('scraper_request_seconds', 'Latency of API requests by host and HTTP status (or "error")', ('host', 'status'))
+RESPONSE_BYTES = REGISTRY.counter('scraper_response_bytes_total', 'Bytes of response bodies downloaded', ('host',))
+RETRIES = REGISTRY.counter('scraper_retries_total', 'Requests that failed and were retried or given up', ('host',))
+RATE_LIMITED = REGISTRY.counter('scraper_rate_limited_total', 'Responses that were rate limited (429, 503 or throttled)', ('host',))
+BACKOFF_SECONDS = REGISTRY.counter('scraper_backoff_seconds_total', 'Seconds slept between retries', ('host',))
+RATE_WAIT_SECONDS = REGISTRY.counter('scraper_rate_wait_seconds_total', 'Seconds spent waiting for the rate controller', ('host',))
+
+# Chunks
+CHUNK_FLUSH_SECONDS = REGISTRY.histogram('scraper_chunk_flush_seconds', 'Time the scrape waited to queue a full chunk for upload')
+CHUNK_UPLOAD_SECONDS = REGISTRY.histogram('scraper_chunk_upload_seconds', 'Duration of chunk and journal uploads to S3')
+CHUNK_BYTES = REGISTRY.counter('scraper_uploaded_bytes_total', 'Bytes uploaded to S3 by the chunk uploader')
+
+# Progress
+APPS = REGISTRY.counter('scraper_apps_total', 'Apps processed by outcome', ('status',))
+PROGRESS = REGISTRY.gauge('scraper_progress', 'Scrape progress: apps done, apps total, apps per second and ETA in seconds', ('value',))
+
+PIPELINE = REGISTRY.gauge('scraper_pipeline', 'Scrape pipeline stages: items done, queue depth, active workers and utilization', ('stage', 'value'))
+
+def register_pipeline(pipeline, gauge=PIPELINE):
+    '''
+    Expose the per-stage counters of a Pipeline.
+    '''
+    for stage in ('fetch', 'parse', 'write'):
+        for value in ('items', 'queue', 'active', 'utilization'):
+            gauge.set_function(lambda stage=stage, value=value: pipeline.stats().get(stage, {}).get(value), stage=stage, value=value)
+
+class Throughput:
+    '''
+    Progress of a scrape, with its ETA from the throughput measured so far.
+    '''
+    def __init__(self, total=0):
+        self.total = total
+        self.done = 0
+        self.start_time = time.monotonic()
+
+    def rate(self):
+        '''
+        Apps per second since the start.
+        '''
+        elapsed = time.monotonic() - self.start_time
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        '''
+        Seconds until every app is done at the current rate, or None if unknown.
+        '''
+        rate = self.rate()
+        return max(self.total - self.done, 0) / rate if rate > 0 else None
+
+    def register(self, gauge=PROGRESS):
+        gauge.set_function(lambda: self.done, value='done')
+        gauge.set_function(lambda: self.total, value='total')
+        gauge.set_function(self.rate, value='apps_per_second')
+        gauge.set_function(self.eta, value='eta_seconds')
+
+def timed(histogram, **labels):
+    '''
+    Context manager observing the duration of its block in a histogram.
+    '''
+    return _Timer(histogram, labels)
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.start, **self.labels)
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes of the endpoint would flood the scraper log
+
+def serve(port=config.METRICS_PORT, host=config.METRICS_HOST, registry=REGISTRY):
+    '''
+    Serve the metrics in the Prometheus text format at http://host:port/metrics
+    from a background thread.
+
+    :return: The HTTP server; call shutdown() to stop it.
+    '''
+    handler = type('Handler', (_Handler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    Log(config.INFO, f'Serving metrics on http://{host}:{server.server_address[1]}/metrics')
+    return server
+
+def dump(path=config.METRICS_FILE, registry=REGISTRY):
+    '''
+    Write the metrics in the Prometheus text format to a file.
+    '''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(registry.render())
+    Log(config.INFO, f'Metrics written to {path}')
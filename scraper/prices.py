@@ -0,0 +1,73 @@
+import csv
+import io
+import datetime as dt
+import config
+from api import PriceRequest, RetriesExhausted
+from engine import RunScrape
+from utils import save_bytes_to_s3, Log
+
+PRICE_COLUMNS = ['app_id', 'cc', 'currency', 'price', 'discount', 'timestamp']
+
+def PriceRows(prices, cc, timestamp):
+    '''
+    Flatten the price_overview dicts of one request into price table rows.
+
+    :param prices: Dict mapping appID to price_overview, as returned by PriceRequest.
+    :param cc: Steam country code the prices were requested for.
+    :param timestamp: Time of the refresh, shared by all rows.
+    '''
+    return [
+        {
+            'app_id': appID,
+            'cc': cc,
+            'currency': overview.get('currency', ''),
+            'price': round(overview.get('final', 0) * 0.01, 2),
+            'discount': overview.get('discount_percent', 0),
+            'timestamp': timestamp,
+        }
+        for appID, overview in prices.items()
+    ]
+
+def refresh_prices(bucket_name, appIDs, currencies=config.PRICE_CURRENCIES, batch_size=config.PRICE_BATCH_SIZE,
+                   retries=config.DEFAULT_RETRIES, concurrency=config.DEFAULT_CONCURRENCY):
+    '''
+    Refresh the prices of the given apps in every configured region and save them to
+    S3 as a CSV table with one (app_id, cc, currency, price, discount, timestamp)
+    row per app and region.
+
+    Only the price_overview filter is requested, with `batch_size` appIDs per call,
+    instead of the full appdetails payload of every app.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param appIDs: AppIDs to refresh, usually the metadata index.
+    :param currencies: Steam country codes ('cc') to request prices for.
+    :return: The S3 key of the price table, or None if no prices were found.
+    '''
+    appIDs = sorted(appIDs, key=int)
+    timestamp = dt.datetime.now(dt.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    batches = [(cc, appIDs[i:i + batch_size]) for cc in currencies for i in range(0, len(appIDs), batch_size)]
+    rows = []
+
+    def process(batch):
+        cc, ids = batch
+        try:
+            return PriceRows(PriceRequest(ids, cc, retries), cc, timestamp)
+        except RetriesExhausted as ex:
+            Log(config.ERROR, f'Giving up on a batch of {len(ids)} prices for {cc}: {ex}')
+            return []
+
+    def on_result(batch, result):
+        rows.extend(result)
+
+    RunScrape(batches, process, on_result, concurrency)
+    Log(config.INFO, f'Refreshed {len(rows)} prices for {len(appIDs)} apps in {len(currencies)} region(s) with {len(batches)} requests')
+    if not rows:
+        return None
+
+    with io.StringIO() as out:
+        writer = csv.DictWriter(out, fieldnames=PRICE_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+        key = f"{config.PRICES_PREFIX}prices_{timestamp.replace(':', '').replace('-', '')}.csv"
+        save_bytes_to_s3(bucket_name, key, out.getvalue().encode('utf-8'))
+    return key
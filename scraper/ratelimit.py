@@ -0,0 +1,251 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+import config
+from utils import Log
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket limiting the request rate to a single host.
+
+    :param rate: Tokens added per second (sustained requests per second).
+    :param capacity: Maximum number of tokens that can accumulate (burst size).
+    '''
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate):
+        '''
+        Change the refill rate, keeping the tokens accumulated so far.
+        '''
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def acquire(self):
+        '''
+        Take a token, blocking until one is available.
+
+        The token is reserved before sleeping, so concurrent callers queue up
+        behind each other instead of all waking at the same time.
+        '''
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+class RateController:
+    '''
+    Adaptive request pacing shared by every request made to one host.
+
+    The request rate is learned with AIMD: each success adds config.RATE_INCREASE
+    requests per second (up to max_rate), and a failure multiplies the rate by
+    config.RATE_DECREASE (down to config.MIN_RATE). Concurrent failures within
+    one request interval only count once. The retry delay is not shared: it
+    doubles with each failed attempt of the same request (see on_failure), so
+    a burst of failures across workers does not compound into long stalls.
+
+    The controller is also the host's circuit breaker. After
+    config.CIRCUIT_FAILURE_THRESHOLD consecutive failures the circuit opens and
+    acquire() blocks for config.CIRCUIT_COOLDOWN seconds, pausing only the work
+    that targets this host. Once the cooldown is over a single probe request is
+    let through: success closes the circuit, failure opens it again with twice
+    the cooldown. A Retry-After from the server pauses the host the same way.
+
+    :param rate: Initial requests per second, or None to leave the host unpaced.
+    :param burst: Number of requests that can be made back to back.
+    :param max_rate: Upper bound for the learned rate. Defaults to
+                     config.MAX_RATE_FACTOR times the initial rate.
+    :param host: Host name, used in log messages.
+    '''
+    def __init__(self, rate=None, burst=1, max_rate=None, host=''):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_rate = max_rate or (rate * config.MAX_RATE_FACTOR if rate else None)
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_decrease = 0.0
+        self.state = CLOSED
+        self.paused_until = 0.0
+        self.cooldown = config.CIRCUIT_COOLDOWN
+        self.over_budget = False
+        self.lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate if self.bucket else None
+
+    @property
+    def retries(self):
+        '''
+        Number of requests that were retries of a failed request.
+        '''
+        return self.failures
+
+    def retry_budget_used(self):
+        '''
+        Fraction of all requests to this host that were retries. Compared against
+        config.RETRY_BUDGET to tell a healthy host from a flaky one.
+        '''
+        return self.retries / self.requests if self.requests else 0.0
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'successes': self.successes,
+            'retries': self.retries,
+            'retry_budget_used': round(self.retry_budget_used(), 4),
+            'rate': self.rate,
+            'circuit': self.state,
+        }
+
+    def acquire(self, deadline=None):
+        '''
+        Wait until the host may be sent another request: not paused, circuit not
+        open (or this caller is the half-open probe), and a rate token available.
+
+        :param deadline: time.monotonic() value past which the caller cannot wait,
+                         or None to wait as long as the host is paused.
+        :return: True once the request may be sent, False without waiting if the
+                 host stays paused past the deadline.
+        '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.state == OPEN:
+                    self.state = HALF_OPEN
+                    Log(config.INFO, f'Circuit for {self.host} half-open, sending a probe request')
+                    break
+                elif self.state == HALF_OPEN:
+                    wait = config.CIRCUIT_PROBE_WAIT
+                else:
+                    break
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+        with self.lock:
+            self.requests += 1
+        if self.bucket:
+            self.bucket.acquire()
+        return True
+
+    def pause(self, seconds):
+        '''
+        Stop sending requests to the host for the given number of seconds.
+        '''
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def on_success(self):
+        '''
+        Record a successful request: additive rate increase, closed circuit.
+        '''
+        with self.lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                Log(config.INFO, f'Circuit for {self.host} closed')
+                self.state = CLOSED
+                self.cooldown = config.CIRCUIT_COOLDOWN
+            if self.bucket:
+                self.bucket.set_rate(min(self.max_rate, self.bucket.rate + config.RATE_INCREASE))
+
+    def on_failure(self, retry_after=None, attempt=1):
+        '''
+        Record a failed request: multiplicative rate decrease, and possibly an
+        open circuit.
+
+        :param retry_after: Seconds the server asked us to wait (Retry-After), if any.
+                            It replaces the exponential delay.
+        :param attempt: Number of times the request being retried has failed. The
+                        retry delay is config.DEFAULT_BACKOFF, doubled for each
+                        attempt after the first, up to config.MAX_BACKOFF.
+        :return: The number of seconds to wait before retrying, with jitter applied.
+        '''
+        delay = min(config.DEFAULT_BACKOFF * 2 ** min(attempt - 1, 32), config.MAX_BACKOFF)
+        with self.lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            now = time.monotonic()
+
+            if self.bucket and now - self.last_decrease >= 1.0 / self.bucket.rate:
+                self.bucket.set_rate(max(config.MIN_RATE, self.bucket.rate * config.RATE_DECREASE))
+                self.last_decrease = now
+
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= config.CIRCUIT_FAILURE_THRESHOLD):
+                self.state = OPEN
+                self.paused_until = max(self.paused_until, now + self.cooldown)
+                Log(config.WARNING, f'Circuit for {self.host} open after {self.consecutive_failures} consecutive failures, pausing it for {self.cooldown} seconds')
+                self.cooldown = min(self.cooldown * 2, config.MAX_BACKOFF)
+
+            used = self.retry_budget_used()
+            if used > config.RETRY_BUDGET and not self.over_budget:
+                Log(config.WARNING, f'Retries to {self.host} are {used:.0%} of requests, over the {config.RETRY_BUDGET:.0%} retry budget')
+            self.over_budget = used > config.RETRY_BUDGET
+
+        if retry_after:
+            # Wait as long as the server asked, spreading the waiting workers a little
+            return retry_after + random.uniform(0, config.DEFAULT_BACKOFF / 2)
+        # Equal jitter: wait at least half the delay, spread the rest randomly
+        return delay / 2 + random.uniform(0, delay / 2)
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+def host_of(url):
+    '''
+    Return the host name of a URL, used as the key for per-host state.
+    '''
+    return urlparse(url).hostname or ''
+
+def set_rate_limit(host, rate, burst=1):
+    '''
+    Override the initial rate limit of a host. Takes effect for subsequent requests.
+
+    :param host: Host name, e.g. 'steamspy.com'.
+    :param rate: Requests per second.
+    :param burst: Number of requests that can be made back to back.
+    '''
+    with _controllers_lock:
+        _controllers[host] = RateController(rate, burst, host=host)
+
+def get_controller(url):
+    '''
+    Return the shared rate controller for the host of the given URL, creating it
+    on first use. Hosts listed in config.RATE_LIMITS are paced; other hosts only
+    get the adaptive retry delay.
+    '''
+    host = host_of(url)
+    with _controllers_lock:
+        controller = _controllers.get(host)
+        if controller is None:
+            controller = _controllers[host] = RateController(*config.RATE_LIMITS.get(host, (None, 1)), host=host)
+        return controller
+
+def retry_stats():
+    '''
+    Return per-host request, retry and circuit breaker statistics.
+    '''
+    with _controllers_lock:
+        return {host: controller.stats() for host, controller in _controllers.items()}
@@ -0,0 +1,133 @@
+from typing import Any, Dict, List, Optional
+import msgspec
+import config
+from utils import Log
+
+# Typed records for the appdetails endpoint. Only the fields ParseSteamGame uses
+# are declared; msgspec skips every other field of the response without building
+# it. Fields whose JSON type varies between apps (e.g. required_age is 0 or
+# "18+") are typed Any and normalized by the parser; any other field of an
+# unexpected type falls back to its default (see DecodeAppDetails). The structs
+# take no part in reference cycles, so they are untracked by the garbage
+# collector (gc=False).
+
+class ReleaseDate(msgspec.Struct, gc=False):
+    coming_soon: bool = False
+    date: str = ''
+
+class PriceOverview(msgspec.Struct, gc=False):
+    final_formatted: str = ''
+
+class Platforms(msgspec.Struct, gc=False):
+    windows: bool = False
+    mac: bool = False
+    linux: bool = False
+
+class Metacritic(msgspec.Struct, gc=False):
+    score: Any = 0
+
+class Total(msgspec.Struct, gc=False):
+    total: Any = 0
+
+class ContentDescriptors(msgspec.Struct, gc=False):
+    notes: Optional[str] = ''
+
+class Description(msgspec.Struct, gc=False):
+    description: str = ''
+
+class Sub(msgspec.Struct, gc=False):
+    option_text: str = ''
+    option_description: str = ''
+    price_in_cents_with_discount: Any = 0
+
+class PackageGroup(msgspec.Struct, gc=False):
+    title: str = ''
+    description: str = ''
+    subs: List[Sub] = []
+
+class AppDetails(msgspec.Struct, gc=False):
+    type: str = ''
+    name: str = ''
+    release_date: ReleaseDate = msgspec.field(default_factory=ReleaseDate)
+    required_age: Any = 0
+    is_free: bool = False
+    price_overview: Optional[PriceOverview] = None
+    dlc: List[Any] = []
+    detailed_description: str = ''
+    about_the_game: str = ''
+    short_description: str = ''
+    platforms: Platforms = msgspec.field(default_factory=Platforms)
+    metacritic: Metacritic = msgspec.field(default_factory=Metacritic)
+    achievements: Total = msgspec.field(default_factory=Total)
+    recommendations: Total = msgspec.field(default_factory=Total)
+    content_descriptors: ContentDescriptors = msgspec.field(default_factory=ContentDescriptors)
+    supported_languages: Optional[str] = None
+    package_groups: List[PackageGroup] = []
+    developers: List[str] = []
+    publishers: List[str] = []
+    categories: List[Description] = []
+    genres: List[Description] = []
+
+class AppDetailsResponse(msgspec.Struct, gc=False):
+    success: bool = False
+    data: Optional[AppDetails] = None
+
+_decoder = msgspec.json.Decoder(Dict[str, AppDetailsResponse])
+
+def ConvertLeniently(data, struct, skipped, path=''):
+    '''
+    Convert a dict to a struct field by field. A field whose value does not match
+    its type gets its default instead (nested structs are converted the same way),
+    so one odd field does not cost the whole record.
+
+    :param skipped: List the paths of the fields left at their default are added to.
+    '''
+    values = {}
+    for field in msgspec.structs.fields(struct):
+        if field.encode_name not in data:
+            continue
+        value = data[field.encode_name]
+        try:
+            values[field.name] = msgspec.convert(value, field.type)
+        except msgspec.ValidationError:
+            if isinstance(value, dict) and isinstance(field.type, type) and issubclass(field.type, msgspec.Struct):
+                values[field.name] = ConvertLeniently(value, field.type, skipped, f'{path}{field.name}.')
+            else:
+                skipped.append(path + field.name)
+    return struct(**values)
+
+def DecodeAppDetails(content, appID):
+    '''
+    Decode the body of an appdetails response straight into typed records.
+
+    If a field has an unexpected type, the body is decoded again without types
+    and converted leniently: the odd fields get their defaults and a warning is
+    logged, rather than losing the app.
+
+    :param content: Raw response body (bytes or str).
+    :return: The AppDetails of the app, or None if Steam reports no success.
+    :raises msgspec.DecodeError: If the body is not JSON.
+    '''
+    try:
+        app = _decoder.decode(content).get(str(appID))
+        return app.data if app is not None and app.success else None
+    except msgspec.ValidationError:
+        app = msgspec.json.decode(content)
+    app = app.get(str(appID)) if isinstance(app, dict) else None
+    if not isinstance(app, dict) or app.get('success') is not True or not isinstance(app.get('data'), dict):
+        return None
+    skipped = []
+    data = ConvertLeniently(app['data'], AppDetails, skipped)
+    Log(config.WARNING, f'Unexpected types in the appdetails of {appID}, using defaults for {", ".join(skipped)}')
+    return data
+
+def AsAppDetails(app):
+    '''
+    Return an appdetails payload as AppDetails, converting plain dicts leniently.
+    '''
+    if isinstance(app, AppDetails):
+        return app
+    try:
+        return msgspec.convert(app, AppDetails)
+    except msgspec.ValidationError:
+        return ConvertLeniently(app, AppDetails, [])
@@ -0,0 +1,108 @@
+import heapq
+import math
+import random
+import time
+import config
+from ratelimit import retry_stats
+
+# Kinds of scheduled apps
+NEW, REFRESH, NOT_RELEASED = 'new', 'refresh', 'not_released'
+
+# Fields of a scraped game kept in the state index to rank its next refresh
+SIGNAL_FIELDS = ['peak_ccu', 'recommendations']
+
+def signals_of(game):
+    '''
+    Return the scheduling signals of a parsed game, for update_app_state.
+    '''
+    return {field: game.get(field) or 0 for field in SIGNAL_FIELDS}
+
+def popularity(entry, extra=None):
+    '''
+    Log-scaled popularity of an app from its state entry, falling back to the
+    SteamSpy bulk data for apps that were never scraped.
+    '''
+    extra = extra or {}
+    peak_ccu = entry.get('peak_ccu', extra.get('ccu', 0)) or 0
+    recommendations = entry.get('recommendations', 0) or 0
+    return math.log10(1 + peak_ccu) + math.log10(1 + recommendations)
+
+def release_due(entry, now):
+    '''
+    Return True if a not released app should be polled again: its announced
+    release date is less than config.RELEASE_WINDOW_DAYS away (or past), or it
+    has no announced date and was last polled more than
+    config.NOTRELEASED_POLL_DAYS ago.
+    '''
+    expected = entry.get('expected_release')
+    if expected:
+        return now >= expected - config.RELEASE_WINDOW_DAYS * 86400
+    return now - entry.get('scraped_at', 0) >= config.NOTRELEASED_POLL_DAYS * 86400
+
+def app_priority(appID, kind, entry, extra, now, max_age, newest=1, changed=False):
+    '''
+    Priority of an app in the scrape schedule; higher is scraped first.
+
+    New apps come first (config.PRIORITY_NEW), newer appIDs and popular apps
+    ahead of the rest, together with not released apps whose release is due.
+    Refreshes and other re-polls follow, ranked by how stale they are scaled by
+    popularity, and capped below the new apps.
+
+    :param kind: NEW, REFRESH or NOT_RELEASED.
+    :param entry: The app's state entry ({} if none).
+    :param extra: The app's SteamSpy bulk data, or None.
+    :param max_age: Age in seconds at which scraped data is considered stale.
+    :param newest: Highest appID in the app list, to scale newness.
+    :param changed: True if the app changed upstream since it was scraped.
+    '''
+    score = popularity(entry, extra)
+    if kind == NEW:
+        return config.PRIORITY_NEW + int(appID) / max(newest, 1) + score
+    if kind == NOT_RELEASED:
+        if entry.get('expected_release') and release_due(entry, now):
+            return config.PRIORITY_NEW + score
+        staleness = (now - entry.get('scraped_at', 0)) / (config.NOTRELEASED_POLL_DAYS * 86400)
+    else:
+        staleness = (now - entry.get('scraped_at', 0)) / max_age
+        if changed:
+            staleness = max(staleness, 1.0)
+    return min(staleness * (1 + score), config.PRIORITY_NEW / 2)
+
+class Schedule:
+    '''
+    Priority queue of appIDs. Iterating pops the apps from the highest priority
+    to the lowest; apps with the same priority come out in random order. The
+    iterator can be shared by several workers, as ScrapeAsync does.
+    '''
+    def __init__(self):
+        self.heap = []
+
+    def push(self, appID, priority):
+        heapq.heappush(self.heap, (-priority, random.random(), appID))
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        while self.heap:
+            yield heapq.heappop(self.heap)[2]
+
+class Budget:
+    '''
+    Limits a scrape to a number of API requests and/or a number of seconds,
+    counted from its creation. None means no limit.
+    '''
+    def __init__(self, max_requests=None, max_time=None):
+        self.max_requests = max_requests
+        self.max_time = max_time
+        self.start_time = time.monotonic()
+        self.start_requests = self.requests()
+
+    @staticmethod
+    def requests():
+        return sum(stats['requests'] for stats in retry_stats().values())
+
+    def exhausted(self):
+        if self.max_time is not None and time.monotonic() - self.start_time >= self.max_time:
+            return True
+        return self.max_requests is not None and self.requests() - self.start_requests >= self.max_requests
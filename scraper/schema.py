@@ -0,0 +1,47 @@
+import config
+from api import STEAM_FIELDS
+from enrichment import STEAMSPY_FIELDS
+
+# Every field a game record can hold, in output order
+GAME_FIELDS = list(STEAM_FIELDS) + [target for _, target, _ in STEAMSPY_FIELDS] + ['tags']
+STEAMSPY_OUTPUT_FIELDS = set(GAME_FIELDS[len(STEAM_FIELDS):])
+# The 'all' schema of games enriched from the SteamSpy bulk listing, which has no tags
+UNTAGGED_FIELDS = frozenset(GAME_FIELDS) - {'tags'}
+
+def parse_fields(spec):
+    '''
+    Parse an output schema: 'all', the name of a preset in config.FIELD_PRESETS, or
+    a comma-separated list of fields and presets.
+
+    :return: Frozen set of field names, or None for all fields.
+    :raises ValueError: If a field or preset is unknown.
+    '''
+    if spec is None or spec == 'all':
+        return None
+    fields = set()
+    for name in (part.strip() for part in spec.split(',')):
+        if name in config.FIELD_PRESETS:
+            fields.update(config.FIELD_PRESETS[name])
+        elif name in GAME_FIELDS:
+            fields.add(name)
+        elif name:
+            raise ValueError(f'Unknown field or preset {name!r}')
+    unknown = fields.difference(GAME_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown field(s) {", ".join(sorted(unknown))} in a preset')
+    if not fields:
+        raise ValueError(f'Empty output schema {spec!r}')
+    return frozenset(fields)
+
+def wants_steamspy(fields):
+    '''
+    Return True if the output schema holds any field that comes from SteamSpy.
+    '''
+    return fields is None or not STEAMSPY_OUTPUT_FIELDS.isdisjoint(fields)
+
+def wants_tags(fields):
+    '''
+    Return True if the output schema lists tags explicitly. Tags are not in the
+    SteamSpy bulk listing, so they take a SteamSpy request per app.
+    '''
+    return fields is not None and 'tags' in fields
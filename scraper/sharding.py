@@ -0,0 +1,98 @@
+import zlib
+import config
+from journal import compact_journal
+from utils import (load_from_s3, save_to_s3, Log, load_metadata_index, save_metadata_index,
+                   load_app_ids, save_app_ids, load_app_state, save_app_state)
+
+def parse_shard(spec):
+    '''
+    Parse a shard specification of the form 'i/N' (0 <= i < N).
+
+    :return: The tuple (i, N).
+    :raises ValueError: If the specification is malformed.
+    '''
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except (AttributeError, ValueError):
+        raise ValueError(f'Invalid shard {spec!r}, expected i/N')
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f'Invalid shard {spec!r}, expected 0 <= i < N')
+    return index, count
+
+def in_shard(appID, shard):
+    '''
+    Return True if the app belongs to the shard. Apps are assigned by a stable hash
+    of their appID, so every worker computes the same split independently.
+
+    :param shard: Tuple (i, N), or None when not sharding.
+    '''
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(str(appID).encode('utf-8')) % count == index
+
+def shard_prefix(shard):
+    '''
+    Return the S3 key prefix under which a shard writes its chunks, manifest and
+    index deltas, or '' when not sharding.
+    '''
+    if shard is None:
+        return ''
+    index, count = shard
+    return f'{config.SHARDS_PREFIX}{index}-of-{count}/'
+
+def merge_shards(bucket_name, count):
+    '''
+    Fold the output of every shard of an N-way sharded scrape into the main files.
+
+    The shard chunks are appended to the main manifest, and the metadata,
+    discarded, not released and state deltas are merged into the main indexes.
+    Merging is idempotent, so it can run again after more shard work without
+    duplicating chunks. Shard journals that were not compacted are folded into
+    the shard's index files first.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param count: Number of shards (N).
+    :return: The updated main manifest.
+    '''
+    # Fold in the journals of scrapes that ended before compacting them
+    for prefix in [''] + [shard_prefix((index, count)) for index in range(count)]:
+        compact_journal(bucket_name, prefix)
+
+    manifest = load_from_s3(bucket_name, config.MANIFEST_FILE) or {'chunks': []}
+    metadata = load_metadata_index(bucket_name)
+    discarded = load_app_ids(bucket_name, config.DISCARDED_FILE)
+    notreleased = load_app_ids(bucket_name, config.NOTRELEASED_FILE)
+    state = load_app_state(bucket_name)
+    known_chunks = set(manifest['chunks'])
+    new_chunks = 0
+
+    for index in range(count):
+        prefix = shard_prefix((index, count))
+        shard_manifest = load_from_s3(bucket_name, prefix + config.MANIFEST_FILE)
+        if not shard_manifest:
+            Log(config.WARNING, f'Shard {index}/{count} has no manifest, skipping it')
+            continue
+        for chunk_key in shard_manifest['chunks']:
+            if chunk_key not in known_chunks:
+                manifest['chunks'].append(chunk_key)
+                known_chunks.add(chunk_key)
+                new_chunks += 1
+
+        metadata |= load_metadata_index(bucket_name, prefix)
+        discarded |= load_app_ids(bucket_name, prefix + config.DISCARDED_FILE)
+        notreleased |= load_app_ids(bucket_name, prefix + config.NOTRELEASED_FILE)
+        for appID, entry in load_app_state(bucket_name, prefix).items():
+            if entry.get('scraped_at', 0) >= state.get(appID, {}).get('scraped_at', 0):
+                state[appID] = entry
+
+    # An app released since it was listed as not released is now in the metadata index
+    notreleased -= metadata
+
+    save_app_ids(bucket_name, config.DISCARDED_FILE, discarded)
+    save_app_ids(bucket_name, config.NOTRELEASED_FILE, notreleased)
+    save_metadata_index(bucket_name, metadata)
+    save_app_state(bucket_name, state)
+    save_to_s3(bucket_name, config.MANIFEST_FILE, manifest)
+    Log(config.INFO, f'Merged {count} shard(s): {new_chunks} new chunk(s), {len(metadata)} apps in the metadata index')
+    return manifest
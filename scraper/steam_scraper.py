@@ -56,16 +56,31 @@ __license__ = "MIT"
 __version__ = "1.0"
 
 
+import os
 import sys
 import json
 import time
 import argparse
+import atexit
 import random
 import datetime as dt
 import config
 
-from api import SteamRequest, SteamSpyRequest, DoRequest, ParseSteamGame
-from utils import load_from_s3, save_to_s3, ProgressLog, Log, save_chunk_to_s3, merge_chunks, load_metadata_index, save_metadata_index, update_metadata_index
+from api import SteamRequest, SteamSpyRequest, DoRequest, ParseSteamGame, ReleaseDate, ExpectedReleaseDate, RetriesExhausted, CacheMiss, set_pool_size, set_cache, set_deadline
+from cache import ResponseCache
+from engine import Pipeline
+from enrichment import apply_steamspy, load_steamspy_cache
+from prices import refresh_prices
+from schema import UNTAGGED_FIELDS, parse_fields, wants_steamspy, wants_tags
+from sharding import parse_shard, in_shard, shard_prefix, merge_shards
+from uploader import ChunkBuffer, ChunkUploader
+from appidset import AppIDSet
+from scheduler import Schedule, Budget, app_priority, release_due, signals_of, NEW, REFRESH
+from journal import Journal, load_journal, replay_journal, ADDED, NOT_RELEASED, DISCARDED, STATE
+from ratelimit import set_rate_limit, retry_stats
+import metrics
+from utils import load_from_s3, ProgressLog, Log, merge_chunks, load_metadata_index, update_metadata_index, load_env
+from utils import load_app_ids, save_app_ids, load_app_state, update_app_state, seed_app_state, stale_apps, RecordHash
 
 def get_app_list(bucket_name, args):
     """
@@ -73,8 +88,8 @@ def get_app_list(bucket_name, args):
     """
     
     try:
-        apps = load_from_s3(bucket_name, config.APPLIST_FILE)
-        if apps is None:
+        apps = load_app_ids(bucket_name, config.APPLIST_FILE)
+        if not apps:
             raise FileNotFoundError
         Log(config.INFO, f'List with {len(apps)} games loaded from S3')
     except (FileNotFoundError, json.JSONDecodeError):
@@ -83,12 +98,132 @@ def get_app_list(bucket_name, args):
         if response:
             time.sleep(args.sleep)
             data = response.json()
-            apps = [str(x["appid"]) for x in data['applist']['apps']]
-            save_to_s3(bucket_name, config.APPLIST_FILE, apps)
+            apps = AppIDSet(x["appid"] for x in data['applist']['apps'])
+            save_app_ids(bucket_name, config.APPLIST_FILE, apps)
             Log(config.INFO, f'List with {len(apps)} games saved to S3.')
     return apps
 
-def process_game(appID, args, notreleased_set, discarded_set, successRequestCount, errorRequestCount):
+def get_app_modified_times(args, deadline=None):
+    """
+    Downloads the time each game was last modified on the Steam store, keyed by AppID.
+
+    Uses IStoreService/GetAppList, which needs a Steam Web API key in the
+    STEAM_API_KEY environment variable. Without a key an empty dict is returned
+    and apps are only refreshed by age. Once `deadline` (a time.monotonic()
+    value) has passed, no further page is requested and the games listed so far
+    are returned; the others are refreshed by age.
+    """
+    key = os.getenv('STEAM_API_KEY')
+    if not key:
+        Log(config.INFO, 'STEAM_API_KEY not set, apps are refreshed by age only')
+        return {}
+
+    modified, last_appid = {}, 0
+    while True:
+        params = {'key': key, 'include_games': 1, 'max_results': config.APP_LIST_PAGE_SIZE, 'last_appid': last_appid}
+        response = DoRequest('https://api.steampowered.com/IStoreService/GetAppList/v1/', params, args.retries)
+        data = response.json().get('response', {})
+        for app in data.get('apps', []):
+            modified[str(app['appid'])] = app.get('last_modified', 0)
+        if not data.get('have_more_results'):
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            Log(config.WARNING, f'No time left to list more change times, stopping after {len(modified)} games')
+            break
+        last_appid = data.get('last_appid')
+    Log(config.INFO, f'Loaded last modified times of {len(modified)} games')
+    return modified
+
+def schedule_refreshes(pending, metadata, state, modified, max_age, now, shard=None):
+    """
+    Queue the scraped apps of a shard that changed upstream or aged out.
+
+    Args:
+        pending (Schedule): The apps to scrape, updated in place.
+        metadata (AppIDSet): AppIDs already scraped, by every shard.
+        state (dict): The per-app state index. Apps without an entry get one (see seed_app_state).
+        modified (dict): Upstream last_modified time by AppID (may be empty).
+        max_age (float): Maximum age of scraped data in seconds.
+        now (float): Current time as a Unix timestamp.
+        shard (tuple): (i, N) to only refresh the apps of shard i, or None for all.
+
+    Returns:
+        int: The number of apps queued.
+    """
+    scraped = AppIDSet(appID for appID in metadata if in_shard(appID, shard)) if shard else metadata
+    seeded = seed_app_state(scraped, state, modified, now)
+    if seeded:
+        Log(config.INFO, f'{seeded} scraped apps had no recorded scrape time, counting them as scraped now')
+    stale = stale_apps(scraped, state, modified, max_age, now)
+    for appID in stale:
+        entry = state.get(appID, {})
+        changed = modified.get(appID, 0) > entry.get('last_modified', float('inf'))
+        pending.push(appID, app_priority(appID, REFRESH, entry, None, now, max_age, changed=changed))
+    return len(stale)
+
+def fetch_game(appID, args, steamspy_cache=None):
+    """
+    Request the Steam and SteamSpy data of a game: the I/O half of process_game.
+
+    Args:
+        appID (int): Steam AppID of the game to fetch.
+        args (argparse.Namespace): Command line arguments.
+        steamspy_cache (dict): SteamSpy bulk data by AppID. Apps found here need no SteamSpy request unless tags are wanted; without them, the 'all' schema leaves tags out.
+
+    Returns:
+        tuple: (result, work). For a game to be added, result is None and work is the argument of parse_game. Otherwise work is None and result is the final (data, status) of process_game.
+    """
+    try:
+        app = SteamRequest(appID, args.retries)
+    except RetriesExhausted as ex:
+        Log(config.ERROR, f'Giving up on appID {appID} for this run: {ex}')
+        return (None, 'failed'), None
+    except CacheMiss:
+        return (None, 'failed'), None
+    if not app:
+        return (None, 'discarded'), None
+
+    if ReleaseDate(app) == '':
+        expected = ExpectedReleaseDate(app)
+        return (({'expected_release': int(expected)} if expected else None), 'not_released'), None
+
+    steamspy = args.steamspy and wants_steamspy(args.fields)
+    fields, extra = args.fields, None
+    if steamspy:
+        if steamspy_cache and not (args.tags or wants_tags(args.fields)):
+            extra = steamspy_cache.get(appID)
+            # No tags with the bulk listing: leave them out rather than write empty ones
+            fields = UNTAGGED_FIELDS if fields is None else fields
+        if extra is None:
+            # Not in the bulk listing, or tags are wanted: ask SteamSpy for this app
+            try:
+                extra = SteamSpyRequest(appID, args.retries)
+            except RetriesExhausted as ex:
+                Log(config.ERROR, f'Giving up on appID {appID} for this run: {ex}')
+                return (None, 'failed'), None
+            except CacheMiss:
+                extra = None  # Replaying without SteamSpy data for this app
+
+    return None, (app, extra, fields, steamspy)
+
+def parse_game(work):
+    """
+    Parse and sanitize a fetched game: the CPU half of process_game. Runs on the
+    parse process pool, so it only uses its argument.
+
+    Args:
+        work (tuple): (app, extra, fields, steamspy) as returned by fetch_game.
+
+    Returns:
+        tuple: The parsed game and the status 'added'.
+    """
+    app, extra, fields, steamspy = work
+    game = ParseSteamGame(app, fields)
+    if steamspy:
+        apply_steamspy(game, extra, fields)
+    return game, 'added'
+
+def process_game(appID, args, notreleased_set, discarded_set, steamspy_cache=None):
     """
     Process a single Steam game.
 
@@ -97,45 +232,13 @@ def process_game(appID, args, notreleased_set, discarded_set, successRequestCoun
         args (argparse.Namespace): Command line arguments.
         notreleased_set (set): Set of AppIDs of games that haven't been released yet.
         discarded_set (set): Set of AppIDs of games that belong to the catergory (DLC, Bundle, etc).
-        successRequestCount (int): Number of successful requests made.
-        errorRequestCount (int): Number of requests that resulted in an error.
+        steamspy_cache (dict): SteamSpy bulk data by AppID. Apps found here need no SteamSpy request unless tags are wanted; without them, the 'all' schema leaves tags out.
 
     Returns:
-        tuple: A tuple containing the processed game data, or None if the game was discarded, and a string indicating the status of the game ('added' or 'not_released').
+        tuple: A tuple containing the processed game data, or None if the game was discarded, and a string indicating the status of the game ('added', 'not_released', 'discarded' or 'failed' when a request ran out of retries). For a game that is not released, the data is {'expected_release': timestamp} when Steam announces a date.
     """
-    app = SteamRequest(appID, min(4, args.sleep), successRequestCount, errorRequestCount, args.retries)
-    if not app:
-        return None, 'discarded'
-
-    game = ParseSteamGame(app)
-    if game['release_date'] == '':
-        return None, 'not_released'
-
-    if args.steamspy:
-        extra = SteamSpyRequest(appID, min(4, args.sleep), successRequestCount, errorRequestCount, args.retries)
-        if extra:
-            game.update({
-                'user_score': extra.get('userscore', 0),
-                'score_rank': extra.get('score_rank', ""),
-                'positive': extra.get('positive', 0),
-                'negative': extra.get('negative', 0),
-                'estimated_owners': extra.get('owners', "0 - 0").replace(',', '').replace('..', '-'),
-                'average_playtime_forever': extra.get('average_forever', 0),
-                'average_playtime_2weeks': extra.get('average_2weeks', 0),
-                'median_playtime_forever': extra.get('median_forever', 0),
-                'median_playtime_2weeks': extra.get('median_2weeks', 0),
-                'peak_ccu': extra.get('ccu', 0),
-                'tags': extra.get('tags', [])
-            })
-        else:
-            game.update({
-                'user_score': 0, 'score_rank': "", 'positive': 0, 'negative': 0,
-                'estimated_owners': "0 - 0", 'average_playtime_forever': 0,
-                'average_playtime_2weeks': 0, 'median_playtime_forever': 0,
-                'median_playtime_2weeks': 0, 'peak_ccu': 0, 'tags': []
-            })
-
-    return game, 'added'
+    result, work = fetch_game(appID, args, steamspy_cache)
+    return parse_game(work) if work is not None else result
 
 def Scraper(dataset, notreleased, discarded, args, appIDs=None):
     """
@@ -151,101 +254,350 @@ def Scraper(dataset, notreleased, discarded, args, appIDs=None):
     - `appIDs`: An optional list of AppIDs to scrape. If not provided, the
       function will retrieve the list of AppIDs from the dataset file.
 
-    The function will scrape the Steam API for the given AppIDs, and save the
-    results to S3. If the autosave option is enabled, the function will save
+    The function will scrape the Steam API for the given AppIDs, keeping up to
+    `args.concurrency` apps in flight. Requests to the Steam store and to
+    SteamSpy are paced by separate per-host token buckets, and the results are
+    saved to S3. If the autosave option is enabled, the function will save
     the data to S3 at regular intervals.
 
+    The scrape runs as a staged pipeline: fetch threads make the requests, a
+    pool of `args.parse_workers` processes parses and sanitizes the responses,
+    and a single writer records the results and fills the chunks. The stages
+    are connected by bounded queues; the depth of each queue and the
+    utilization of each stage are logged at the end of the scrape, and
+    exported with the scrape's progress and ETA by the metrics module.
+
+    A per-app state index records when each app was scraped, its upstream
+    last-modified time and a hash of its parsed record. With `args.refresh`,
+    scraped apps that changed upstream or are older than `args.max_age` days
+    are fetched again, and only records whose hash changed are written.
+
+    Apps are scraped in priority order rather than at random: new apps (newest
+    and most popular first) and not released apps whose announced date is near,
+    then refreshes and re-polls by staleness and popularity. Not released apps
+    are only polled again when due, unless `args.released` is off. With
+    `args.max_requests` or `args.max_time`, no new apps are started once the
+    budget is used up, so a short run covers the most important apps.
+
+    With `args.time_budget`, the run must end within that many seconds of the
+    call (e.g. the time left in an AWS Lambda invocation). Listing the change
+    times and prefetching SteamSpy may use `config.SETUP_BUDGET_SHARE` of it; a
+    prefetch cut short saves its progress and is resumed by the next call. No
+    new apps are started once only `config.TIME_BUDGET_RESERVE` seconds are
+    left, requests stop retrying past that point, and the apps in flight are
+    finished and checkpointed before returning. The chunks are not merged unless every app
+    was scraped, so the next invocation carries on from the checkpoint.
+
+    With `args.shard` set to (i, N), only the apps that hash to shard i are
+    scraped, and chunks, manifest and index deltas are written under the
+    shard's own prefix so that several workers can share a bucket. They are
+    combined afterwards by merge_shards.
+
+    With `args.replay`, no API requests are made: every app is re-parsed from
+    the on-disk response cache and the chunks, manifest and indexes are
+    rebuilt from scratch. Apps missing from the cache are skipped.
+
     The function will also save the progress of the scraper to S3, including
     the current set of AppIDs that have not been released yet, and the set of
-    AppIDs that are not games.
+    AppIDs that are not games. While scraping, the outcome of every app is
+    appended to a journal in small segments; a scrape that was cut short is
+    resumed by replaying the journal, and the journal is folded into the
+    index files when the scrape ends.
 
     Finally, the function will merge the chunks saved to S3 into a single file
     when the scrape is complete.
+
+    Returns a summary of the run: the number of apps added, unchanged, not
+    released, discarded and failed, the apps `finished` in this run, the apps
+    `remaining` for a later run and whether the run was `complete`.
     """
+    started = time.monotonic()
+    time_budget = getattr(args, 'time_budget', None)
+    # The budget covers the whole call, from the change times and the SteamSpy
+    # prefetch to the checkpoint, so the deadline is set before any request
+    deadline = started + max(0.0, time_budget - config.TIME_BUDGET_RESERVE) if time_budget is not None else None
+    set_deadline(deadline)
+    bucket_name = args.bucket
+    shard, prefix = args.shard, shard_prefix(args.shard)
     metadata = load_metadata_index(bucket_name)
-    apps = appIDs or get_app_list(bucket_name, args)
+    state = load_app_state(bucket_name)
+    apps = [appID for appID in (appIDs or get_app_list(bucket_name, args)) if in_shard(appID, shard)]
     
-    notreleased_set, discarded_set = set(notreleased), set(discarded)
-    gamesAdded, gamesNotReleased, gamesdiscarded = 0, 0, 0
-    successRequestCount, errorRequestCount = 0, 0
+    notreleased_set, discarded_set = AppIDSet(notreleased), AppIDSet(discarded)
+    if prefix:
+        # Resume from this shard's own progress on top of the merged indexes
+        metadata |= load_metadata_index(bucket_name, prefix)
+        state.update(load_app_state(bucket_name, prefix))
+        discarded_set |= load_app_ids(bucket_name, prefix + config.DISCARDED_FILE)
+        notreleased_set |= load_app_ids(bucket_name, prefix + config.NOTRELEASED_FILE)
+        notreleased_set -= metadata
+    gamesAdded, gamesNotReleased, gamesdiscarded, gamesFailed, gamesUnchanged = 0, 0, 0, 0, 0
 
-    random.shuffle(apps)
-    total = len(apps) - len(discarded_set) - len(notreleased_set) - len(metadata)
     count = 0
-    chunk, manifest = {}, load_from_s3(bucket_name, 'manifest.json') or {'chunks': []}
+    chunk, manifest = ChunkBuffer(args.chunk_bytes, args.chunk_size), load_from_s3(bucket_name, prefix + config.MANIFEST_FILE) or {'chunks': []}
+    uploader = ChunkUploader(bucket_name)
     start_time = dt.datetime.now()
 
+    journal_entries, segments = load_journal(bucket_name, prefix)
+    if args.replay:
+        # Rebuild the whole dataset from the response cache: every app is re-parsed
+        # and the indexes and chunks are written from scratch
+        metadata, notreleased_set, discarded_set = AppIDSet(), AppIDSet(), AppIDSet()
+        manifest = {'chunks': []}
+    elif journal_entries:
+        # Pick up the progress of a scrape that ended before compacting its journal
+        replay_journal(journal_entries, metadata, discarded_set, notreleased_set, state, manifest)
+        Log(config.INFO, f'Resumed {len(journal_entries)} journal entries from {len(segments)} segment(s)')
+    journal = Journal(uploader, prefix, segments)
+
+    # Leave most of a time budget to the scrape itself
+    setup_deadline = time.monotonic() + config.SETUP_BUDGET_SHARE * (deadline - time.monotonic()) if deadline is not None else None
+    try:
+        modified = {} if args.replay else get_app_modified_times(args, setup_deadline)
+    except (RetriesExhausted, ValueError) as ex:
+        # Without the change times, scraped apps are only refreshed by age
+        Log(config.ERROR, f'Could not load the last modified times, refreshing by age only: {ex}')
+        modified = {}
+    steamspy_cache = None
+    if args.steamspy and args.prefetch and wants_steamspy(args.fields):
+        if args.replay:
+            steamspy_cache = load_steamspy_cache(bucket_name, ttl=float('inf'), fetch=False)
+        elif shard and shard[0] != 0:
+            # Only the first shard refreshes the shared SteamSpy cache
+            steamspy_cache = load_steamspy_cache(bucket_name, ttl=float('inf'), fetch=False)
+        else:
+            try:
+                steamspy_cache = load_steamspy_cache(bucket_name, args.retries, deadline=setup_deadline)
+            except RetriesExhausted as ex:
+                # SteamSpy data is optional: scrape Steam anyway, with per-app SteamSpy requests
+                Log(config.ERROR, f'SteamSpy prefetch failed, continuing without the bulk cache: {ex}')
+
+    # Queue the apps by priority: new apps and due releases first, then refreshes
+    # and re-polls by staleness. The skip set is computed on the whole bitmaps at
+    # once, then a single bit test per app. With --released, the unreleased apps
+    # whose release is not due yet are skipped too (release_due needs their state,
+    # so only those are tested one by one).
+    now, max_age = time.time(), args.max_age * 86400
+    skip = metadata | discarded_set
+    if args.released:
+        skip |= AppIDSet(appID for appID in notreleased_set if not release_due(state.get(appID, {}), now))
+    newest = max((int(appID) for appID in apps), default=1)
+    pending = Schedule()
+    for appID in apps:
+        if appID in skip:
+            continue
+        if appID in notreleased_set:
+            pending.push(appID, app_priority(appID, NOT_RELEASED, state.get(appID, {}), None, now, max_age))
+        else:
+            pending.push(appID, app_priority(appID, NEW, {}, (steamspy_cache or {}).get(appID), now, max_age, newest))
+
+    if args.refresh and not args.replay:
+        stale = schedule_refreshes(pending, metadata, state, modified, max_age, now, shard)
+        Log(config.INFO, f'{stale} scraped apps changed upstream or are older than {args.max_age} days')
+    total = len(pending)
+
+    def fetch(appID):
+        return fetch_game(appID, args, steamspy_cache)
+
+    def flush_chunk():
+        """
+        Queue the current chunk for upload and journal the apps it holds.
+        """
+        nonlocal manifest, metadata
+        added = list(chunk.keys())
+        metadata = update_metadata_index(metadata, added)
+        manifest = uploader.save_chunk(chunk, manifest, prefix)
+        for appID in added:
+            journal.record(appID, ADDED, manifest['chunks'][-1], state.get(appID))
+
+    def on_result(appID, result):
+        """
+        Record the result of an app, and stop starting new apps once the request
+        or time budget is used up.
+        """
+        record_result(appID, result)
+        metrics.APPS.inc(status=result[1])
+        progress.done += 1
+        if budget.exhausted():
+            Log(config.INFO, 'Scrape budget used up, finishing the apps in flight')
+            return False
+
+    def record_result(appID, result):
+        nonlocal gamesAdded, gamesNotReleased, gamesdiscarded, gamesFailed, gamesUnchanged, total, count
+        game, status = result
+        refreshing = appID in metadata
+        scraped_at = state.get(appID, {}).get('scraped_at', time.time()) if args.replay else time.time()
+
+        if status == 'added':
+            record_hash = RecordHash(game)
+            unchanged = refreshing and state.get(appID, {}).get('hash') == record_hash
+            update_app_state(state, appID, scraped_at, modified.get(appID), record_hash, signals_of(game))
+            if unchanged:
+                # Nothing new to write, only the scrape time moves forward
+                journal.record(appID, STATE, state=state[appID])
+                gamesUnchanged += 1
+                count += 1
+                ProgressLog('Scraping', count, total, start_time)
+                return
+
+            chunk.add(appID, game)
+            gamesAdded += 1
+            count += 1
+            ProgressLog('Scraping', count, total, start_time)
+
+            if appID in notreleased_set:
+                notreleased_set.remove(appID)
+
+            if chunk.full():
+                flush_chunk()
+                Log(config.INFO, f'Updated metadata index with chunk AppIDs. Current metadata size: {len(metadata)}')
+                Log(config.INFO, 'Pipeline: ' + ', '.join(f'{stage} {stats["utilization"]:.0%} busy, {stats["queue"]} queued' for stage, stats in pipeline.stats().items()))
+        elif refreshing and status != 'failed':
+            # A scraped app that is no longer available keeps its last data
+            update_app_state(state, appID, scraped_at, modified.get(appID))
+            journal.record(appID, STATE, state=state[appID])
+            total -= 1
+        elif status == 'not_released':
+            # The poll time and announced date decide when the app is polled again
+            update_app_state(state, appID, scraped_at, signals=game)
+            journal.record(appID, NOT_RELEASED, state=state[appID])
+            if appID not in notreleased_set:
+                notreleased_set.add(appID)
+                gamesNotReleased += 1
+            total -= 1
+        elif status == 'discarded':
+            discarded_set.add(appID)
+            journal.record(appID, DISCARDED)
+            gamesdiscarded += 1
+            total -= 1
+        elif status == 'failed':
+            # Not recorded anywhere, so the app is picked up again on the next run
+            gamesFailed += 1
+            total -= 1
+
+    def checkpoint():
+        """
+        Save the incomplete chunk, flush the journal and fold it into the index
+        files. A shard only writes the apps it owns, under its own prefix, for
+        merge_shards to fold in later. Pending uploads are waited for first, so
+        the manifest never lists a chunk that is not in S3 yet; if one could not
+        be saved, UploadError is raised and nothing is committed, so the apps of
+        that chunk are scraped again by the next run.
+        """
+        if chunk:
+            flush_chunk()
+        journal.flush()
+        uploader.flush()
+
+        def owned(ids):
+            return AppIDSet(appID for appID in ids if in_shard(appID, shard)) if shard else ids
+
+        journal.compact(bucket_name, owned(metadata), owned(discarded_set), owned(notreleased_set),
+                        {appID: entry for appID, entry in state.items() if in_shard(appID, shard)}, manifest)
+
+    max_time = args.max_time
+    if deadline is not None:
+        # What the indexes, change times and prefetch left of the budget
+        time_left = max(0.0, deadline - time.monotonic())
+        max_time = time_left if max_time is None else min(max_time, time_left)
+    budget = Budget(args.max_requests, max_time)
+    pipeline = Pipeline(fetch, parse_game, on_result, args.concurrency, args.parse_workers)
+    progress = metrics.Throughput(total)
+    progress.register()
+    metrics.register_pipeline(pipeline)
     try:
-        for appID in apps:
-            if appID not in metadata and appID not in discarded_set:
-                if args.released and appID in notreleased_set:
-                    continue
-
-                game, status = process_game(appID, args, notreleased_set, discarded_set, successRequestCount, errorRequestCount)
-
-                if status == 'added':
-                    chunk[appID] = game
-                    gamesAdded += 1
-                    count += 1
-                    ProgressLog('Scraping', count, total, start_time)
-
-                    if appID in notreleased_set:
-                        notreleased_set.remove(appID)
-
-                    if len(chunk) >= args.chunk_size:
-                        manifest = save_chunk_to_s3(bucket_name, chunk, manifest)
-                        metadata = update_metadata_index(metadata, set(chunk.keys()))
-                        Log(config.INFO, f'Updated metadata index with chunk AppIDs. Current metadata size: {len(metadata)}')
-                        chunk.clear()
-                elif status == 'not_released':
-                    if appID not in notreleased_set:
-                        notreleased_set.add(appID)
-                        gamesNotReleased += 1
-                        total -= 1
-                elif status == 'discarded':
-                    discarded_set.add(appID)
-                    gamesdiscarded += 1
-                    total -= 1
-
-                time.sleep(args.sleep if random.random() > 0.1 else args.sleep * 2.0)
+        if max_time is None or max_time > 0:
+            pipeline.run(pending)
 
     except (KeyboardInterrupt, SystemExit, Exception) as e:
         Log(config.INFO, f'Scraping interrupted or error occurred: {str(e)}. Saving current progress...')
-        if chunk:  # Save the incomplete chunk
-            manifest = save_chunk_to_s3(bucket_name, chunk, manifest)
-            metadata = update_metadata_index(metadata, set(chunk.keys()))
-        save_to_s3(bucket_name, config.DISCARDED_FILE, list(discarded_set))
-        save_to_s3(bucket_name, config.NOTRELEASED_FILE, list(notreleased_set))
-        save_metadata_index(bucket_name, metadata)
-        save_to_s3(bucket_name, 'manifest.json', manifest)
+        checkpoint()
         if isinstance(e, (KeyboardInterrupt, SystemExit)):
             raise
         else:
             Log(config.ERROR, f"An error occurred: {str(e)}")
-
-    # Save remaining data and finalize
-    if chunk:
-        manifest = save_chunk_to_s3(bucket_name, chunk, manifest)
-        metadata = update_metadata_index(metadata, set(chunk.keys()))
+    finally:
+        if time_budget is not None:
+            set_deadline(None)
 
     ProgressLog('Scraping', total, total, start_time)
     print('\r')
-    Log(config.INFO, f'Scrape completed: {gamesAdded} new games added, {gamesNotReleased} not released, {gamesdiscarded} discarded')
-    save_to_s3(bucket_name, config.DISCARDED_FILE, list(discarded_set))
-    save_to_s3(bucket_name, config.NOTRELEASED_FILE, list(notreleased_set))
-    save_metadata_index(bucket_name, metadata)
-    merge_chunks(bucket_name, config.UPDATE_OUTFILE)
+    Log(config.INFO, f'Scrape completed: {gamesAdded} new games added, {gamesUnchanged} unchanged, {gamesNotReleased} not released, {gamesdiscarded} discarded, {gamesFailed} failed')
+    for stage, stats in pipeline.stats().items():
+        Log(config.INFO, f'{stage} stage: {stats["items"]} items on {stats["workers"]} worker(s), {stats["utilization"]:.0%} utilization')
+    for host, stats in retry_stats().items():
+        Log(config.INFO, f'{host}: {stats["requests"]} requests, {stats["retries"]} retries ({stats["retry_budget_used"]:.1%} of the {config.RETRY_BUDGET:.0%} retry budget), circuit {stats["circuit"]}')
+    checkpoint()
+    uploader.close()
+    summary = {
+        'added': gamesAdded,
+        'unchanged': gamesUnchanged,
+        'not_released': gamesNotReleased,
+        'discarded': gamesdiscarded,
+        'failed': gamesFailed,
+        'finished': progress.done,
+        'remaining': len(pending),
+        'complete': not pending,
+    }
+    Log(config.INFO, f'{summary["finished"]} apps finished in {time.monotonic() - started:.1f} seconds, {summary["remaining"]} remaining')
+    if not shard and (summary['complete'] or time_budget is None):
+        merge_chunks(bucket_name, config.UPDATE_OUTFILE)
+    elif not shard:
+        Log(config.INFO, 'Time budget used up, the chunks are merged once every app is scraped')
+    return summary
 
-if __name__ == "__main__":
-    Log(config.INFO, f'Steam Games Scraper {__version__} by {__author__}')
-  
+def configure(args):
+    """
+    Apply the command line arguments to the request layer: environment, connection
+    pool size, rate limits and response cache.
+    """
+    load_env()
+    set_pool_size(args.concurrency)
+    set_rate_limit('store.steampowered.com', args.store_rate, config.RATE_LIMITS['store.steampowered.com'][1])
+    set_rate_limit('steamspy.com', args.steamspy_rate, config.RATE_LIMITS['steamspy.com'][1])
+    if args.cache or args.replay:
+        set_cache(ResponseCache(args.cache_dir, args.cache_ttl), replay=args.replay)
+
+def build_parser():
+    """
+    Return the parser of the command line arguments.
+    """
     parser = argparse.ArgumentParser(description='Steam games scraper.')
     parser.add_argument('-s', '--sleep',    type=float, default=config.DEFAULT_SLEEP,    help='Waiting time between requests')
     parser.add_argument('-r', '--retries',  type=int,   default=config.DEFAULT_RETRIES,  help='Number of retries (0 to always retry)')
     parser.add_argument('-d', '--released', type=bool,  default=True,             help='If it is on the list of not yet released, no information is requested')
     parser.add_argument('-p', '--steamspy', type=bool,  default=True,             help='Add SteamSpy info')
     parser.add_argument('-b', '--bucket',   type=str,   default='testbucketx11',  help='S3 bucket name')
-    parser.add_argument('-c', '--chunk_size', type=int, default=2000,             help='Size of chunks for processing')
+    parser.add_argument('-c', '--chunk_size', type=int, default=2000,             help='Maximum number of records per chunk')
+    parser.add_argument('--chunk-bytes', type=int,  default=config.CHUNK_MAX_BYTES, help='Serialized size in bytes at which a chunk is uploaded')
+    parser.add_argument('--no-prefetch', dest='prefetch', action='store_false', help='Request SteamSpy data per app instead of prefetching the bulk listing')
+    parser.add_argument('--fields',     type=parse_fields, default=config.OUTPUT_FIELDS, help="Output schema: 'all', a preset of config.FIELD_PRESETS (e.g. 'analytics') or comma-separated fields")
+    parser.add_argument('--tags',       action='store_true', help='Request SteamSpy tags, which are not in the bulk listing (one SteamSpy request per app; implied when --fields lists tags)')
+    parser.add_argument('-n', '--concurrency', type=int, default=config.DEFAULT_CONCURRENCY, help='Number of apps processed concurrently')
+    parser.add_argument('--parse-workers', type=int, default=config.PARSE_WORKERS, help='Processes parsing responses (0 to parse on a thread, default one per CPU)')
+    parser.add_argument('--prices',     action='store_true', help='Only refresh the prices of scraped games, in every region of --currencies')
+    parser.add_argument('--currencies', type=str, default=','.join(config.PRICE_CURRENCIES), help='Comma-separated Steam country codes for --prices')
+    parser.add_argument('--cache',      action='store_true', help='Keep raw Steam and SteamSpy responses in an on-disk cache')
+    parser.add_argument('--cache-dir',  type=str,   default=config.CACHE_DIR,     help='Directory of the response cache')
+    parser.add_argument('--cache-ttl',  type=float, default=config.CACHE_TTL,     help='Seconds before a cached response is fetched again')
+    parser.add_argument('--replay',     action='store_true', help='Rebuild the dataset from the response cache without any API requests')
+    parser.add_argument('--refresh',    action='store_true', help='Also fetch scraped games again if they changed upstream or are older than --max-age')
+    parser.add_argument('--max-requests', type=int, default=None, help='Stop starting new apps after this many API requests')
+    parser.add_argument('--max-time',   type=float, default=None, help='Stop starting new apps after this many seconds')
+    parser.add_argument('--time-budget', type=float, default=None, help='Seconds the run must end within: stop early, checkpoint and skip the merge if unfinished')
+    parser.add_argument('--max-age',    type=float, default=config.REFRESH_MAX_AGE_DAYS, help='Age in days after which --refresh fetches a game again')
+    parser.add_argument('--shard',      type=parse_shard, default=None, help='Only scrape shard i of N (i/N), writing under shards/i-of-N/')
+    parser.add_argument('--merge-shards', type=int, default=None, metavar='N', help='Merge the output of an N-way sharded scrape and exit')
+    parser.add_argument('--store-rate',   type=float, default=config.RATE_LIMITS['store.steampowered.com'][0], help='Steam store requests per second')
+    parser.add_argument('--steamspy-rate', type=float, default=config.RATE_LIMITS['steamspy.com'][0], help='SteamSpy requests per second')
+    parser.add_argument('--metrics-port', type=int, default=config.METRICS_PORT, help='Port of the Prometheus metrics endpoint (0 to disable)')
+    parser.add_argument('--metrics-file', type=str, default=config.METRICS_FILE, help="File the metrics are written to on exit ('' to disable)")
+    return parser
+
+if __name__ == "__main__":
+    Log(config.INFO, f'Steam Games Scraper {__version__} by {__author__}')
+  
+    parser = build_parser()
     args = parser.parse_args()
     random.seed(time.time())
 
@@ -253,12 +605,33 @@ if __name__ == "__main__":
         parser.print_help()
         sys.exit()
     
+    if args.metrics_port:
+        try:
+            metrics.serve(args.metrics_port)
+        except OSError as ex:
+            Log(config.WARNING, f'Metrics endpoint not started on port {args.metrics_port}: {ex}')
+    if args.metrics_file:
+        atexit.register(metrics.dump, args.metrics_file)
+
     bucket_name = args.bucket
+    configure(args)
+
+    if args.merge_shards:
+        merge_shards(bucket_name, args.merge_shards)
+        merge_chunks(bucket_name, config.UPDATE_OUTFILE)
+        Log(config.INFO, 'Done')
+        sys.exit()
 
     # Load metadata index and sets
     metadata = load_metadata_index(bucket_name)
-    discarded = set(load_from_s3(bucket_name, config.DISCARDED_FILE) or [])
-    notreleased = set(load_from_s3(bucket_name, config.NOTRELEASED_FILE) or [])
+
+    if args.prices:
+        refresh_prices(bucket_name, metadata, args.currencies.split(','), retries=args.retries, concurrency=args.concurrency)
+        Log(config.INFO, 'Done')
+        sys.exit()
+
+    discarded = load_app_ids(bucket_name, config.DISCARDED_FILE)
+    notreleased = load_app_ids(bucket_name, config.NOTRELEASED_FILE)
 
     # Log initial information
     Log(config.INFO, f'Metadata index loaded with {len(metadata)} entries')
@@ -269,7 +642,8 @@ if __name__ == "__main__":
         Scraper(None, notreleased, discarded, args)
     except (KeyboardInterrupt, SystemExit):
         Log(config.INFO, 'Scraping interrupted. Progress saved.')
-    finally:
-        merge_chunks(bucket_name, config.UPDATE_OUTFILE)
+        # Scraper only merges the chunks when it completes
+        if not args.shard:
+            merge_chunks(bucket_name, config.UPDATE_OUTFILE)
         
     Log(config.INFO, 'Done')
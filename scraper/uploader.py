@@ -0,0 +1,174 @@
+import json
+import queue
+import threading
+import time
+import msgspec
+import config
+from utils import save_bytes_to_s3, Log
+from metrics import timed, CHUNK_UPLOAD_SECONDS, CHUNK_BYTES, CHUNK_FLUSH_SECONDS
+
+_encoder = msgspec.json.Encoder()
+
+def EncodeRecord(game):
+    '''
+    Serialize a game record as compact UTF-8 JSON bytes.
+    '''
+    return _encoder.encode(game)
+
+def EncodeChunk(records):
+    '''
+    Join pre-serialized records into the JSON object of a chunk file.
+
+    :param records: Dict mapping appID to the record's JSON bytes.
+    '''
+    return b'{' + b','.join(json.dumps(appID).encode('utf-8') + b':' + data for appID, data in records.items()) + b'}'
+
+class ChunkBuffer:
+    '''
+    The chunk being filled by the scraper. Records are serialized as they are
+    added, so the buffer's size in bytes is known exactly and no large object
+    graph is kept in memory.
+
+    :param max_bytes: Size in bytes at which the chunk is considered full.
+    :param max_records: Number of records at which the chunk is considered full.
+    '''
+    def __init__(self, max_bytes=config.CHUNK_MAX_BYTES, max_records=None):
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.records = {}
+        self.size = 0
+
+    def add(self, appID, game):
+        data = EncodeRecord(game)
+        self.size += len(data) - len(self.records.get(appID, b''))
+        self.records[appID] = data
+
+    def keys(self):
+        return self.records.keys()
+
+    def full(self):
+        return self.size >= self.max_bytes or (self.max_records is not None and len(self.records) >= self.max_records)
+
+    def take(self):
+        '''
+        Return the buffered records and start an empty chunk.
+        '''
+        records, self.records, self.size = self.records, {}, 0
+        return records
+
+    def clear(self):
+        self.take()
+
+    def __len__(self):
+        return len(self.records)
+
+class UploadError(Exception):
+    '''
+    Raised when a chunk or journal segment could not be uploaded, so that the
+    progress depending on it is not committed.
+    '''
+
+class ChunkUploader:
+    '''
+    Uploads chunks to S3 from a background thread so that the scrape never waits
+    for S3. At most `max_pending` chunks wait in the queue; when uploads fall
+    further behind, save_chunk blocks, which holds back the scrape and keeps
+    memory bounded.
+
+    A failed upload is retried config.UPLOAD_RETRIES times with exponential
+    backoff. If it still fails, nothing queued after it is uploaded either, as
+    a journal segment must never be saved without the chunks it refers to, and
+    the next call to save_chunk, save_bytes, flush or close raises UploadError.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param max_pending: Number of chunks that can wait for upload.
+    '''
+    def __init__(self, bucket_name, max_pending=config.UPLOAD_QUEUE_SIZE):
+        self.bucket_name = bucket_name
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.uploaded = 0
+        self.failed = []
+        self.thread = threading.Thread(target=self._run, name='chunk-uploader', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                key, data = item
+                if self.failed:
+                    Log(config.WARNING, f'Not uploading {key} after the failed upload of {self.failed[0]}')
+                    self.failed.append(key)
+                    continue
+                data = data if isinstance(data, bytes) else EncodeChunk(data)
+                with timed(CHUNK_UPLOAD_SECONDS):
+                    saved = self._upload(key, data)
+                if saved:
+                    CHUNK_BYTES.inc(len(data))
+                    self.uploaded += 1
+                else:
+                    Log(config.ERROR, f'Giving up on uploading {key} after {config.UPLOAD_RETRIES + 1} attempts')
+                    self.failed.append(key)
+            except Exception as e:
+                Log(config.ERROR, f'Error uploading chunk: {e}')
+                self.failed.append(key)
+            finally:
+                self.queue.task_done()
+
+    def _upload(self, key, data):
+        for attempt in range(config.UPLOAD_RETRIES + 1):
+            if attempt:
+                delay = config.UPLOAD_BACKOFF * 2 ** (attempt - 1)
+                Log(config.WARNING, f'Upload of {key} failed, retrying in {delay} seconds')
+                time.sleep(delay)
+            if save_bytes_to_s3(self.bucket_name, key, data):
+                return True
+        return False
+
+    def _check(self):
+        if self.failed:
+            raise UploadError(f'{len(self.failed)} upload(s) not saved, starting with {self.failed[0]}')
+
+    def save_chunk(self, chunk, manifest, prefix=''):
+        '''
+        Queue the content of a ChunkBuffer for upload and add it to the manifest,
+        with the same naming as save_chunk_to_s3. The buffer is emptied.
+
+        :return: The updated manifest.
+        '''
+        self._check()
+        chunk_key = f'{prefix}chunk_{len(manifest["chunks"]) + 1}.json'
+        with timed(CHUNK_FLUSH_SECONDS):
+            self.queue.put((chunk_key, chunk.take()))
+        manifest['chunks'].append(chunk_key)
+        Log(config.INFO, f'Queued chunk {chunk_key} for upload')
+        return manifest
+
+    def save_bytes(self, key, data):
+        '''
+        Queue already serialized data for upload. Uploads happen in queue order,
+        so the data is saved after every chunk queued before it.
+        '''
+        self._check()
+        self.queue.put((key, data))
+
+    def flush(self):
+        '''
+        Wait until every queued chunk has been uploaded.
+
+        :raises UploadError: If an upload failed.
+        '''
+        self.queue.join()
+        self._check()
+
+    def close(self):
+        '''
+        Upload the remaining chunks and stop the background thread.
+
+        :raises UploadError: If an upload failed.
+        '''
+        self.queue.put(None)
+        self.thread.join()
+        self._check()
@@ -1,13 +1,18 @@
 import json
-import boto3
-from botocore.exceptions import ClientError
+import hashlib
+import html
 import logging
 import re
 import config
 import datetime as dt
 import io
 import os
-from dotenv import load_dotenv
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from appidset import AppIDSet
 
 # Initialize logging
 logging.basicConfig(
@@ -16,27 +21,83 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+_env_loaded = False
 
-# Get AWS credentials from environment variables
-aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+def load_env():
+    '''
+    Load the environment variables in .env, once. Called before the first S3 client
+    is built and by the entry points, instead of at import time.
+    '''
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
-# Initialize S3 client
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=aws_access_key_id,
-    aws_secret_access_key=aws_secret_access_key
-)
+class LazyS3Client:
+    '''
+    Stand-in for the boto3 S3 client that imports boto3 and builds the client on
+    first use, so importing this module (in parse workers, or in a Lambda cold
+    start before any S3 call) does not pay for it.
+    '''
+    def __init__(self):
+        self.client = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.client is None:
+                import boto3
+                load_env()
+                # Get AWS credentials from environment variables
+                self.client = boto3.client(
+                    's3',
+                    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
+                )
+            return self.client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+s3_client = LazyS3Client()
+
+def s3_error_code(error):
+    '''
+    Return the error code of a botocore ClientError, or None for other exceptions.
+    '''
+    response = getattr(error, 'response', None)
+    return response.get('Error', {}).get('Code') if isinstance(response, dict) else None
 
 def save_to_s3(bucket_name, key, data):
+    '''
+    Save data to S3 as JSON.
+
+    :return: True if the object was saved, False if the upload failed.
+    '''
     try:
         with io.BytesIO(json.dumps(data, indent=4).encode('utf-8')) as file_obj:
             s3_client.upload_fileobj(file_obj, bucket_name, key)
         logger.info(f'Successfully saved {key} to S3.')
+        return True
     except Exception as e:
         logger.error(f'Error saving to S3: {e}')
+        return False
+
+def save_bytes_to_s3(bucket_name, key, data):
+    '''
+    Save raw bytes to S3, for data that is already serialized.
+
+    :return: True if the object was saved, False if the upload failed.
+    '''
+    try:
+        with io.BytesIO(data) as file_obj:
+            s3_client.upload_fileobj(file_obj, bucket_name, key)
+        logger.info(f'Successfully saved {key} to S3.')
+        return True
+    except Exception as e:
+        logger.error(f'Error saving to S3: {e}')
+        return False
 
 def load_from_s3(bucket_name, key):
     try:
@@ -45,69 +106,239 @@ def load_from_s3(bucket_name, key):
             file_obj.seek(0)  # Reset file pointer to the beginning
             data = file_obj.getvalue().decode('utf-8')
             return json.loads(data)
-    except ClientError as e:
-        if e.response['Error']['Code'] == 'NoSuchKey':
-            logger.info(f"No such key: {key}")  # Debug log
-            return None
-        else:
-            logger.error(f'Error loading from S3: {e}')
-            return None
     except json.JSONDecodeError as e:
         logger.error(f'Error decoding JSON from S3: {e}')
         return None
     except Exception as e:
-        logger.error(f'Unexpected error loading from S3: {e}')
+        code = s3_error_code(e)
+        if code == 'NoSuchKey':
+            logger.info(f"No such key: {key}")  # Debug log
+        elif code:
+            logger.error(f'Error loading from S3: {e}')
+        else:
+            logger.error(f'Unexpected error loading from S3: {e}')
+        return None
+
+def load_bytes_from_s3(bucket_name, key):
+    '''
+    Load raw bytes from S3.
+
+    :return: The content of the object, or None if it does not exist or cannot be read.
+    '''
+    try:
+        with io.BytesIO() as file_obj:
+            s3_client.download_fileobj(bucket_name, key, file_obj)
+            return file_obj.getvalue()
+    except Exception as e:
+        code = s3_error_code(e)
+        if code in ('NoSuchKey', '404'):
+            logger.info(f"No such key: {key}")
+        elif code:
+            logger.error(f'Error loading from S3: {e}')
+        else:
+            logger.error(f'Unexpected error loading from S3: {e}')
         return None
 
-def save_chunk_to_s3(bucket_name, chunk, manifest):
+def list_s3_keys(bucket_name, prefix):
+    '''
+    List the keys of the objects under a prefix, in key order.
+    '''
+    keys = []
+    try:
+        for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=prefix):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+    except Exception as e:
+        logger.error(f'Error listing {prefix} in S3: {e}')
+    return sorted(keys)
+
+def delete_from_s3(bucket_name, keys):
+    '''
+    Delete objects from S3, in batches of 1000 keys.
+    '''
+    keys = list(keys)
+    try:
+        for start in range(0, len(keys), 1000):
+            s3_client.delete_objects(Bucket=bucket_name, Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True})
+        logger.info(f'Deleted {len(keys)} object(s) from S3.')
+    except Exception as e:
+        logger.error(f'Error deleting from S3: {e}')
+
+def app_ids_key(key):
+    '''
+    Return the key of the binary AppIDSet saved in place of a JSON appID list.
+    '''
+    return os.path.splitext(key)[0] + config.APPID_SET_EXTENSION
+
+def load_app_ids(bucket_name, key):
+    '''
+    Load a set of appIDs saved by save_app_ids. If there is no binary file yet,
+    the JSON list of appIDs under `key` is read instead.
+
+    :param key: Key of the JSON list, e.g. config.DISCARDED_FILE.
+    :return: An AppIDSet, empty if neither file exists.
+    '''
+    data = load_bytes_from_s3(bucket_name, app_ids_key(key))
+    if data is not None:
+        try:
+            return AppIDSet.from_bytes(data)
+        except (ValueError, zlib.error) as e:
+            logger.error(f'Error decoding {app_ids_key(key)}: {e}')
+    try:
+        return AppIDSet(load_from_s3(bucket_name, key) or [])
+    except (TypeError, ValueError) as e:
+        logger.error(f'Error loading {key}: {e}')
+        return AppIDSet()
+
+def save_app_ids(bucket_name, key, app_ids):
+    '''
+    Save a set of appIDs to S3 as a binary AppIDSet, next to the JSON key it replaces.
+
+    :param key: Key of the JSON list, e.g. config.DISCARDED_FILE.
+    :param app_ids: Iterable of appIDs.
+    :return: True if the set was saved.
+    '''
+    if not isinstance(app_ids, AppIDSet):
+        app_ids = AppIDSet(app_ids)
+    return save_bytes_to_s3(bucket_name, app_ids_key(key), app_ids.to_bytes())
+
+def save_chunk_to_s3(bucket_name, chunk, manifest, prefix=''):
     '''
     Save a chunk of scraped data to S3 and update the manifest accordingly.
 
     :param bucket_name: The name of the S3 bucket.
     :param chunk: The chunk of scraped data to save.
     :param manifest: The current manifest of chunks.
+    :param prefix: Key prefix of the chunk, e.g. a shard's namespace.
     :return: The updated manifest.
     '''
     chunk_index = len(manifest['chunks']) + 1
-    chunk_key = f'chunk_{chunk_index}.json'
+    chunk_key = f'{prefix}chunk_{chunk_index}.json'
     save_to_s3(bucket_name, chunk_key, chunk)
     manifest['chunks'].append(chunk_key)
     logger.info(f'Successfully saved chunk to {chunk_key}.')
     return manifest
 
-def merge_chunks(bucket_name, output_file):
+class MultipartWriter:
+    '''
+    Streams bytes to an S3 object. Data is buffered until a part of `part_size`
+    bytes is ready and then sent with upload_part, so only one part is held in
+    memory. Output smaller than one part is saved with a single put_object.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param key: The key of the object to write.
+    :param part_size: Size of the uploaded parts (S3 requires at least 5 MB).
+    '''
+    def __init__(self, bucket_name, key, part_size=config.MULTIPART_PART_SIZE):
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = s3_client.create_multipart_upload(Bucket=self.bucket_name, Key=self.key)['UploadId']
+        number = len(self.parts) + 1
+        response = s3_client.upload_part(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id,
+                                         PartNumber=number, Body=bytes(self.buffer))
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': number})
+        self.buffer.clear()
+
+    def close(self):
+        '''
+        Upload the remaining data and complete the object.
+        '''
+        if self.upload_id is None:
+            s3_client.put_object(Bucket=self.bucket_name, Key=self.key, Body=bytes(self.buffer))
+        else:
+            if self.buffer:
+                self._upload_part()
+            s3_client.complete_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id,
+                                                MultipartUpload={'Parts': self.parts})
+        self.buffer.clear()
+
+    def abort(self):
+        '''
+        Discard the parts uploaded so far.
+        '''
+        if self.upload_id is not None:
+            s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+        self.buffer.clear()
+
+def merge_chunks(bucket_name, output_file, workers=config.MERGE_WORKERS, part_size=config.MULTIPART_PART_SIZE):
     '''
     Merge all chunks of scraped data stored in S3 into a single file.
 
+    The chunks are downloaded in parallel, at most `workers` ahead of the one
+    being written, and the output is streamed to S3 with a multipart upload, so
+    memory use does not grow with the dataset. Chunks are read from the last to
+    the first and only the first record seen for each AppID is written, so a
+    record in a later chunk replaces the same AppID in an earlier one.
+
     :param bucket_name: The name of the S3 bucket.
     :param output_file: The key under which to save the merged data.
+    :param workers: Number of chunks downloaded at the same time.
+    :param part_size: Size of the multipart upload parts.
     '''
-    manifest = load_from_s3(bucket_name, 'manifest.json')
-    if manifest and manifest['chunks']:
-        all_data = {}
-        for chunk_key in manifest['chunks']:
-            chunk_data = load_from_s3(bucket_name, chunk_key)
-            if chunk_data:
-                all_data.update(chunk_data)
-        
-        if all_data:  # Only save if there's data to save
-            save_to_s3(bucket_name, output_file, all_data)
-            logger.info(f'Merged {len(manifest["chunks"])} chunk(s) into {output_file}.')
-        else:
-            logger.warning('No data found in chunks. No merged file created.')
-    else:
+    manifest = load_from_s3(bucket_name, config.MANIFEST_FILE)
+    if not manifest or not manifest['chunks']:
         logger.warning('No chunks found in manifest. No merged file created.')
+        return
+
+    writer = MultipartWriter(bucket_name, output_file, part_size)
+    seen = set()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            keys = iter(reversed(manifest['chunks']))
+            window = deque(executor.submit(load_from_s3, bucket_name, key) for key in islice(keys, workers))
+            while window:
+                chunk_data = window.popleft().result()
+                for key in islice(keys, 1):
+                    window.append(executor.submit(load_from_s3, bucket_name, key))
+                for appID, game in (chunk_data or {}).items():
+                    if appID in seen:
+                        continue
+                    # Same layout as json.dumps(all_data, indent=4), one record at a time
+                    record = json.dumps(game, indent=4).replace('\n', '\n    ')
+                    writer.write(f'{"," if seen else "{"}\n    {json.dumps(appID)}: {record}'.encode('utf-8'))
+                    seen.add(appID)
+
+        if not seen:  # Only save if there's data to save
+            writer.abort()
+            logger.warning('No data found in chunks. No merged file created.')
+            return
+        writer.write(b'\n}')
+        writer.close()
+        logger.info(f'Merged {len(manifest["chunks"])} chunk(s) with {len(seen)} apps into {output_file}.')
+    except Exception as e:
+        writer.abort()
+        logger.error(f'Error merging chunks into {output_file}: {e}')
+
+HTML_TAG_RE = re.compile('<[^<]+?>')
 
 def SanitizeText(text):
     '''
-    Remove HTML tags and excessive whitespace from a given string.
+    Remove HTML tags and excessive whitespace from a given string, and decode
+    HTML entities.
+
+    Tags are removed in one precompiled regex pass; whitespace is collapsed by
+    str.split, which splits on the same whitespace characters as the regex did,
+    without a second regex pass. Entities are only decoded when there can be one.
     
     :param text: The string to sanitize.
     :return: The sanitized string.
     '''
     if text:
-        text = re.sub('<[^<]+?>', '', text)
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = HTML_TAG_RE.sub('', text)
+        if '&' in text:
+            text = html.unescape(text)
+        text = ' '.join(text.split())
     return text
 
 def Log(level, message):
@@ -117,10 +348,12 @@ def Log(level, message):
 def ProgressLog(title, count, total, start_time):
     elapsed_time = dt.datetime.now() - start_time
     elapsed_str = str(elapsed_time).split('.')[0]
-    percents = round(100.0 * count / float(total), 2)
+    percents = round(100.0 * count / float(total), 2) if total > 0 else 100.0
     
     Log(config.INFO, f"{title} - {percents:.2f}% completed ({count}/{total}) - Elapsed time: {elapsed_str}")
 
+PRICE_RE = re.compile(r'[^\d.]')
+
 def PriceToFloat(price_str):
     '''
     Converts a Steam price string into a float.
@@ -129,37 +362,32 @@ def PriceToFloat(price_str):
     :return: The price as a float, or 0.0 if the conversion fails.
     '''
     try:
-        return float(re.sub(r'[^\d.]', '', price_str))
+        return float(PRICE_RE.sub('', price_str))
     except ValueError:
         return 0.0
 
 # New functions for metadata index management
 
-def load_metadata_index(bucket_name):
+def load_metadata_index(bucket_name, prefix=''):
     '''
     Loads the metadata index from S3 as a set of appIDs.
     
     :param bucket_name: The name of the S3 bucket to load the metadata index from.
-    :return: The set of appIDs in the metadata index, or an empty set if the index is not present.
+    :param prefix: Key prefix of the index, e.g. a shard's namespace.
+    :return: The AppIDSet of appIDs in the metadata index, or an empty set if the index is not present.
     '''
-    try:
-        metadata = load_from_s3(bucket_name, config.METADATA_FILE)
-        return set(metadata) if metadata else set()
-    except Exception as e:
-        logger.error(f'Error loading metadata index: {e}')
-        return set()
+    return load_app_ids(bucket_name, prefix + config.METADATA_FILE)
 
-def save_metadata_index(bucket_name, metadata):
+def save_metadata_index(bucket_name, metadata, prefix=''):
     '''
-    Saves the metadata index to S3 as a JSON list of appIDs.
+    Saves the metadata index to S3 as a binary AppIDSet.
     
     :param bucket_name: The name of the S3 bucket to save the metadata index to.
     :param metadata: The metadata index to save, as a set of appIDs.
+    :param prefix: Key prefix of the index, e.g. a shard's namespace.
+    :return: True if the index was saved.
     '''
-    try:
-        save_to_s3(bucket_name, config.METADATA_FILE, list(metadata))
-    except Exception as e:
-        logger.error(f'Error saving metadata index: {e}')
+    return save_app_ids(bucket_name, prefix + config.METADATA_FILE, metadata)
 
 def update_metadata_index(metadata, new_app_ids):
     '''
@@ -168,3 +396,86 @@ def update_metadata_index(metadata, new_app_ids):
 
     metadata.update(new_app_ids)
     return metadata
+
+# Per-app state index: when each app was scraped, the upstream change time it was
+# scraped at and a hash of the parsed record
+
+def load_app_state(bucket_name, prefix=''):
+    '''
+    Loads the per-app state index from S3.
+
+    :param bucket_name: The name of the S3 bucket to load the state index from.
+    :param prefix: Key prefix of the index, e.g. a shard's namespace.
+    :return: Dict mapping appID to {'scraped_at', 'last_modified', 'hash'}, or an empty dict if the index is not present.
+    '''
+    return load_from_s3(bucket_name, prefix + config.STATE_FILE) or {}
+
+def save_app_state(bucket_name, state, prefix=''):
+    '''
+    Saves the per-app state index to S3.
+
+    :return: True if the index was saved.
+    '''
+    return save_to_s3(bucket_name, prefix + config.STATE_FILE, state)
+
+def RecordHash(game):
+    '''
+    Return a short content hash of a parsed game record, independent of key order.
+    '''
+    return hashlib.sha1(json.dumps(game, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def update_app_state(state, appID, scraped_at, last_modified=None, record_hash=None, signals=None):
+    '''
+    Record that an app was scraped. The upstream change time and hash are kept
+    from the previous entry when not given.
+
+    :param signals: Scheduling signals to store in the entry, e.g. peak_ccu or expected_release.
+    :return: The updated entry.
+    '''
+    entry = state.setdefault(appID, {})
+    entry.update(signals or {})
+    entry['scraped_at'] = int(scraped_at)
+    if last_modified is not None:
+        entry['last_modified'] = int(last_modified)
+    if record_hash is not None:
+        entry['hash'] = record_hash
+    return entry
+
+def seed_app_state(metadata, state, modified, now):
+    '''
+    Add a state entry, scraped at `now`, for every scraped app that has none, e.g.
+    apps scraped before the state index existed. Their data is taken as current
+    until it ages out or changes upstream, rather than re-scraping them all at once.
+
+    :param metadata: AppIDs already scraped.
+    :param state: The per-app state index, updated in place.
+    :param modified: Dict mapping appID to its upstream last_modified time (may be empty).
+    :param now: Current time as a Unix timestamp.
+    :return: The number of entries added.
+    '''
+    missing = [appID for appID in metadata if 'scraped_at' not in state.get(appID, {})]
+    for appID in missing:
+        update_app_state(state, appID, now, modified.get(appID))
+    return len(missing)
+
+def stale_apps(metadata, state, modified, max_age, now):
+    '''
+    Return the scraped apps that should be fetched again: apps changed upstream
+    since they were scraped, apps scraped more than `max_age` seconds ago, and
+    apps with no recorded scrape time (see seed_app_state). Apps scraped without
+    a known upstream change time are only refreshed by age.
+
+    :param metadata: AppIDs already scraped.
+    :param state: The per-app state index.
+    :param modified: Dict mapping appID to its upstream last_modified time (may be empty).
+    :param max_age: Maximum age of scraped data in seconds.
+    :param now: Current time as a Unix timestamp.
+    '''
+    stale = []
+    for appID in metadata:
+        entry = state.get(appID)
+        if (not entry or 'scraped_at' not in entry
+                or ('last_modified' in entry and modified.get(appID, 0) > entry['last_modified'])
+                or now - entry['scraped_at'] > max_age):
+            stale.append(appID)
+    return stale
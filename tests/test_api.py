@@ -6,8 +6,14 @@ import os
 # Add the src directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 
-from api import DoRequest, SteamRequest, SteamSpyRequest, ParseSteamGame
+from api import DoRequest, SteamRequest, SteamSpyRequest, SteamSpyPageRequest, PriceRequest, ParseSteamGame, ExpectedReleaseDate, get_session, RetriesExhausted, ParseRetryAfter, CacheMiss, set_cache, set_deadline
+from cache import ResponseCache
+import tempfile
+import json
+import time
+from datetime import datetime, timezone
 import config
+import metrics
 
 class TestAPI(unittest.TestCase):
 
@@ -19,10 +25,11 @@ class TestAPI(unittest.TestCase):
         # Clean up after each test
         pass
 
-    @patch('api.requests.get')
-    def test_do_request_success(self, mock_get):
+    @patch('api.get_session')
+    def test_do_request_success(self, mock_get_session):
         mock_response = MagicMock()
         mock_response.status_code = 200
+        mock_get = mock_get_session.return_value.get
         mock_get.return_value = mock_response
 
         url = 'https://example.com'
@@ -31,13 +38,14 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(result, mock_response)
         mock_get.assert_called_once_with(url=url, params=None, timeout=config.DEFAULT_TIMEOUT, allow_redirects=True, headers=None)
 
-    @patch('api.requests.get')
+    @patch('api.get_session')
     @patch('api.time.sleep')
-    def test_do_request_retry(self, mock_sleep, mock_get):
+    def test_do_request_retry(self, mock_sleep, mock_get_session):
         mock_response_fail = MagicMock()
         mock_response_fail.status_code = 500
         mock_response_success = MagicMock()
         mock_response_success.status_code = 200
+        mock_get = mock_get_session.return_value.get
         mock_get.side_effect = [mock_response_fail, mock_response_success]
 
         url = 'https://example.com'
@@ -50,7 +58,7 @@ class TestAPI(unittest.TestCase):
     @patch('api.DoRequest')
     def test_steam_request_success(self, mock_do_request):
         mock_response = MagicMock()
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             '123': {
                 'success': True,
                 'data': {
@@ -60,13 +68,14 @@ class TestAPI(unittest.TestCase):
                     'developers': ['Test Developer']
                 }
             }
-        }
+        }).encode('utf-8')
         mock_do_request.return_value = mock_response
 
-        result = SteamRequest('123', 5, 0, 0, 3)
+        result = SteamRequest('123', 3)
 
         self.assertIsNotNone(result)
-        self.assertEqual(result['type'], 'game')
+        self.assertEqual(result.type, 'game')
+        self.assertEqual(result.price_overview.final_formatted, '$9.99')
 
     @patch('api.DoRequest')
     def test_steam_spy_request_success(self, mock_do_request):
@@ -75,11 +84,231 @@ class TestAPI(unittest.TestCase):
         mock_response.json.return_value = {"developer": "Test Developer"}
         mock_do_request.return_value = mock_response
 
-        result = SteamSpyRequest('123', 5, 0, 0, 3)
+        result = SteamSpyRequest('123', 3)
 
         self.assertIsNotNone(result)
         self.assertEqual(result['developer'], 'Test Developer')
 
+    @patch('api.DoRequest')
+    def test_price_request(self, mock_do_request):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            '10': {'success': True, 'data': {'price_overview': {'currency': 'USD', 'final': 999, 'discount_percent': 0}}},
+            '20': {'success': True, 'data': []},
+            '30': {'success': False},
+        }
+        mock_do_request.return_value = mock_response
+
+        result = PriceRequest(['10', '20', '30'], 'us', 3)
+
+        self.assertEqual(result, {'10': {'currency': 'USD', 'final': 999, 'discount_percent': 0}})
+        self.assertEqual(mock_do_request.call_args[0][1], {'appids': '10,20,30', 'cc': 'us', 'filters': 'price_overview'})
+
+    @patch('api.DoRequest')
+    def test_steam_spy_page_request(self, mock_do_request):
+        mock_response = MagicMock()
+        mock_response.text = '{"10": {"appid": 10}}'
+        mock_response.json.return_value = {"10": {"appid": 10}}
+        mock_do_request.return_value = mock_response
+
+        self.assertEqual(SteamSpyPageRequest(0, 3), {"10": {"appid": 10}})
+        self.assertEqual(mock_do_request.call_args[0][1], {"request": "all", "page": 0})
+
+        # Past the last page SteamSpy returns an empty body
+        mock_response.text = ''
+        self.assertEqual(SteamSpyPageRequest(99, 3), {})
+
+    def test_get_session_reused_per_host(self):
+        session = get_session('https://store.steampowered.com/api/appdetails/')
+        self.assertIs(session, get_session('https://store.steampowered.com/other'))
+        self.assertIsNot(session, get_session('https://steamspy.com/api.php'))
+
+    @patch('api.get_controller')
+    @patch('api.get_session')
+    @patch('api.time.sleep')
+    def test_do_request_reports_to_controller(self, mock_sleep, mock_get_session, mock_get_controller):
+        controller = mock_get_controller.return_value
+        controller.on_failure.return_value = 7
+        mock_response_fail = MagicMock()
+        mock_response_fail.status_code = 500
+        mock_response_success = MagicMock()
+        mock_response_success.status_code = 200
+        mock_get_session.return_value.get.side_effect = [mock_response_fail, mock_response_success]
+
+        DoRequest('https://steamspy.com/api.php')
+
+        self.assertEqual(controller.acquire.call_count, 2)
+        controller.on_failure.assert_called_once_with(None, 1)
+        controller.on_success.assert_called_once()
+        mock_sleep.assert_called_once_with(7)
+
+    @patch('api.get_controller')
+    @patch('api.get_session')
+    @patch('api.time.sleep')
+    def test_do_request_records_metrics(self, mock_sleep, mock_get_session, mock_get_controller):
+        mock_get_controller.return_value.on_failure.return_value = 3
+        mock_response_limited = MagicMock(status_code=429, headers={}, content=b'')
+        mock_response_success = MagicMock(status_code=200, content=b'{"ok": true}')
+        mock_get_session.return_value.get.side_effect = [mock_response_limited, mock_response_success]
+        host = 'metrics.example.com'
+        before = metrics.REQUEST_SECONDS.count(host=host, status=200)
+
+        DoRequest(f'https://{host}/api')
+
+        self.assertEqual(metrics.REQUEST_SECONDS.count(host=host, status=200), before + 1)
+        self.assertEqual(metrics.REQUEST_SECONDS.count(host=host, status=429), 1)
+        self.assertEqual(metrics.RATE_LIMITED.get(host=host), 1)
+        self.assertEqual(metrics.RETRIES.get(host=host), 1)
+        self.assertEqual(metrics.BACKOFF_SECONDS.get(host=host), 3)
+        self.assertEqual(metrics.RESPONSE_BYTES.get(host=host), len(b'{"ok": true}'))
+
+    @patch('api.get_controller')
+    @patch('api.get_session')
+    @patch('api.time.sleep')
+    def test_do_request_retries_exhausted(self, mock_sleep, mock_get_session, mock_get_controller):
+        mock_get_controller.return_value.on_failure.return_value = 1
+        mock_response_fail = MagicMock()
+        mock_response_fail.status_code = 500
+        mock_get_session.return_value.get.return_value = mock_response_fail
+
+        with self.assertRaises(RetriesExhausted):
+            DoRequest('https://example.com', retries=3)
+        self.assertEqual(mock_get_session.return_value.get.call_count, 4)
+        self.assertEqual(mock_sleep.call_count, 3)
+
+    @patch('api.get_controller')
+    @patch('api.get_session')
+    @patch('api.time.sleep')
+    def test_do_request_gives_up_at_deadline(self, mock_sleep, mock_get_session, mock_get_controller):
+        mock_get_controller.return_value.on_failure.return_value = 30
+        mock_response_fail = MagicMock()
+        mock_response_fail.status_code = 500
+        mock_get_session.return_value.get.return_value = mock_response_fail
+
+        set_deadline(time.monotonic() + 10)
+        try:
+            with self.assertRaises(RetriesExhausted):
+                DoRequest('https://example.com', retries=0)
+        finally:
+            set_deadline(None)
+        self.assertEqual(mock_get_session.return_value.get.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    @patch('api.get_controller')
+    @patch('api.get_session')
+    def test_do_request_gives_up_when_host_paused_past_deadline(self, mock_get_session, mock_get_controller):
+        mock_get_controller.return_value.acquire.return_value = False
+        deadline = time.monotonic() + 10
+        set_deadline(deadline)
+        try:
+            with self.assertRaises(RetriesExhausted):
+                DoRequest('https://example.com')
+        finally:
+            set_deadline(None)
+        mock_get_controller.return_value.acquire.assert_called_once_with(deadline)
+        mock_get_session.return_value.get.assert_not_called()
+
+    @patch('api.get_controller')
+    @patch('api.get_session')
+    @patch('api.time.sleep')
+    def test_do_request_retries_without_recursion(self, mock_sleep, mock_get_session, mock_get_controller):
+        mock_get_controller.return_value.on_failure.return_value = 1
+        mock_response_fail = MagicMock()
+        mock_response_fail.status_code = 500
+        mock_response_success = MagicMock()
+        mock_response_success.status_code = 200
+        failures = sys.getrecursionlimit() + 10
+        mock_get_session.return_value.get.side_effect = [mock_response_fail] * failures + [mock_response_success]
+
+        self.assertEqual(DoRequest('https://example.com', retries=0), mock_response_success)
+        self.assertEqual(mock_sleep.call_count, failures)
+
+    @patch('api.get_controller')
+    @patch('api.get_session')
+    @patch('api.time.sleep')
+    def test_do_request_honours_retry_after(self, mock_sleep, mock_get_session, mock_get_controller):
+        controller = mock_get_controller.return_value
+        controller.on_failure.return_value = 1
+        mock_response_limited = MagicMock()
+        mock_response_limited.status_code = 429
+        mock_response_limited.headers = {'Retry-After': '120'}
+        mock_response_success = MagicMock()
+        mock_response_success.status_code = 200
+        mock_get_session.return_value.get.side_effect = [mock_response_limited, mock_response_success]
+
+        DoRequest('https://store.steampowered.com/api/appdetails/')
+        controller.on_failure.assert_called_once_with(120.0, 1)
+
+    def test_parse_retry_after(self):
+        response = MagicMock()
+        response.headers = {'Retry-After': '30'}
+        self.assertEqual(ParseRetryAfter(response), 30.0)
+        response.headers = {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+        self.assertEqual(ParseRetryAfter(response), 0.0)
+        response.headers = {}
+        self.assertIsNone(ParseRetryAfter(response))
+
+    @patch('api.get_controller')
+    @patch('api.get_session')
+    @patch('api.time.sleep')
+    def test_steam_spy_too_many_connections_is_retried(self, mock_sleep, mock_get_session, mock_get_controller):
+        mock_get_controller.return_value.on_failure.return_value = 1
+        mock_response_busy = MagicMock()
+        mock_response_busy.status_code = 200
+        mock_response_busy.text = 'Too many connections'
+        mock_response_ok = MagicMock()
+        mock_response_ok.status_code = 200
+        mock_response_ok.text = '{"developer": "Test Developer"}'
+        mock_response_ok.json.return_value = {"developer": "Test Developer"}
+        mock_get_session.return_value.get.side_effect = [mock_response_busy, mock_response_ok]
+
+        result = SteamSpyRequest('123', 3)
+        self.assertEqual(result['developer'], 'Test Developer')
+        mock_sleep.assert_called_once()
+
+    @patch('api.DoRequest')
+    def test_steam_request_uses_cache(self, mock_do_request):
+        mock_response = MagicMock()
+        mock_response.content = b'{"123": {"success": true, "data": {"type": "game", "is_free": true, "developers": ["Dev"]}}}'
+        mock_do_request.return_value = mock_response
+
+        with tempfile.TemporaryDirectory() as directory:
+            set_cache(ResponseCache(directory))
+            try:
+                first = SteamRequest('123', 3)
+                second = SteamRequest('123', 3)
+                self.assertEqual(first, second)
+                mock_do_request.assert_called_once()
+
+                # Replay mode never touches the network
+                set_cache(ResponseCache(directory), replay=True)
+                self.assertEqual(SteamRequest('123', 3).type, 'game')
+                with self.assertRaises(CacheMiss):
+                    SteamRequest('456', 3)
+                mock_do_request.assert_called_once()
+            finally:
+                set_cache(None)
+
+    @patch('api.DoRequest')
+    def test_steam_request_undecodable_is_retryable(self, mock_do_request):
+        # A truncated body is raised as a failure (retried later) rather than
+        # discarding the app, and is not kept in the response cache
+        mock_response = MagicMock()
+        mock_response.content = b'{"123": {"success": true, "data": {"type": "ga'
+        mock_do_request.return_value = mock_response
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(directory)
+            set_cache(cache)
+            try:
+                with self.assertRaises(RetriesExhausted):
+                    SteamRequest('123', 3)
+                self.assertIsNone(cache.get('https://store.steampowered.com/api/appdetails/',
+                                            {'appids': '123', 'cc': config.DEFAULT_CURRENCY, 'l': config.DEFAULT_LANGUAGE}))
+                self.assertEqual(cache.size, 0)
+            finally:
+                set_cache(None)
+
     def test_parse_steam_game(self):
         app_data = {
             'name': 'Test Game',
@@ -123,5 +352,33 @@ class TestAPI(unittest.TestCase):
         self.assertEqual(result['categories'], ['Single-player', 'Multi-player'])
         self.assertEqual(result['genres'], ['Action', 'Adventure'])
 
+    def test_parse_steam_game_fields(self):
+        app_data = {
+            'name': ' Test Game ',
+            'is_free': True,
+            'detailed_description': '<p>Long description</p>',
+            'supported_languages': 'English*, French',
+            'package_groups': [{'title': 'Buy', 'subs': [{'option_text': 'Test Game', 'price_in_cents_with_discount': 999}]}],
+        }
+
+        with patch('api.SanitizeText') as mock_sanitize:
+            result = ParseSteamGame(app_data, fields={'name', 'price', 'full_audio_languages'})
+            mock_sanitize.assert_not_called()
+
+        self.assertEqual(result, {'name': 'Test Game', 'price': 0.0, 'full_audio_languages': ['English']})
+        self.assertEqual(list(ParseSteamGame(app_data, fields=['genres', 'name'])), ['name', 'genres'])
+
+    def test_expected_release_date(self):
+        def expected(date):
+            return ExpectedReleaseDate({'release_date': {'coming_soon': True, 'date': date}})
+        self.assertEqual(expected('15 Nov, 2026'), datetime(2026, 11, 15, tzinfo=timezone.utc).timestamp())
+        self.assertEqual(expected('Nov 15, 2026'), datetime(2026, 11, 15, tzinfo=timezone.utc).timestamp())
+        self.assertEqual(expected('November 2026'), datetime(2026, 11, 1, tzinfo=timezone.utc).timestamp())
+        self.assertEqual(expected('Q3 2026'), datetime(2026, 7, 1, tzinfo=timezone.utc).timestamp())
+        self.assertEqual(expected('2027'), datetime(2027, 1, 1, tzinfo=timezone.utc).timestamp())
+        self.assertIsNone(expected('Coming soon'))
+        self.assertIsNone(expected('To be announced'))
+        self.assertIsNone(ExpectedReleaseDate({}))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import sys
+import os
+import zlib
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from appidset import AppIDSet, HEADER, MAGIC
+
+class TestAppIDSet(unittest.TestCase):
+
+    def test_membership(self):
+        ids = AppIDSet(['10', 570, '730'])
+        self.assertEqual(len(ids), 3)
+        self.assertIn('570', ids)
+        self.assertIn(10, ids)
+        self.assertNotIn('11', ids)
+        self.assertNotIn('1000000', ids)
+        self.assertNotIn('not an appID', ids)
+        self.assertEqual(list(ids), ['10', '570', '730'])
+        self.assertEqual(ids, {'10', '570', '730'})
+
+    def test_add_and_remove(self):
+        ids = AppIDSet()
+        ids.add('5')
+        ids.add('5')
+        self.assertEqual(len(ids), 1)
+        ids.remove('5')
+        ids.discard('5')
+        self.assertEqual(len(ids), 0)
+        self.assertFalse(ids)
+        with self.assertRaises(KeyError):
+            ids.remove('5')
+        with self.assertRaises(ValueError):
+            ids.add('-1')
+
+    def test_set_algebra(self):
+        applist = AppIDSet(range(100))
+        metadata = AppIDSet(range(0, 100, 2))
+        discarded = AppIDSet(range(0, 100, 3))
+        pending = applist - metadata - discarded
+        self.assertEqual(pending, set(str(i) for i in range(100) if i % 2 and i % 3))
+        self.assertEqual(len(pending), len(set(pending)))
+        self.assertEqual(metadata & discarded, set(str(i) for i in range(0, 100, 6)))
+        self.assertEqual(len(metadata | discarded), len(set(metadata) | set(discarded)))
+
+        # In-place operations keep the object, and plain sets are accepted
+        ids = AppIDSet(['1', '2'])
+        same = ids
+        ids |= AppIDSet(['3'])
+        ids -= {'1'}
+        ids.update(['4'])
+        self.assertIs(ids, same)
+        self.assertEqual(ids, {'2', '3', '4'})
+
+    def test_binary_roundtrip(self):
+        ids = AppIDSet(str(i) for i in range(0, 3000000, 17))
+        data = ids.to_bytes()
+        self.assertTrue(data.startswith(MAGIC))
+        loaded = AppIDSet.from_bytes(data)
+        self.assertEqual(len(loaded), len(ids))
+        self.assertEqual(loaded, ids)
+        self.assertEqual(AppIDSet.from_bytes(AppIDSet().to_bytes()), set())
+
+    def test_invalid_data(self):
+        with self.assertRaises(ValueError):
+            AppIDSet.from_bytes(b'[1, 2, 3]')
+        with self.assertRaises(ValueError):
+            AppIDSet.from_bytes(HEADER.pack(MAGIC, 99, 0) + zlib.compress(b''))
+
+if __name__ == '__main__':
+    unittest.main()
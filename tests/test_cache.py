@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+import tempfile
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from cache import ResponseCache, CachedResponse
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.url = 'https://store.steampowered.com/api/appdetails/'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_put_and_get(self):
+        cache = ResponseCache(self.tmp.name, ttl=None, max_bytes=None)
+        cache.put(self.url, {'appids': '10', 'cc': 'us'}, b'{"10": {"success": true}}')
+
+        # Parameter order does not change the key
+        self.assertEqual(cache.get(self.url, {'cc': 'us', 'appids': '10'}), b'{"10": {"success": true}}')
+        self.assertIsNone(cache.get(self.url, {'appids': '20', 'cc': 'us'}))
+        self.assertGreater(cache.size, 0)
+
+    def test_ttl(self):
+        cache = ResponseCache(self.tmp.name, ttl=60, max_bytes=None)
+        cache.put(self.url, {'appids': '10'}, b'{}')
+        path = cache.path(cache.key(self.url, {'appids': '10'}))
+        os.utime(path, (time.time() - 120, time.time() - 120))
+
+        self.assertIsNone(cache.get(self.url, {'appids': '10'}))
+        self.assertEqual(cache.get(self.url, {'appids': '10'}, ignore_ttl=True), b'{}')
+
+    @patch('cache.Log')
+    def test_eviction_removes_least_recently_used(self, mock_log):
+        cache = ResponseCache(self.tmp.name, ttl=None, max_bytes=None)
+        for appID in range(3):
+            cache.put(self.url, {'appids': appID}, os.urandom(1000))
+            path = cache.path(cache.key(self.url, {'appids': appID}))
+            os.utime(path, (time.time() - 100 + appID, time.time()))
+
+        cache.max_bytes = cache.size - 1
+        cache.put(self.url, {'appids': 3}, os.urandom(1000))
+
+        self.assertIsNone(cache.get(self.url, {'appids': 0}))
+        self.assertIsNotNone(cache.get(self.url, {'appids': 3}))
+        self.assertLessEqual(cache.size, cache.max_bytes)
+
+    def test_size_restored_on_open(self):
+        cache = ResponseCache(self.tmp.name, ttl=None, max_bytes=None)
+        cache.put(self.url, {'appids': '10'}, b'x' * 100)
+        self.assertEqual(ResponseCache(self.tmp.name).size, cache.size)
+
+    def test_cached_response(self):
+        response = CachedResponse(b'{"developer": "Valve"}')
+        self.assertTrue(response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, '{"developer": "Valve"}')
+        self.assertEqual(response.json(), {'developer': 'Valve'})
+
+if __name__ == '__main__':
+    unittest.main()
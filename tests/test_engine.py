@@ -0,0 +1,132 @@
+import unittest
+import threading
+import time
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from engine import RunScrape, Pipeline
+from scheduler import Schedule
+
+def double(work):
+    return int(work) * 2
+
+class TestEngine(unittest.TestCase):
+
+    def test_run_scrape_processes_all_apps(self):
+        results = {}
+        RunScrape(['1', '2', '3', '4'], lambda appID: int(appID) * 2,
+                  lambda appID, result: results.__setitem__(appID, result), 2)
+        self.assertEqual(results, {'1': 2, '2': 4, '3': 6, '4': 8})
+
+    def test_run_scrape_overlaps_requests(self):
+        active, peak = 0, 0
+        lock = threading.Lock()
+
+        def process(appID):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.05)
+            with lock:
+                active -= 1
+
+        RunScrape([str(i) for i in range(8)], process, lambda appID, result: None, 4)
+        self.assertGreater(peak, 1)
+        self.assertLessEqual(peak, 4)
+
+    def test_run_scrape_stops_when_callback_returns_false(self):
+        seen = []
+
+        def on_result(appID, result):
+            seen.append(appID)
+            return len(seen) < 2
+
+        RunScrape([str(i) for i in range(10)], lambda appID: None, on_result, 1)
+        self.assertEqual(seen, ['0', '1'])
+
+    def test_run_scrape_leaves_unstarted_apps_scheduled(self):
+        schedule = Schedule()
+        for i in range(10):
+            schedule.push(str(i), i)
+        seen = []
+
+        def on_result(appID, result):
+            seen.append(appID)
+            return len(seen) < 2
+
+        RunScrape(schedule, lambda appID: None, on_result, 1)
+        self.assertEqual(seen, ['9', '8'])
+        self.assertEqual(len(schedule), 8)
+
+class TestPipeline(unittest.TestCase):
+
+    def fetch(self, appID):
+        # Odd apps need parsing, even ones are final after the fetch
+        return (None, appID) if int(appID) % 2 else ('fetched', None)
+
+    def test_pipeline_processes_all_apps(self):
+        results = {}
+        pipeline = Pipeline(self.fetch, double, lambda appID, result: results.__setitem__(appID, result), 2, parse_workers=0)
+        pipeline.run([str(i) for i in range(6)])
+        self.assertEqual(results, {'0': 'fetched', '1': 2, '2': 'fetched', '3': 6, '4': 'fetched', '5': 10})
+        stats = pipeline.stats()
+        self.assertEqual(stats['fetch']['items'], 6)
+        self.assertEqual(stats['parse']['items'], 3)
+        self.assertEqual(stats['write']['items'], 6)
+        self.assertEqual(stats['parse']['queue'], 0)
+        self.assertLessEqual(stats['fetch']['utilization'], 1.0)
+
+    def test_pipeline_parses_on_process_pool(self):
+        results = {}
+        pipeline = Pipeline(self.fetch, double, lambda appID, result: results.__setitem__(appID, result), 2, parse_workers=2)
+        pipeline.run(['1', '3', '4'])
+        self.assertEqual(results, {'1': 2, '3': 6, '4': 'fetched'})
+
+    def test_pipeline_writes_on_one_thread(self):
+        threads = set()
+
+        def on_result(appID, result):
+            threads.add(threading.get_ident())
+
+        Pipeline(self.fetch, double, on_result, 4, parse_workers=0).run([str(i) for i in range(20)])
+        self.assertEqual(len(threads), 1)
+
+    def test_pipeline_stops_when_callback_returns_false(self):
+        seen = []
+
+        def on_result(appID, result):
+            seen.append(appID)
+            return len(seen) < 2
+
+        Pipeline(self.fetch, double, on_result, 1, parse_workers=0, queue_size=1).run([str(i) for i in range(50)])
+        self.assertGreaterEqual(len(seen), 2)
+        self.assertLess(len(seen), 10)
+
+    def test_pipeline_leaves_unfetched_apps_scheduled(self):
+        schedule = Schedule()
+        for i in range(50):
+            schedule.push(str(i), i)
+        seen = []
+
+        def on_result(appID, result):
+            seen.append(appID)
+            return len(seen) < 2
+
+        Pipeline(self.fetch, double, on_result, 2, parse_workers=0, queue_size=1).run(schedule)
+        self.assertEqual(len(seen) + len(schedule), 50)
+
+    def test_pipeline_raises_stage_errors(self):
+        def fetch(appID):
+            if appID == '3':
+                raise RuntimeError('boom')
+            return None, appID
+
+        with self.assertRaises(RuntimeError):
+            Pipeline(fetch, double, lambda appID, result: None, 2, parse_workers=0, queue_size=1).run([str(i) for i in range(50)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import datetime as dt
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from enrichment import apply_steamspy, PrefetchSteamSpy, load_steamspy_cache
+import config
+
+class TestEnrichment(unittest.TestCase):
+
+    def setUp(self):
+        self.bucket_name = 'test-bucket'
+
+    def test_apply_steamspy(self):
+        game = apply_steamspy({'name': 'Test Game'}, {
+            'userscore': 80, 'owners': '1,000,000 .. 2,000,000', 'ccu': 42, 'tags': {'Action': 10}
+        })
+        self.assertEqual(game['user_score'], 80)
+        self.assertEqual(game['estimated_owners'], '1000000 - 2000000')
+        self.assertEqual(game['peak_ccu'], 42)
+        self.assertEqual(game['tags'], {'Action': 10})
+        self.assertEqual(game['positive'], 0)
+
+    def test_apply_steamspy_defaults(self):
+        game = apply_steamspy({}, None)
+        self.assertEqual(game['estimated_owners'], '0 - 0')
+        self.assertEqual(game['score_rank'], '')
+        self.assertEqual(game['tags'], [])
+
+    def test_apply_steamspy_fields(self):
+        game = apply_steamspy({}, {'owners': '0 .. 20,000', 'ccu': 3}, fields={'estimated_owners', 'name'})
+        self.assertEqual(game, {'estimated_owners': '0 - 20000'})
+
+    @patch('enrichment.time.sleep')
+    @patch('enrichment.SteamSpyPageRequest')
+    def test_prefetch_pages_until_empty(self, mock_page_request, mock_sleep):
+        mock_page_request.side_effect = [
+            {'10': {'appid': 10, 'developer': 'Valve', 'ccu': 5, 'name': 'Counter-Strike'}},
+            {'20': {'appid': 20, 'developer': '', 'ccu': 1}, '30': {'appid': 30, 'developer': 'Valve', 'positive': 7}},
+            {},
+        ]
+        apps = PrefetchSteamSpy(retries=1, sleep=60)
+
+        self.assertEqual(apps, {'10': {'ccu': 5}, '30': {'positive': 7}})
+        self.assertEqual(mock_page_request.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        mock_sleep.assert_called_with(60)
+
+    @patch('enrichment.time.sleep')
+    @patch('enrichment.SteamSpyPageRequest')
+    def test_prefetch_stops_on_failed_page(self, mock_page_request, mock_sleep):
+        mock_page_request.side_effect = [{'10': {'appid': 10, 'developer': 'Valve', 'ccu': 5}}, None, {}]
+        self.assertIsNone(PrefetchSteamSpy(retries=1, sleep=0))
+        self.assertEqual(mock_page_request.call_count, 2)
+
+    @patch('enrichment.time.monotonic', side_effect=[100.0, 110.0])
+    @patch('enrichment.time.sleep')
+    @patch('enrichment.SteamSpyPageRequest')
+    def test_prefetch_resumes_and_stops_at_deadline(self, mock_page_request, mock_sleep, mock_monotonic):
+        mock_page_request.side_effect = [{'30': {'appid': 30, 'developer': 'Valve', 'ccu': 3}}]
+        pages = []
+        progress = {'page': 2, 'apps': {'10': {'ccu': 5}}}
+        self.assertIsNone(PrefetchSteamSpy(retries=1, sleep=60, progress=progress, deadline=165.0, on_page=pages.append))
+        mock_page_request.assert_called_once_with(2, 1)
+        mock_sleep.assert_called_once_with(60)  # Page 3 would only be requested after the deadline
+        self.assertEqual(pages, [{'page': 3, 'apps': {'10': {'ccu': 5}, '30': {'ccu': 3}}}])
+
+    @patch('enrichment.PrefetchSteamSpy', return_value=None)
+    @patch('enrichment.save_to_s3')
+    @patch('enrichment.load_from_s3', return_value=None)
+    def test_load_steamspy_cache_not_saved_after_failed_prefetch(self, mock_load, mock_save, mock_prefetch):
+        self.assertIsNone(load_steamspy_cache(self.bucket_name))
+        mock_save.assert_not_called()
+
+    @patch('enrichment.PrefetchSteamSpy')
+    @patch('enrichment.save_to_s3')
+    @patch('enrichment.load_from_s3')
+    def test_load_steamspy_cache_reuses_fresh_copy(self, mock_load, mock_save, mock_prefetch):
+        mock_load.return_value = {'fetched_at': dt.datetime.now().isoformat(), 'apps': {'10': {'ccu': 5}}}
+        self.assertEqual(load_steamspy_cache(self.bucket_name), {'10': {'ccu': 5}})
+        mock_prefetch.assert_not_called()
+        mock_save.assert_not_called()
+
+    @patch('enrichment.PrefetchSteamSpy')
+    @patch('enrichment.save_to_s3')
+    @patch('enrichment.load_from_s3')
+    @patch('enrichment.delete_from_s3')
+    def test_load_steamspy_cache_refreshes_stale_copy(self, mock_delete, mock_load, mock_save, mock_prefetch):
+        stale = dt.datetime.now() - dt.timedelta(seconds=config.STEAMSPY_CACHE_TTL + 1)
+        objects = {config.STEAMSPY_CACHE_FILE: {'fetched_at': stale.isoformat(), 'apps': {}}}
+        mock_load.side_effect = lambda bucket, key: objects.get(key)
+        mock_prefetch.return_value = {'10': {'ccu': 6}}
+
+        self.assertEqual(load_steamspy_cache(self.bucket_name), {'10': {'ccu': 6}})
+        mock_save.assert_called_once()
+        self.assertEqual(mock_save.call_args[0][1], config.STEAMSPY_CACHE_FILE)
+        self.assertEqual(mock_save.call_args[0][2]['apps'], {'10': {'ccu': 6}})
+        mock_delete.assert_called_once_with(self.bucket_name, [config.STEAMSPY_PREFETCH_FILE])
+
+    @patch('enrichment.PrefetchSteamSpy', return_value=None)
+    @patch('enrichment.save_to_s3')
+    @patch('enrichment.load_from_s3')
+    def test_load_steamspy_cache_resumes_saved_progress(self, mock_load, mock_save, mock_prefetch):
+        stale = dt.datetime.now() - dt.timedelta(seconds=config.STEAMSPY_CACHE_TTL + 1)
+        progress = {'started_at': dt.datetime.now().isoformat(), 'page': 4, 'apps': {'20': {'ccu': 2}}}
+        objects = {config.STEAMSPY_CACHE_FILE: {'fetched_at': stale.isoformat(), 'apps': {'10': {'ccu': 5}}},
+                   config.STEAMSPY_PREFETCH_FILE: progress}
+        mock_load.side_effect = lambda bucket, key: objects.get(key)
+
+        # An unfinished prefetch leaves the expired copy in use
+        self.assertEqual(load_steamspy_cache(self.bucket_name, deadline=50.0), {'10': {'ccu': 5}})
+        self.assertEqual(mock_prefetch.call_args.kwargs['progress'], progress)
+        self.assertEqual(mock_prefetch.call_args.kwargs['deadline'], 50.0)
+        mock_save.assert_not_called()
+
+        # Every page read is saved with the start time of the prefetch
+        mock_prefetch.call_args.kwargs['on_page']({'page': 5, 'apps': {}})
+        mock_save.assert_called_once_with(self.bucket_name, config.STEAMSPY_PREFETCH_FILE, {'started_at': progress['started_at'], 'page': 5, 'apps': {}})
+
+        # Progress older than the TTL is not resumed
+        progress['started_at'] = stale.isoformat()
+        load_steamspy_cache(self.bucket_name)
+        self.assertIsNone(mock_prefetch.call_args.kwargs['progress'])
+
+if __name__ == '__main__':
+    unittest.main()
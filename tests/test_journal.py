@@ -0,0 +1,120 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import json
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from journal import Journal, load_journal, replay_journal, compact_journal, segment_key, ADDED, NOT_RELEASED, DISCARDED, STATE
+from appidset import AppIDSet
+import config
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.bucket_name = 'test-bucket'
+
+    def test_segments(self):
+        uploader = MagicMock()
+        journal = Journal(uploader, 'shards/0-of-2/', [segment_key('shards/0-of-2/', 4)], segment_size=2)
+        journal.record('1', ADDED, 'chunk_1.json', {'scraped_at': 10})
+        uploader.save_bytes.assert_not_called()
+        journal.record('2', DISCARDED)
+        journal.record('3', NOT_RELEASED)
+        journal.flush()
+        journal.flush()  # Nothing buffered, no empty segment
+
+        self.assertEqual(uploader.save_bytes.call_count, 2)
+        key, data = uploader.save_bytes.call_args_list[0][0]
+        self.assertEqual(key, 'shards/0-of-2/journal/segment_000005.ndjson')
+        self.assertEqual([json.loads(line) for line in data.splitlines()], [
+            {'app': '1', 'status': 'added', 'chunk': 'chunk_1.json', 'state': {'scraped_at': 10}},
+            {'app': '2', 'status': 'discarded'},
+        ])
+        self.assertEqual(journal.segments[-1], 'shards/0-of-2/journal/segment_000006.ndjson')
+
+    @patch('journal.load_bytes_from_s3')
+    @patch('journal.list_s3_keys')
+    def test_load_journal(self, mock_list, mock_load):
+        segments = {
+            'journal/segment_000002.ndjson': b'{"app":"2","status":"discarded"}\n',
+            'journal/segment_000001.ndjson': b'{"app":"1","status":"discarded"}\nnot json\n',
+        }
+        mock_list.return_value = sorted(segments) + ['journal/other.txt']
+        mock_load.side_effect = lambda bucket, key: segments[key]
+        entries, keys = load_journal(self.bucket_name)
+        mock_list.assert_called_once_with(self.bucket_name, config.JOURNAL_PREFIX)
+        self.assertEqual(keys, ['journal/segment_000001.ndjson', 'journal/segment_000002.ndjson'])
+        self.assertEqual([entry['app'] for entry in entries], ['1', '2'])
+
+    def test_replay_journal(self):
+        entries = [
+            {'app': '1', 'status': NOT_RELEASED},
+            {'app': '2', 'status': DISCARDED},
+            {'app': '1', 'status': ADDED, 'chunk': 'chunk_2.json', 'state': {'scraped_at': 20}},
+            {'app': '3', 'status': ADDED, 'chunk': 'chunk_2.json', 'state': {'scraped_at': 20}},
+            {'app': '4', 'status': STATE, 'state': {'scraped_at': 30}},
+        ]
+        metadata, discarded, notreleased = AppIDSet(['4']), AppIDSet(), AppIDSet(['5'])
+        state, manifest = {'4': {'scraped_at': 1}}, {'chunks': ['chunk_1.json']}
+        for _ in range(2):  # Replaying twice gives the same result
+            replay_journal(entries, metadata, discarded, notreleased, state, manifest)
+            self.assertEqual(metadata, {'1', '3', '4'})
+            self.assertEqual(discarded, {'2'})
+            self.assertEqual(notreleased, {'5'})
+            self.assertEqual(state, {'1': {'scraped_at': 20}, '3': {'scraped_at': 20}, '4': {'scraped_at': 30}})
+            self.assertEqual(manifest, {'chunks': ['chunk_1.json', 'chunk_2.json']})
+
+    def test_compact_journal(self):
+        store = {
+            config.MANIFEST_FILE: {'chunks': ['chunk_1.json']},
+            config.METADATA_FILE: ['1'],
+            'journal/segment_000001.ndjson': b'{"app":"2","status":"added","chunk":"chunk_2.json","state":{"scraped_at":5}}\n',
+        }
+        saved, deleted = {}, []
+        with patch('journal.list_s3_keys', side_effect=lambda bucket, prefix: [k for k in store if k.startswith(prefix)]), \
+             patch('journal.load_bytes_from_s3', side_effect=lambda bucket, key: store.get(key)), \
+             patch('journal.delete_from_s3', side_effect=lambda bucket, keys: deleted.extend(keys)), \
+             patch('utils.load_bytes_from_s3', side_effect=lambda bucket, key: store.get(key)), \
+             patch('utils.load_from_s3', side_effect=lambda bucket, key: store.get(key)), \
+             patch('journal.load_from_s3', side_effect=lambda bucket, key: store.get(key)), \
+             patch('utils.save_to_s3', side_effect=lambda bucket, key, data: saved.__setitem__(key, data) or True), \
+             patch('journal.save_to_s3', side_effect=lambda bucket, key, data: saved.__setitem__(key, data) or True), \
+             patch('utils.save_bytes_to_s3', side_effect=lambda bucket, key, data: saved.__setitem__(key, data) or True):
+            self.assertEqual(compact_journal(self.bucket_name), 1)
+
+        self.assertEqual(deleted, ['journal/segment_000001.ndjson'])
+        self.assertEqual(AppIDSet.from_bytes(saved['metadata_index.bin']), {'1', '2'})
+        self.assertEqual(saved[config.STATE_FILE], {'2': {'scraped_at': 5}})
+        self.assertEqual(saved[config.MANIFEST_FILE], {'chunks': ['chunk_1.json', 'chunk_2.json']})
+
+    @patch('journal.delete_from_s3')
+    @patch('journal.load_from_s3', return_value=None)
+    @patch('journal.load_bytes_from_s3', return_value=b'{"app":"2","status":"discarded"}\n')
+    @patch('journal.list_s3_keys', return_value=['journal/segment_000001.ndjson'])
+    @patch('journal.save_to_s3', return_value=True)
+    @patch('utils.load_bytes_from_s3', return_value=None)
+    @patch('utils.load_from_s3', return_value=None)
+    @patch('utils.save_to_s3', return_value=True)
+    @patch('utils.save_bytes_to_s3', side_effect=[True, False, True])
+    def test_compact_journal_keeps_segments_on_failed_save(self, mock_save_bytes, mock_save, mock_load, mock_load_bytes,
+                                                           mock_save_manifest, mock_list, mock_segment, mock_load_manifest, mock_delete):
+        self.assertEqual(compact_journal(self.bucket_name), 0)
+        mock_delete.assert_not_called()
+
+        journal = Journal(MagicMock(), segments=['journal/segment_000001.ndjson'])
+        with patch('journal.save_snapshot', return_value=False):
+            self.assertFalse(journal.compact(self.bucket_name, AppIDSet(), AppIDSet(), AppIDSet(), {}, {'chunks': []}))
+        mock_delete.assert_not_called()
+        self.assertEqual(journal.segments, ['journal/segment_000001.ndjson'])
+
+    @patch('journal.list_s3_keys', return_value=[])
+    @patch('journal.save_to_s3')
+    def test_compact_journal_without_segments(self, mock_save, mock_list):
+        self.assertEqual(compact_journal(self.bucket_name, 'shards/1-of-2/'), 0)
+        mock_save.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import sys
+import os
+import tempfile
+import urllib.request
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from metrics import Registry, Throughput, serve, dump
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_and_gauge(self):
+        requests = self.registry.counter('requests_total', 'Requests', ('host',))
+        requests.inc(host='a')
+        requests.inc(2, host='a')
+        requests.inc(host='b"')
+        self.assertEqual(requests.get(host='a'), 3)
+        self.assertIs(self.registry.counter('requests_total', 'Requests', ('host',)), requests)
+
+        queued = self.registry.gauge('queued', 'Queued items')
+        queued.set(4)
+        text = self.registry.render()
+        self.assertIn('# TYPE requests_total counter', text)
+        self.assertIn('requests_total{host="a"} 3', text)
+        self.assertIn('requests_total{host="b\\""} 1', text)
+        self.assertIn('queued 4', text)
+
+    def test_gauge_function(self):
+        gauge = self.registry.gauge('eta', 'ETA', ('value',))
+        gauge.set_function(lambda: 1.5, value='x')
+        gauge.set_function(lambda: None, value='unknown')
+        self.assertEqual(gauge.get(value='x'), 1.5)
+        text = self.registry.render()
+        self.assertIn('eta{value="x"} 1.5', text)
+        self.assertNotIn('unknown', text)
+        gauge.set_function(None, value='x')
+        self.assertNotIn('eta{value="x"}', self.registry.render())
+
+    def test_histogram(self):
+        latency = self.registry.histogram('latency_seconds', 'Latency', ('host',), buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            latency.observe(value, host='a')
+        self.assertEqual(latency.count(host='a'), 4)
+        text = self.registry.render()
+        self.assertIn('latency_seconds_bucket{host="a",le="0.1"} 2', text)
+        self.assertIn('latency_seconds_bucket{host="a",le="1"} 3', text)
+        self.assertIn('latency_seconds_bucket{host="a",le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_count{host="a"} 4', text)
+        self.assertIn('latency_seconds_sum{host="a"} 3.65', text)
+
+    def test_throughput(self):
+        progress = Throughput(10)
+        self.assertIsNone(progress.eta())
+        progress.start_time -= 2
+        progress.done = 4
+        self.assertAlmostEqual(progress.rate(), 2.0, places=1)
+        self.assertAlmostEqual(progress.eta(), 3.0, places=1)
+
+    def test_serve_and_dump(self):
+        self.registry.counter('served_total', 'Served').inc()
+        server = serve(0, '127.0.0.1', self.registry)
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as response:
+                self.assertIn('served_total 1', response.read().decode('utf-8'))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'out', 'metrics.prom')
+            dump(path, self.registry)
+            with open(path) as f:
+                self.assertIn('served_total 1', f.read())
+
+if __name__ == '__main__':
+    unittest.main()
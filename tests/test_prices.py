@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import csv
+import io
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from prices import PriceRows, refresh_prices
+import config
+
+class TestPrices(unittest.TestCase):
+
+    def setUp(self):
+        self.bucket_name = 'test-bucket'
+
+    def test_price_rows(self):
+        rows = PriceRows({'10': {'currency': 'USD', 'initial': 999, 'final': 499, 'discount_percent': 50}}, 'us', 'T')
+        self.assertEqual(rows, [{'app_id': '10', 'cc': 'us', 'currency': 'USD', 'price': 4.99, 'discount': 50, 'timestamp': 'T'}])
+
+    @patch('prices.save_bytes_to_s3')
+    @patch('prices.PriceRequest')
+    def test_refresh_prices_batches_per_region(self, mock_price_request, mock_save):
+        mock_price_request.side_effect = lambda ids, cc, retries: {
+            appID: {'currency': cc.upper(), 'final': 100, 'discount_percent': 0} for appID in ids
+        }
+        key = refresh_prices(self.bucket_name, {'1', '2', '3', '4', '5'}, ['us', 'gb'], batch_size=2, concurrency=2)
+
+        # 3 batches of up to 2 apps for each of the 2 regions
+        self.assertEqual(mock_price_request.call_count, 6)
+        self.assertTrue(key.startswith(config.PRICES_PREFIX))
+        rows = list(csv.DictReader(io.StringIO(mock_save.call_args[0][2].decode('utf-8'))))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual({row['cc'] for row in rows}, {'us', 'gb'})
+        self.assertEqual(list(rows[0].keys()), ['app_id', 'cc', 'currency', 'price', 'discount', 'timestamp'])
+
+    @patch('prices.save_bytes_to_s3')
+    @patch('prices.PriceRequest', return_value={})
+    def test_refresh_prices_without_prices(self, mock_price_request, mock_save):
+        self.assertIsNone(refresh_prices(self.bucket_name, {'1'}, ['us']))
+        mock_save.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from ratelimit import TokenBucket, RateController, get_controller, set_rate_limit, host_of
+import config
+
+class TestRateLimit(unittest.TestCase):
+
+    @patch('ratelimit.time.monotonic', return_value=100.0)
+    @patch('ratelimit.time.sleep')
+    def test_token_bucket_burst_then_wait(self, mock_sleep, mock_monotonic):
+        bucket = TokenBucket(rate=2, capacity=2)
+        bucket.acquire()
+        bucket.acquire()
+        mock_sleep.assert_not_called()
+
+        # Bucket is empty: the next caller waits 1/rate, the one after that 2/rate
+        bucket.acquire()
+        mock_sleep.assert_called_with(0.5)
+        bucket.acquire()
+        mock_sleep.assert_called_with(1.0)
+
+    @patch('ratelimit.time.sleep')
+    def test_token_bucket_refills(self, mock_sleep):
+        with patch('ratelimit.time.monotonic', return_value=0.0):
+            bucket = TokenBucket(rate=1, capacity=1)
+            bucket.acquire()
+        with patch('ratelimit.time.monotonic', return_value=5.0):
+            bucket.acquire()
+        mock_sleep.assert_not_called()
+        self.assertEqual(bucket.tokens, 0)
+
+    def test_get_controller_per_host(self):
+        store = get_controller('https://store.steampowered.com/api/appdetails/')
+        spy = get_controller('https://steamspy.com/api.php')
+        self.assertIsNot(store, spy)
+        self.assertIs(store, get_controller('https://store.steampowered.com/other'))
+        self.assertEqual(spy.rate, config.RATE_LIMITS['steamspy.com'][0])
+        self.assertIsNone(get_controller('https://example.com').rate)
+
+    def test_set_rate_limit(self):
+        set_rate_limit('example.org', 5, 3)
+        controller = get_controller('https://example.org/path')
+        self.assertEqual(controller.rate, 5)
+        self.assertEqual(controller.bucket.capacity, 3)
+        self.assertEqual(host_of('https://example.org/path'), 'example.org')
+
+    def test_rate_controller_aimd(self):
+        controller = RateController(rate=1.0, burst=1, max_rate=1.02)
+        controller.on_success()
+        self.assertAlmostEqual(controller.rate, 1.0 + config.RATE_INCREASE)
+        controller.on_success()
+        controller.on_success()
+        self.assertAlmostEqual(controller.rate, 1.02)
+
+        controller.last_decrease = float('-inf')
+        controller.on_failure()
+        self.assertAlmostEqual(controller.rate, 1.02 * config.RATE_DECREASE)
+        # A second failure straight away is part of the same congestion event
+        controller.on_failure()
+        self.assertAlmostEqual(controller.rate, 1.02 * config.RATE_DECREASE)
+
+    def test_rate_controller_retry_delay(self):
+        controller = RateController()
+        delay = controller.on_failure(attempt=1)
+        self.assertTrue(config.DEFAULT_BACKOFF / 2 <= delay <= config.DEFAULT_BACKOFF)
+        delay = controller.on_failure(attempt=2)
+        self.assertTrue(config.DEFAULT_BACKOFF <= delay <= config.DEFAULT_BACKOFF * 2)
+        delay = controller.on_failure(attempt=1000)
+        self.assertTrue(config.MAX_BACKOFF / 2 <= delay <= config.MAX_BACKOFF)
+
+    def test_concurrent_failures_do_not_compound(self):
+        # The first failure of each of many workers waits the base delay, however many came before
+        controller = RateController(rate=1.0)
+        delays = [controller.on_failure(attempt=1) for _ in range(8)]
+        self.assertTrue(all(config.DEFAULT_BACKOFF / 2 <= delay <= config.DEFAULT_BACKOFF for delay in delays))
+
+    @patch('ratelimit.time.sleep')
+    def test_circuit_breaker_opens_and_probes(self, mock_sleep):
+        controller = RateController(host='steamspy.com')
+        for _ in range(config.CIRCUIT_FAILURE_THRESHOLD):
+            controller.on_failure()
+        self.assertEqual(controller.state, 'open')
+
+        # acquire() waits out the cooldown, then lets one probe through
+        with patch('ratelimit.time.monotonic', return_value=controller.paused_until - 10):
+            mock_sleep.side_effect = lambda seconds: controller.__setattr__('paused_until', 0)
+            controller.acquire()
+        mock_sleep.assert_called_once_with(10)
+        self.assertEqual(controller.state, 'half-open')
+
+        # A failed probe re-opens the circuit with a longer cooldown
+        controller.on_failure()
+        self.assertEqual(controller.state, 'open')
+        self.assertEqual(controller.cooldown, config.CIRCUIT_COOLDOWN * 4)
+
+        controller.state = 'half-open'
+        controller.on_success()
+        self.assertEqual(controller.state, 'closed')
+        self.assertEqual(controller.cooldown, config.CIRCUIT_COOLDOWN)
+
+    @patch('ratelimit.time.sleep')
+    def test_acquire_gives_up_at_deadline(self, mock_sleep):
+        controller = RateController()
+        with patch('ratelimit.time.monotonic', return_value=100.0):
+            controller.on_failure(retry_after=60)
+            self.assertFalse(controller.acquire(deadline=130.0))
+            mock_sleep.assert_not_called()
+            self.assertEqual(controller.requests, 0)
+
+        mock_sleep.side_effect = lambda seconds: controller.__setattr__('paused_until', 0)
+        with patch('ratelimit.time.monotonic', return_value=100.0):
+            self.assertTrue(controller.acquire(deadline=200.0))
+        mock_sleep.assert_called_once_with(60.0)
+
+    def test_retry_after_pauses_host(self):
+        controller = RateController()
+        with patch('ratelimit.time.monotonic', return_value=100.0):
+            delay = controller.on_failure(retry_after=30, attempt=6)
+        self.assertEqual(controller.paused_until, 130.0)
+        # The server's delay replaces the exponential backoff rather than adding to it
+        self.assertTrue(30 <= delay <= 30 + config.DEFAULT_BACKOFF / 2)
+        self.assertEqual(controller.state, 'closed')
+
+    def test_retry_budget(self):
+        controller = RateController()
+        for _ in range(4):
+            controller.acquire()
+        controller.on_failure()
+        self.assertEqual(controller.retry_budget_used(), 0.25)
+        self.assertEqual(controller.stats()['retries'], 1)
+        self.assertTrue(controller.over_budget)
+
+if __name__ == '__main__':
+    unittest.main()
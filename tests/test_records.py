@@ -0,0 +1,82 @@
+import unittest
+import sys
+import os
+import json
+import msgspec
+from unittest.mock import patch
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from records import AppDetails, DecodeAppDetails, AsAppDetails
+from api import ParseSteamGame
+
+APP = {
+    'type': 'game',
+    'name': 'Test Game',
+    'steam_appid': 123,
+    'release_date': {'date': '2023-01-01', 'coming_soon': False},
+    'required_age': '18',
+    'is_free': False,
+    'price_overview': {'currency': 'USD', 'final': 1999, 'final_formatted': '$19.99'},
+    'dlc': [1, 2],
+    'detailed_description': '<p>Test description</p>',
+    'platforms': {'windows': True, 'mac': False, 'linux': True},
+    'screenshots': [{'id': 0, 'path_full': 'https://example.com/0.jpg'}],
+    'package_groups': [{'title': 'Buy Test Game', 'description': '', 'subs': [
+        {'option_text': 'Test Game - <span>$19.99</span>', 'price_in_cents_with_discount': 1999}]}],
+    'developers': ['Dev1'],
+    'categories': [{'id': 2, 'description': 'Single-player'}],
+}
+
+class TestRecords(unittest.TestCase):
+
+    def test_decode(self):
+        body = json.dumps({'123': {'success': True, 'data': APP}}).encode('utf-8')
+        app = DecodeAppDetails(body, 123)
+        self.assertIsInstance(app, AppDetails)
+        self.assertEqual(app.name, 'Test Game')
+        self.assertEqual(app.price_overview.final_formatted, '$19.99')
+        self.assertEqual(app.package_groups[0].subs[0].price_in_cents_with_discount, 1999)
+        # Fields ParseSteamGame does not use are skipped
+        self.assertFalse(hasattr(app, 'screenshots'))
+        # Missing fields fall back to empty defaults
+        self.assertEqual(app.metacritic.score, 0)
+        self.assertIsNone(app.supported_languages)
+
+    def test_decode_without_success(self):
+        self.assertIsNone(DecodeAppDetails(b'{"123": {"success": false}}', '123'))
+        self.assertIsNone(DecodeAppDetails(b'{"456": {"success": true, "data": {}}}', '123'))
+        with self.assertRaises(msgspec.DecodeError):
+            DecodeAppDetails(b'not json', '123')
+
+    @patch('records.Log')
+    def test_decode_falls_back_on_unexpected_types(self, mock_log):
+        # Apps without a price send price_overview as an empty list, and other
+        # fields occasionally change type; only those fields fall back to defaults
+        data = dict(APP, price_overview=[], platforms={'windows': 'yes', 'mac': False, 'linux': True})
+        body = json.dumps({'123': {'success': True, 'data': data}}).encode('utf-8')
+        app = DecodeAppDetails(body, 123)
+        self.assertIsNone(app.price_overview)
+        self.assertFalse(app.platforms.windows)
+        self.assertTrue(app.platforms.linux)
+        self.assertEqual(app.name, 'Test Game')
+        self.assertEqual(app.developers, ['Dev1'])
+        self.assertIn('price_overview, platforms.windows', mock_log.call_args[0][1])
+        self.assertEqual(AsAppDetails(data), app)
+
+    def test_parse_matches_dict(self):
+        body = json.dumps({'123': {'success': True, 'data': APP}}).encode('utf-8')
+        game = ParseSteamGame(DecodeAppDetails(body, '123'))
+        self.assertEqual(game, ParseSteamGame(APP))
+        self.assertEqual(game['price'], 19.99)
+        self.assertEqual(game['required_age'], 18)
+        self.assertEqual(game['packages'][0]['subs'][0], {'text': 'Test Game - $19.99', 'description': '', 'price': 19.99})
+
+    def test_as_app_details(self):
+        app = AsAppDetails(APP)
+        self.assertIs(AsAppDetails(app), app)
+        self.assertEqual(AsAppDetails({}).release_date.date, '')
+
+if __name__ == '__main__':
+    unittest.main()
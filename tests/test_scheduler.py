@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from scheduler import Schedule, Budget, app_priority, release_due, popularity, signals_of, NEW, REFRESH, NOT_RELEASED
+import config
+
+DAY = 86400
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1_000_000_000
+        self.max_age = 30 * DAY
+
+    def test_schedule_order(self):
+        schedule = Schedule()
+        for appID, priority in [('1', 1.0), ('2', 5.0), ('3', 3.0), ('4', 5.0)]:
+            schedule.push(appID, priority)
+        self.assertEqual(len(schedule), 4)
+        order = list(schedule)
+        self.assertEqual(sorted(order[:2]), ['2', '4'])
+        self.assertEqual(order[2:], ['3', '1'])
+        self.assertEqual(len(schedule), 0)
+
+    def test_popularity(self):
+        self.assertEqual(popularity({}), 0)
+        self.assertAlmostEqual(popularity({'peak_ccu': 999, 'recommendations': 9}), 4.0)
+        # Apps never scraped use the SteamSpy bulk data
+        self.assertAlmostEqual(popularity({}, {'ccu': 99}), 2.0)
+        self.assertEqual(signals_of({'peak_ccu': 5, 'recommendations': None}), {'peak_ccu': 5, 'recommendations': 0})
+
+    def test_new_apps_first(self):
+        new_old = app_priority('10', NEW, {}, None, self.now, self.max_age, newest=1000)
+        new_recent = app_priority('990', NEW, {}, None, self.now, self.max_age, newest=1000)
+        new_popular = app_priority('10', NEW, {}, {'ccu': 10000}, self.now, self.max_age, newest=1000)
+        very_stale = app_priority('5', REFRESH, {'scraped_at': 0, 'peak_ccu': 10 ** 6}, None, self.now, self.max_age)
+        self.assertGreater(new_recent, new_old)
+        self.assertGreater(new_popular, new_recent)
+        self.assertGreater(new_old, very_stale)
+
+    def test_refresh_priority(self):
+        fresh = {'scraped_at': self.now - 10 * DAY}
+        stale = {'scraped_at': self.now - 60 * DAY}
+        stale_popular = dict(stale, peak_ccu=5000, recommendations=20000)
+        priorities = [app_priority('1', REFRESH, entry, None, self.now, self.max_age) for entry in (fresh, stale, stale_popular)]
+        self.assertEqual(priorities, sorted(priorities))
+        # Changed upstream ranks at least as high as data past max_age
+        changed = app_priority('1', REFRESH, fresh, None, self.now, self.max_age, changed=True)
+        self.assertEqual(changed, 1.0)
+
+    def test_release_due(self):
+        self.assertTrue(release_due({'expected_release': self.now + DAY}, self.now))
+        self.assertTrue(release_due({'expected_release': self.now - DAY}, self.now))
+        self.assertFalse(release_due({'expected_release': self.now + 60 * DAY}, self.now))
+        self.assertTrue(release_due({}, self.now))
+        self.assertFalse(release_due({'scraped_at': self.now - DAY}, self.now))
+        self.assertTrue(release_due({'scraped_at': self.now - (config.NOTRELEASED_POLL_DAYS + 1) * DAY}, self.now))
+
+        due = app_priority('1', NOT_RELEASED, {'expected_release': self.now + DAY}, None, self.now, self.max_age)
+        undated = app_priority('1', NOT_RELEASED, {'scraped_at': 0}, None, self.now, self.max_age)
+        self.assertGreaterEqual(due, config.PRIORITY_NEW)
+        self.assertLess(undated, config.PRIORITY_NEW)
+
+    @patch('scheduler.retry_stats')
+    def test_budget_requests(self, mock_stats):
+        mock_stats.return_value = {'a': {'requests': 10}, 'b': {'requests': 5}}
+        budget = Budget(max_requests=3)
+        self.assertFalse(budget.exhausted())
+        mock_stats.return_value = {'a': {'requests': 12}, 'b': {'requests': 6}}
+        self.assertTrue(budget.exhausted())
+        self.assertFalse(Budget().exhausted())
+
+    @patch('scheduler.time.monotonic')
+    def test_budget_time(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        budget = Budget(max_time=60)
+        mock_monotonic.return_value = 159.0
+        self.assertFalse(budget.exhausted())
+        mock_monotonic.return_value = 160.0
+        self.assertTrue(budget.exhausted())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from schema import GAME_FIELDS, parse_fields, wants_steamspy, wants_tags
+import config
+
+class TestSchema(unittest.TestCase):
+
+    def test_parse_fields(self):
+        self.assertIsNone(parse_fields('all'))
+        self.assertEqual(parse_fields('name, price'), {'name', 'price'})
+        self.assertEqual(parse_fields('analytics'), set(config.FIELD_PRESETS['analytics']))
+        self.assertEqual(parse_fields('analytics,tags'), set(config.FIELD_PRESETS['analytics']) | {'tags'})
+
+    def test_parse_fields_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_fields('name,nonexistent')
+        with self.assertRaises(ValueError):
+            parse_fields(',')
+
+    def test_presets_are_valid(self):
+        for fields in config.FIELD_PRESETS.values():
+            self.assertTrue(set(fields) <= set(GAME_FIELDS))
+
+    def test_wants_steamspy(self):
+        self.assertTrue(wants_steamspy(None))
+        self.assertTrue(wants_steamspy({'name', 'peak_ccu'}))
+        self.assertTrue(wants_steamspy({'tags'}))
+        self.assertFalse(wants_steamspy({'name', 'price'}))
+
+    def test_wants_tags(self):
+        self.assertFalse(wants_tags(None))
+        self.assertTrue(wants_tags(parse_fields('analytics,tags')))
+        self.assertFalse(wants_tags(parse_fields('analytics')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,7 +6,12 @@ import os
 # Add the src directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 
-from steam_scraper import get_app_list, process_game, save_progress
+from steam_scraper import get_app_list, get_app_modified_times, process_game, schedule_refreshes
+from appidset import AppIDSet
+from api import RetriesExhausted
+from schema import UNTAGGED_FIELDS
+from scheduler import Schedule
+from sharding import in_shard
 import config
 
 class TestSteamScraper(unittest.TestCase):
@@ -18,70 +23,108 @@ class TestSteamScraper(unittest.TestCase):
         self.args.sleep = 1
         self.args.retries = 3
         self.args.steamspy = True
+        self.args.tags = False
+        self.args.fields = None
 
-    @patch('steam_scraper.load_from_s3')
-    @patch('steam_scraper.save_to_s3')
+    @patch('steam_scraper.time.sleep')
+    @patch('steam_scraper.load_app_ids')
+    @patch('steam_scraper.save_app_ids')
     @patch('steam_scraper.DoRequest')
-    def test_get_app_list(self, mock_do_request, mock_save_to_s3, mock_load_from_s3):
+    def test_get_app_list(self, mock_do_request, mock_save_app_ids, mock_load_app_ids, mock_sleep):
         # Test when app list is loaded from S3
-        mock_load_from_s3.return_value = ['1', '2', '3']
+        mock_load_app_ids.return_value = AppIDSet(['1', '2', '3'])
         result = get_app_list(self.bucket_name, self.args)
-        self.assertEqual(result, ['1', '2', '3'])
-        mock_load_from_s3.assert_called_once_with(self.bucket_name, config.APPLIST_FILE)
+        self.assertEqual(result, {'1', '2', '3'})
+        mock_load_app_ids.assert_called_once_with(self.bucket_name, config.APPLIST_FILE)
 
         # Test when app list is not in S3 and needs to be fetched from Steam
-        mock_load_from_s3.return_value = None
+        mock_load_app_ids.return_value = AppIDSet()
         mock_do_request.return_value.json.return_value = {
             'applist': {'apps': [{'appid': 1}, {'appid': 2}, {'appid': 3}]}
         }
         result = get_app_list(self.bucket_name, self.args)
-        self.assertEqual(result, ['1', '2', '3'])
+        self.assertEqual(result, {'1', '2', '3'})
         mock_do_request.assert_called_once()
-        mock_save_to_s3.assert_called_once()
+        mock_save_app_ids.assert_called_once()
+
+    @patch.dict(os.environ, {'STEAM_API_KEY': 'key'})
+    @patch('steam_scraper.time.monotonic', side_effect=[10.0, 30.0])
+    @patch('steam_scraper.DoRequest')
+    def test_get_app_modified_times_stops_at_deadline(self, mock_do_request, mock_monotonic):
+        mock_do_request.return_value.json.side_effect = [
+            {'response': {'apps': [{'appid': 1, 'last_modified': 100}], 'have_more_results': True, 'last_appid': 1}},
+            {'response': {'apps': [{'appid': 2, 'last_modified': 200}], 'have_more_results': True, 'last_appid': 2}},
+        ]
+        self.assertEqual(get_app_modified_times(self.args, deadline=20.0), {'1': 100, '2': 200})
+        self.assertEqual(mock_do_request.call_count, 2)
+
+    def test_schedule_refreshes_of_one_shard(self):
+        metadata = AppIDSet(str(appID) for appID in range(1, 41))
+        state = {str(appID): {'scraped_at': 0} for appID in range(1, 31)}  # 31 to 40 have no entry yet
+        pending = Schedule()
+        self.assertEqual(schedule_refreshes(pending, metadata, state, {}, max_age=100, now=1000, shard=(0, 2)),
+                         sum(in_shard(str(appID), (0, 2)) for appID in range(1, 31)))
+        self.assertTrue(all(in_shard(appID, (0, 2)) for appID in pending))
+        # Only this shard's apps are seeded, and seeded apps are fresh
+        self.assertEqual(sorted(appID for appID in map(str, range(31, 41)) if appID in state),
+                         sorted(appID for appID in map(str, range(31, 41)) if in_shard(appID, (0, 2))))
+
+        pending = Schedule()
+        self.assertEqual(schedule_refreshes(pending, metadata, state, {}, max_age=100, now=1000), 30)
 
     @patch('steam_scraper.SteamRequest')
     @patch('steam_scraper.SteamSpyRequest')
+    @patch('steam_scraper.ReleaseDate')
+    @patch('steam_scraper.ExpectedReleaseDate', return_value=None)
     @patch('steam_scraper.ParseSteamGame')
-    def test_process_game(self, mock_parse_steam_game, mock_steamspy_request, mock_steam_request):
+    def test_process_game(self, mock_parse_steam_game, mock_expected_release, mock_release_date, mock_steamspy_request, mock_steam_request):
         # Test successful game processing
-        mock_steam_request.return_value = {'some': 'data'}
-        mock_parse_steam_game.return_value = {'release_date': '2022-01-01', 'name': 'Test Game'}
+        mock_steam_request.return_value = MagicMock()
+        mock_release_date.return_value = 'Jan 1, 2022'
+        mock_parse_steam_game.side_effect = lambda app, fields: {'release_date': 'Jan 1, 2022', 'name': 'Test Game'}
         mock_steamspy_request.return_value = {'userscore': 80}
 
-        game, status = process_game('123', self.args, set(), set(), 0, 0)
-        
+        game, status = process_game('123', self.args, set(), set())
+
         self.assertEqual(status, 'added')
         self.assertIsNotNone(game)
         self.assertEqual(game['name'], 'Test Game')
         self.assertEqual(game['user_score'], 80)
 
+        # Apps in the SteamSpy bulk cache need no per-app request
+        mock_steamspy_request.reset_mock()
+        game, status = process_game('123', self.args, set(), set(), {'123': {'userscore': 90}})
+        self.assertEqual(game['user_score'], 90)
+        mock_steamspy_request.assert_not_called()
+        # The bulk listing has no tags, so they are left out rather than empty
+        self.assertEqual(mock_parse_steam_game.call_args[0][1], UNTAGGED_FIELDS)
+        self.assertNotIn('tags', game)
+
+        # Tags listed in the schema take a per-app request
+        self.args.fields = frozenset(['name', 'user_score', 'tags'])
+        mock_steamspy_request.return_value = {'userscore': 80, 'tags': ['Action']}
+        game, status = process_game('123', self.args, set(), set(), {'123': {'userscore': 90}})
+        self.assertEqual((game['user_score'], game['tags']), (80, ['Action']))
+        mock_steamspy_request.assert_called_once()
+        self.args.fields = None
+
         # Test game not released
-        mock_parse_steam_game.return_value = {'release_date': ''}
-        game, status = process_game('123', self.args, set(), set(), 0, 0)
+        mock_release_date.return_value = ''
+        game, status = process_game('123', self.args, set(), set())
         self.assertEqual(status, 'not_released')
         self.assertIsNone(game)
 
         # Test game discarded
         mock_steam_request.return_value = None
-        game, status = process_game('123', self.args, set(), set(), 0, 0)
+        game, status = process_game('123', self.args, set(), set())
         self.assertEqual(status, 'discarded')
         self.assertIsNone(game)
 
-    @patch('steam_scraper.save_to_s3')
-    def test_save_progress(self, mock_save_to_s3):
-        args = MagicMock()
-        args.autosave = 10
-        notreleased_set = set(['1', '2', '3'])
-        discarded_set = set(['4', '5', '6'])
-
-        # Test when autosave condition is met
-        save_progress(self.bucket_name, args, notreleased_set, discarded_set, 10, 10)
-        self.assertEqual(mock_save_to_s3.call_count, 2)
-
-        # Test when autosave condition is not met
-        mock_save_to_s3.reset_mock()
-        save_progress(self.bucket_name, args, notreleased_set, discarded_set, 5, 5)
-        mock_save_to_s3.assert_not_called()
+        # Test request out of retries
+        mock_steam_request.side_effect = RetriesExhausted('down')
+        game, status = process_game('123', self.args, set(), set())
+        self.assertEqual(status, 'failed')
+        self.assertIsNone(game)
 
 if __name__ == '__main__':
     unittest.main()
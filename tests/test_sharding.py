@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from sharding import parse_shard, in_shard, shard_prefix, merge_shards
+import config
+from appidset import AppIDSet
+
+class TestSharding(unittest.TestCase):
+
+    def setUp(self):
+        self.bucket_name = 'test-bucket'
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard('2/4'), (2, 4))
+        for spec in ['4/4', '-1/4', '1', 'a/b', '1/0']:
+            with self.assertRaises(ValueError):
+                parse_shard(spec)
+
+    def test_in_shard_partitions_apps(self):
+        apps = [str(appID) for appID in range(1000)]
+        shards = [[appID for appID in apps if in_shard(appID, (i, 3))] for i in range(3)]
+        self.assertEqual(sorted(sum(shards, []), key=int), apps)
+        self.assertTrue(all(shards))
+        # Stable across calls and independent of the appID's type
+        self.assertEqual(in_shard('570', (1, 3)), in_shard(570, (1, 3)))
+        self.assertTrue(in_shard('570', None))
+
+    def test_shard_prefix(self):
+        self.assertEqual(shard_prefix(None), '')
+        self.assertEqual(shard_prefix((1, 4)), config.SHARDS_PREFIX + '1-of-4/')
+
+    def test_merge_shards(self):
+        store = {
+            config.MANIFEST_FILE: {'chunks': ['chunk_1.json']},
+            config.METADATA_FILE: ['1'],
+            config.NOTRELEASED_FILE: ['5'],
+            config.STATE_FILE: {'1': {'scraped_at': 10}},
+            'shards/0-of-2/manifest.json': {'chunks': ['shards/0-of-2/chunk_1.json']},
+            'shards/0-of-2/metadata_index.json': ['2', '5'],
+            'shards/0-of-2/discarded.json': ['3'],
+            'shards/0-of-2/app_state.json': {'2': {'scraped_at': 20}},
+            'shards/1-of-2/manifest.json': {'chunks': ['shards/1-of-2/chunk_1.json']},
+            'shards/1-of-2/notreleased.json': ['6'],
+            'shards/1-of-2/app_state.json': {'1': {'scraped_at': 5}},
+        }
+        saved = {}
+        with patch('sharding.compact_journal') as mock_compact, \
+             patch('sharding.load_from_s3', side_effect=lambda bucket, key: store.get(key)), \
+             patch('utils.load_from_s3', side_effect=lambda bucket, key: store.get(key)), \
+             patch('utils.load_bytes_from_s3', side_effect=lambda bucket, key: store.get(key)), \
+             patch('sharding.save_to_s3', side_effect=lambda bucket, key, data: saved.__setitem__(key, data) or True), \
+             patch('utils.save_to_s3', side_effect=lambda bucket, key, data: saved.__setitem__(key, data) or True), \
+             patch('utils.save_bytes_to_s3', side_effect=lambda bucket, key, data: saved.__setitem__(key, data) or True):
+            manifest = merge_shards(self.bucket_name, 2)
+            # The second merge reads back the binary indexes written by the first
+            store.update(saved)
+            merge_shards(self.bucket_name, 2)
+
+        mock_compact.assert_any_call(self.bucket_name, 'shards/1-of-2/')
+        self.assertEqual(manifest['chunks'], ['chunk_1.json', 'shards/0-of-2/chunk_1.json', 'shards/1-of-2/chunk_1.json'])
+        self.assertEqual(saved[config.MANIFEST_FILE]['chunks'], manifest['chunks'])
+        self.assertEqual(AppIDSet.from_bytes(saved['metadata_index.bin']), {'1', '2', '5'})
+        self.assertEqual(AppIDSet.from_bytes(saved['discarded.bin']), {'3'})
+        # '5' has been released since it was listed as not released
+        self.assertEqual(AppIDSet.from_bytes(saved['notreleased.bin']), {'6'})
+        self.assertEqual(saved[config.STATE_FILE], {'1': {'scraped_at': 10}, '2': {'scraped_at': 20}})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import unittest
+import sys
+import os
+import io
+import json
+import tempfile
+
+# Add the transformer directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'transformer')))
+
+import polars as pl
+from polars.testing import assert_frame_equal
+from polars_transformer import input_files, to_ndjson, scan_games, transform, generate_dataframes, pending_files, read_games, schema
+
+GAME = {
+    'name': 'Counter-Strike', 'release_date': 'Nov 1, 2000', 'required_age': 0, 'price': 9.99, 'dlc_count': 0,
+    'windows': True, 'mac': True, 'linux': True, 'metacritic_score': 88, 'achievements': 0, 'recommendations': 150000,
+    'supported_languages': ['English', 'French'], 'full_audio_languages': ['English'],
+    'developers': ['Valve'], 'publishers': ['Valve'], 'categories': ['Multi-player', 'PvP'], 'genres': ['Action'],
+    'user_score': 0, 'score_rank': '', 'positive': 200000, 'negative': 5000, 'estimated_owners': '10000000 - 20000000',
+    'average_playtime_forever': 10000, 'average_playtime_2weeks': 500, 'median_playtime_forever': 300,
+    'median_playtime_2weeks': 50, 'peak_ccu': 12000,
+}
+
+class TestTransformer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data, **kwargs):
+        path = os.path.join(self.path, name)
+        with open(path, 'w') as f:
+            json.dump(data, f, **kwargs)
+        return path
+
+    def test_input_files(self):
+        for name in ['chunk_10.json', 'chunk_2.json', 'chunk_1.json', 'other.json']:
+            self.write(name, {})
+        self.assertEqual([os.path.basename(path) for path in input_files(self.path)], ['chunk_1.json', 'chunk_2.json', 'chunk_10.json'])
+
+        self.write('manifest.json', {'chunks': ['shards/0-of-2/chunk_2.json', 'chunk_1.json']})
+        self.assertEqual([os.path.basename(path) for path in input_files([self.path])], ['chunk_2.json', 'chunk_1.json'])
+
+    def test_to_ndjson(self):
+        path = self.write('games.json', {'10': GAME, '20': {}}, indent=4)
+        out = io.BytesIO()
+        to_ndjson([path], out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0]), {'app_id': '10', **GAME})
+        self.assertEqual(json.loads(lines[1]), {'app_id': '20'})
+
+    def test_scan_games(self):
+        self.write('chunk_1.json', {'10': {**GAME, 'price': 1.0}, '20': {'name': 'Partial'}})
+        self.write('chunk_2.json', {'10': GAME})
+        df = scan_games(self.path, self.path).collect()
+
+        self.assertEqual(df.columns, list(schema))
+        self.assertTrue(all(df.schema[name] == dtype for name, dtype in schema.items()))
+        self.assertEqual(df['app_id'].to_list(), ['20', '10'])
+        game = df.row(1, named=True)
+        self.assertEqual(game['price'], 9.99)  # The record in the later chunk wins
+        self.assertEqual(game['supported_languages'], ['English', 'French'])
+        self.assertEqual(game['categories'], ['Multi-player', 'PvP'])
+        self.assertEqual(df.schema['genres'], pl.List(pl.Categorical))
+        self.assertFalse(game['support_email'])
+
+        # Missing fields get their defaults
+        partial = df.row(0, named=True)
+        self.assertEqual((partial['price'], partial['genres'], partial['windows'], partial['estimated_owners']), (0.0, [], False, ''))
+
+    def test_scan_ndjson(self):
+        path = os.path.join(self.path, 'games.jsonl')
+        with open(path, 'w') as f:
+            f.write(json.dumps({'app_id': '10', **GAME}) + '\n')
+        df = scan_games(path).collect()
+        self.assertEqual(df.row(0, named=True)['developers'], ['Valve'])
+        with self.assertRaises(ValueError):
+            scan_games(self.write('games.json', {}))
+
+    def test_transform(self):
+        path = self.write('steam_games.json', {str(appID): {**GAME, 'genres': ['Action', 'Indie']} for appID in range(20)}, indent=4)
+        output_dir = os.path.join(self.path, 'parquet_tables')
+        dataframes = transform(path, output_dir)
+
+        self.assertEqual(len(dataframes['steam_games']), 20)
+        self.assertEqual(sorted(os.listdir(output_dir)), sorted([*(f'{name}.parquet' for name in dataframes), 'state']))
+        genres = pl.read_parquet(os.path.join(output_dir, 'genre_counts.parquet'))
+        self.assertEqual(sorted(genres.rows()), [('Action', 20), ('Indie', 20)])
+
+    def assert_same_tables(self, dataframes, output_dir):
+        for name, dataframe in dataframes.items():
+            expected = pl.read_parquet(os.path.join(output_dir, f'{name}.parquet'))
+            key = [column for column in expected.columns if not isinstance(expected.schema[column], pl.List)]
+            assert_frame_equal(dataframe.sort(key), expected.sort(key), check_dtypes=False)
+
+    def test_transform_incremental(self):
+        chunks = os.path.join(self.path, 'chunks')
+        os.makedirs(chunks)
+        games = {str(appID): {**GAME, 'name': f'Game {appID}', 'price': float(appID % 7), 'peak_ccu': appID % 5,
+                              'genres': [['Action'], ['Indie', 'RPG'], []][appID % 3]} for appID in range(30)}
+        for index in range(2):
+            with open(os.path.join(chunks, f'chunk_{index + 1}.json'), 'w') as f:
+                json.dump({appID: games[appID] for appID in list(games)[15 * index:15 * (index + 1)]}, f)
+        output_dir = os.path.join(self.path, 'incremental')
+        transform(chunks, output_dir, incremental=True)  # No state yet: a full run
+
+        # A new chunk with new games and new records of games already read
+        with open(os.path.join(chunks, 'chunk_3.json'), 'w') as f:
+            json.dump({'3': {**GAME, 'genres': ['Strategy'], 'price': 30.0}, '4': {**GAME, 'release_date': 'Jan 1, 2030'}, '100': GAME}, f)
+        dataframes = transform(chunks, output_dir, incremental=True)
+        self.assertEqual(len(dataframes['steam_games']), 31)
+        self.assertIn(('Strategy', 1), dataframes['genre_counts'].rows())
+
+        full_dir = os.path.join(self.path, 'full')
+        transform(chunks, full_dir)
+        self.assert_same_tables(dataframes, full_dir)
+        self.assertEqual(transform(chunks, output_dir, incremental=True), {})
+
+        # A chunk read before changed: the whole input is read again
+        with open(os.path.join(chunks, 'chunk_1.json'), 'w') as f:
+            json.dump({'0': GAME}, f)
+        dataframes = transform(chunks, output_dir, incremental=True)
+        self.assertEqual(len(dataframes['steam_games']), 19)
+        transform(chunks, full_dir)
+        self.assert_same_tables(dataframes, full_dir)
+
+    def test_pending_files(self):
+        paths = [self.write(f'chunk_{index}.json', {}) for index in range(1, 4)]
+        signatures = {os.path.abspath(path): [os.path.getsize(path), os.stat(path).st_mtime_ns] for path in paths[:2]}
+        self.assertEqual(pending_files(paths, signatures), paths[2:])
+        self.assertEqual(pending_files(paths[:2], signatures), [])
+        self.assertIsNone(pending_files([paths[2], *paths[:2]], signatures))  # A new file before the ones read
+        self.assertIsNone(pending_files(paths[1:], signatures))  # A file read is gone
+        self.write('chunk_2.json', {'10': GAME})
+        self.assertIsNone(pending_files(paths, signatures))  # A file read changed
+
+    def test_games_layout(self):
+        games = {str(appID): {**GAME, 'name': f'Game {appID}', 'release_date': f'Jan 1, {2000 + appID % 3}'} for appID in range(30, 0, -1)}
+        games['100'] = {**GAME, 'release_date': 'Coming soon'}
+        path = self.write('steam_games.json', games)
+        output_dir = os.path.join(self.path, 'parquet_tables')
+        transform(path, output_dir, partition_by='release_year')
+
+        # Hive partitions by release year, sorted by app_id
+        games_dir = os.path.join(output_dir, 'steam_games.parquet')
+        self.assertEqual(sorted(os.listdir(games_dir)), ['release_year=2000', 'release_year=2001', 'release_year=2002', 'release_year=__HIVE_DEFAULT_PARTITION__'])
+        partition = pl.read_parquet(os.path.join(games_dir, 'release_year=2001'))
+        self.assertEqual(partition['app_id'].to_list(), sorted(str(appID) for appID in range(1, 31) if appID % 3 == 1))
+
+        self.assertEqual(read_games(output_dir, app_ids=[7], columns=['name', 'release_year']).rows(), [('Game 7', 2001)])
+        self.assertEqual(len(read_games(output_dir, years=[2000, 2002])), 20)
+        games = read_games(output_dir)
+        self.assertEqual((len(games), games.columns), (31, [*schema, 'release_year']))
+        self.assertEqual(games.schema['genres'], pl.List(pl.Categorical))
+
+        # By default a single file, sorted by app_id, replaces the partitions
+        transform(path, output_dir)
+        self.assertTrue(os.path.isfile(games_dir))
+        self.assertEqual(pl.read_parquet(games_dir, columns=['app_id'])['app_id'].to_list(), sorted(str(appID) for appID in [*range(1, 31), 100]))
+        self.assertEqual(read_games(output_dir, app_ids=[7], columns=['name', 'release_year']).rows(), [('Game 7', 2001)])
+        self.assertEqual(read_games(output_dir, years=[2002], columns=['app_id'])['app_id'].to_list(), sorted(str(appID) for appID in range(1, 31) if appID % 3 == 2))
+
+    def test_generate_dataframes(self):
+        games = pl.DataFrame([
+            {**GAME, 'app_id': '10', 'genres': ['Action', 'Indie'], 'developers': ['Valve', 'Hidden Path'], 'price': 10.0},
+            {**GAME, 'app_id': '20', 'genres': ['Indie'], 'developers': ['Valve'], 'price': 0.0},
+            {**GAME, 'app_id': '30', 'genres': ['Indie'], 'developers': ['KOEI TECMO GAMES CO., LTD.'], 'price': 5.0, 'positive': 0},
+            {**GAME, 'app_id': '40', 'genres': [], 'developers': [], 'price': 1.0},
+        ], schema={name: dtype for name, dtype in schema.items() if name != 'support_email'})
+        dataframes = generate_dataframes(games.lazy())
+
+        self.assertEqual(sorted(dataframes['genre_counts'].rows()), [('Action', 1), ('Indie', 3)])
+        self.assertEqual(sorted(dataframes['avg_price_by_genre'].rows()), [('Action', 10.0), ('Indie', 5.0)])
+        self.assertEqual(sorted(dataframes['top_10_languages'].rows()), [('English', 4), ('French', 4)])
+        self.assertEqual(sorted(dataframes['top_10_developers'].rows()), [('Hidden Path', 1, 10.0), ('KOEI TECMO GAMES CO., LTD.', 1, 5.0), ('Valve', 2, 5.0)])
+        self.assertTrue(dataframes['price_distribution'].equals(games.select('price').describe()))
+        self.assertEqual(dataframes['platform_distribution'].rows(), [(4, 4, 4)])
+
+if __name__ == '__main__':
+    unittest.main()
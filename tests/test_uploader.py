@@ -0,0 +1,141 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import threading
+
+# Add the src directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from uploader import ChunkBuffer, ChunkUploader, EncodeChunk, UploadError
+import config
+
+class TestChunkBuffer(unittest.TestCase):
+
+    def test_size_and_full(self):
+        chunk = ChunkBuffer(max_bytes=60)
+        chunk.add('1', {'name': 'Game 1'})
+        self.assertEqual(chunk.size, len(b'{"name":"Game 1"}'))
+        self.assertFalse(chunk.full())
+        # Replacing a record does not count it twice
+        chunk.add('1', {'name': 'Game 1'})
+        self.assertEqual(chunk.size, len(b'{"name":"Game 1"}'))
+        chunk.add('2', {'name': 'Game 2', 'tags': ['a', 'b']})
+        chunk.add('3', {'name': 'Game 3'})
+        self.assertTrue(chunk.full())
+
+    def test_max_records(self):
+        chunk = ChunkBuffer(max_bytes=10 ** 9, max_records=2)
+        chunk.add('1', {})
+        self.assertFalse(chunk.full())
+        chunk.add('2', {})
+        self.assertTrue(chunk.full())
+
+    def test_take_and_encode(self):
+        chunk = ChunkBuffer()
+        chunk.add('1', {'name': 'Game 1'})
+        chunk.add('2', {'name': 'Jöga "2"'})
+        records = chunk.take()
+        self.assertEqual(len(chunk), 0)
+        self.assertEqual(chunk.size, 0)
+        self.assertEqual(json.loads(EncodeChunk(records)), {'1': {'name': 'Game 1'}, '2': {'name': 'Jöga "2"'}})
+        self.assertEqual(json.loads(EncodeChunk({})), {})
+
+class TestChunkUploader(unittest.TestCase):
+
+    def setUp(self):
+        self.bucket_name = 'test-bucket'
+
+    @patch('uploader.save_bytes_to_s3')
+    def test_save_chunk(self, mock_save):
+        uploader = ChunkUploader(self.bucket_name)
+        chunk = ChunkBuffer()
+        chunk.add('1', {'name': 'Game 1'})
+        manifest = uploader.save_chunk(chunk, {'chunks': ['chunk_1.json']}, 'shards/0-of-2/')
+        self.assertEqual(manifest, {'chunks': ['chunk_1.json', 'shards/0-of-2/chunk_2.json']})
+        self.assertEqual(len(chunk), 0)
+        uploader.flush()
+        key, body = mock_save.call_args[0][1:]
+        self.assertEqual(key, 'shards/0-of-2/chunk_2.json')
+        self.assertEqual(json.loads(body), {'1': {'name': 'Game 1'}})
+        uploader.close()
+        self.assertFalse(uploader.thread.is_alive())
+        self.assertEqual(uploader.uploaded, 1)
+
+    @patch('uploader.save_bytes_to_s3')
+    def test_backpressure(self, mock_save):
+        release = threading.Event()
+        mock_save.side_effect = lambda *args: release.wait(5)
+        uploader = ChunkUploader(self.bucket_name, max_pending=1)
+        manifest = {'chunks': []}
+
+        def submit(n):
+            for appID in range(n):
+                chunk = ChunkBuffer()
+                chunk.add(str(appID), {})
+                uploader.save_chunk(chunk, manifest)
+
+        # One chunk in upload and one waiting: the third has to wait for the upload
+        submitter = threading.Thread(target=submit, args=(3,))
+        submitter.start()
+        submitter.join(0.3)
+        self.assertTrue(submitter.is_alive())
+        self.assertEqual(len(manifest['chunks']), 2)
+
+        release.set()
+        submitter.join(5)
+        uploader.close()
+        self.assertEqual(mock_save.call_count, 3)
+        self.assertEqual(manifest['chunks'], ['chunk_1.json', 'chunk_2.json', 'chunk_3.json'])
+
+    @patch('uploader.time.sleep')
+    @patch('uploader.save_bytes_to_s3', side_effect=[False, False, True])
+    def test_failed_upload_is_retried(self, mock_save, mock_sleep):
+        uploader = ChunkUploader(self.bucket_name)
+        uploader.save_bytes('a', b'{}')
+        uploader.close()
+        self.assertEqual(mock_save.call_count, 3)
+        self.assertEqual([call[0][0] for call in mock_sleep.call_args_list], [config.UPLOAD_BACKOFF, 2 * config.UPLOAD_BACKOFF])
+        self.assertEqual(uploader.uploaded, 1)
+
+    @patch('uploader.time.sleep')
+    @patch('uploader.save_bytes_to_s3')
+    def test_failed_upload_is_raised_and_stops_later_uploads(self, mock_save, mock_sleep):
+        # S3 stub that rejects every chunk but accepts anything else
+        mock_save.side_effect = lambda bucket, key, data: not key.startswith('chunk_')
+        uploader = ChunkUploader(self.bucket_name)
+        chunk = ChunkBuffer()
+        chunk.add('1', {})
+        uploader.save_chunk(chunk, {'chunks': []})
+        with self.assertRaises(UploadError):
+            uploader.flush()
+        self.assertEqual(mock_save.call_count, config.UPLOAD_RETRIES + 1)
+        self.assertEqual(uploader.uploaded, 0)
+        with self.assertRaises(UploadError):
+            uploader.save_bytes('journal/segment_000001.ndjson', b'')
+        with self.assertRaises(UploadError):
+            uploader.close()
+
+    @patch('uploader.save_bytes_to_s3')
+    def test_upload_error_does_not_stop_uploader(self, mock_save):
+        release = threading.Event()
+
+        def save(*args):
+            release.wait(5)
+            raise Exception('S3 down')
+
+        mock_save.side_effect = save
+        uploader = ChunkUploader(self.bucket_name)
+        uploader.save_bytes('chunk_1.json', b'{}')
+        # A segment queued behind the failed chunk is not uploaded
+        uploader.save_bytes('journal/segment_000001.ndjson', b'')
+        release.set()
+        with self.assertRaises(UploadError):
+            uploader.close()
+        self.assertFalse(uploader.thread.is_alive())
+        self.assertEqual(mock_save.call_count, 1)
+        self.assertEqual(uploader.failed, ['chunk_1.json', 'journal/segment_000001.ndjson'])
+
+if __name__ == '__main__':
+    unittest.main()
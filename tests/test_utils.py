@@ -9,10 +9,12 @@ from botocore.exceptions import ClientError
 # Add the src directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 
-from utils import (save_to_s3, load_from_s3, save_chunk_to_s3, merge_chunks,
+from utils import (save_to_s3, save_bytes_to_s3, load_from_s3, load_bytes_from_s3, list_s3_keys, delete_from_s3, save_chunk_to_s3, merge_chunks,
                    SanitizeText, Log, ProgressLog, PriceToFloat,
-                   load_metadata_index, save_metadata_index, update_metadata_index)
+                   load_metadata_index, save_metadata_index, update_metadata_index,
+                   load_app_state, save_app_state, update_app_state, seed_app_state, stale_apps, RecordHash, LazyS3Client, s3_error_code)
 import config
+from appidset import AppIDSet
 
 class TestUtils(unittest.TestCase):
 
@@ -23,8 +25,16 @@ class TestUtils(unittest.TestCase):
     @patch('utils.s3_client')
     def test_save_to_s3(self, mock_s3):
         data = {'key': 'value'}
-        save_to_s3(self.bucket_name, 'test.json', data)
+        self.assertTrue(save_to_s3(self.bucket_name, 'test.json', data))
         mock_s3.upload_fileobj.assert_called_once()
+        mock_s3.upload_fileobj.side_effect = Exception('S3 down')
+        self.assertFalse(save_to_s3(self.bucket_name, 'test.json', data))
+
+    @patch('utils.s3_client')
+    def test_save_bytes_to_s3(self, mock_s3):
+        save_bytes_to_s3(self.bucket_name, 'test.csv', b'a,b\n')
+        mock_s3.upload_fileobj.assert_called_once()
+        self.assertEqual(mock_s3.upload_fileobj.call_args[0][1:], (self.bucket_name, 'test.csv'))
 
     @patch('utils.s3_client')
     def test_load_from_s3(self, mock_s3):
@@ -47,22 +57,87 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(len(result['chunks']), 1)
         mock_save.assert_called_once()
 
+        result = save_chunk_to_s3(self.bucket_name, chunk, manifest, 'shards/0-of-2/')
+        self.assertEqual(result['chunks'][-1], 'shards/0-of-2/chunk_2.json')
+
+    @patch('utils.s3_client')
     @patch('utils.load_from_s3')
-    @patch('utils.save_to_s3')
-    def test_merge_chunks(self, mock_save, mock_load):
-        mock_load.side_effect = [
-            {'chunks': ['chunk_1.json', 'chunk_2.json']},
-            {'1': {'name': 'Game 1'}},
-            {'2': {'name': 'Game 2'}}
-        ]
+    def test_merge_chunks(self, mock_load, mock_s3):
+        chunks = {
+            'manifest.json': {'chunks': ['chunk_1.json', 'chunk_2.json']},
+            'chunk_1.json': {'1': {'name': 'Game 1', 'tags': {'a': 1}}},
+            'chunk_2.json': {'2': {'name': 'Game 2'}},
+        }
+        mock_load.side_effect = lambda bucket, key: chunks[key]
+        merge_chunks(self.bucket_name, 'output.json')
+        mock_s3.put_object.assert_called_once()
+        body = mock_s3.put_object.call_args[1]['Body']
+        expected = {'2': {'name': 'Game 2'}, '1': {'name': 'Game 1', 'tags': {'a': 1}}}
+        self.assertEqual(body, json.dumps(expected, indent=4).encode('utf-8'))
+
+    @patch('utils.s3_client')
+    @patch('utils.load_from_s3')
+    def test_merge_chunks_last_writer_wins(self, mock_load, mock_s3):
+        chunks = {
+            'manifest.json': {'chunks': ['chunk_1.json', 'chunk_2.json', 'chunk_3.json']},
+            'chunk_1.json': {'1': {'v': 1}, '2': {'v': 1}},
+            'chunk_2.json': {'1': {'v': 2}},
+            'chunk_3.json': None,  # Missing chunks are skipped
+        }
+        mock_load.side_effect = lambda bucket, key: chunks[key]
+        merge_chunks(self.bucket_name, 'output.json', workers=2)
+        body = mock_s3.put_object.call_args[1]['Body']
+        self.assertEqual(json.loads(body), {'1': {'v': 2}, '2': {'v': 1}})
+
+    @patch('utils.s3_client')
+    @patch('utils.load_from_s3')
+    def test_merge_chunks_multipart(self, mock_load, mock_s3):
+        chunks = {'manifest.json': {'chunks': [f'chunk_{n}.json' for n in range(5)]}}
+        for n in range(5):
+            chunks[f'chunk_{n}.json'] = {str(n * 10 + i): {'name': 'x' * 50} for i in range(10)}
+        mock_load.side_effect = lambda bucket, key: chunks[key]
+        mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload'}
+        mock_s3.upload_part.side_effect = lambda **kwargs: {'ETag': str(kwargs['PartNumber'])}
+
+        merge_chunks(self.bucket_name, 'output.json', part_size=1000)
+
+        mock_s3.put_object.assert_not_called()
+        parts = [kwargs['Body'] for _, kwargs in mock_s3.upload_part.call_args_list]
+        self.assertGreater(len(parts), 1)
+        self.assertTrue(all(len(part) >= 1000 for part in parts[:-1]))
+        self.assertEqual(len(json.loads(b''.join(parts))), 50)
+        completed = mock_s3.complete_multipart_upload.call_args[1]['MultipartUpload']['Parts']
+        self.assertEqual([part['PartNumber'] for part in completed], list(range(1, len(parts) + 1)))
+
+    @patch('utils.s3_client')
+    @patch('utils.load_from_s3')
+    def test_merge_chunks_aborts_on_error(self, mock_load, mock_s3):
+        mock_load.side_effect = lambda bucket, key: {'chunks': ['chunk_1.json']} if key == 'manifest.json' else {'1': {}}
+        mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload'}
+        mock_s3.upload_part.side_effect = Exception('S3 down')
+        merge_chunks(self.bucket_name, 'output.json', part_size=1)
+        mock_s3.abort_multipart_upload.assert_called_once_with(Bucket=self.bucket_name, Key='output.json', UploadId='upload')
+        mock_s3.complete_multipart_upload.assert_not_called()
+
+    @patch('utils.s3_client')
+    @patch('utils.load_from_s3')
+    def test_merge_chunks_empty(self, mock_load, mock_s3):
+        mock_load.side_effect = lambda bucket, key: {'chunks': ['chunk_1.json']} if key == 'manifest.json' else {}
         merge_chunks(self.bucket_name, 'output.json')
-        mock_save.assert_called_once_with(self.bucket_name, 'output.json', {'1': {'name': 'Game 1'}, '2': {'name': 'Game 2'}})
+        mock_s3.put_object.assert_not_called()
 
     def test_SanitizeText(self):
         text = "<p>Test   text</p>"
         result = SanitizeText(text)
         self.assertEqual(result, "Test text")
 
+    def test_SanitizeText_entities_and_whitespace(self):
+        self.assertEqual(SanitizeText('<h2 class="bb_tag">A&amp;B</h2><br>\r\n\t&quot;Hi&quot;&nbsp;&nbsp;there&#39;s'), 'A&B "Hi" there\'s')
+        # Tags alone join the text around them, and decoded markup is kept as text
+        self.assertEqual(SanitizeText('a<br>b &lt;i&gt;'), 'ab <i>')
+        self.assertEqual(SanitizeText(''), '')
+        self.assertIsNone(SanitizeText(None))
+
     @patch('utils.logger')
     def test_Log(self, mock_logger):
         Log(config.INFO, "Test message")
@@ -78,24 +153,51 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(PriceToFloat("$9.99"), 9.99)
         self.assertEqual(PriceToFloat("Free"), 0.0)
 
+    @patch('utils.load_bytes_from_s3', return_value=None)
     @patch('utils.load_from_s3')
-    def test_load_metadata_index(self, mock_load):
+    def test_load_metadata_index(self, mock_load, mock_load_bytes):
+        # Falls back to the JSON list when there is no binary index yet
         mock_load.return_value = ['1', '2', '3']
         result = load_metadata_index(self.bucket_name)
         self.assertEqual(result, {'1', '2', '3'})
+        mock_load_bytes.assert_called_once_with(self.bucket_name, 'metadata_index.bin')
+        mock_load.assert_called_once_with(self.bucket_name, config.METADATA_FILE)
 
-    @patch('utils.save_to_s3')
+    @patch('utils.load_from_s3')
+    @patch('utils.load_bytes_from_s3')
+    def test_load_metadata_index_binary(self, mock_load_bytes, mock_load):
+        mock_load_bytes.return_value = AppIDSet(['1', '2']).to_bytes()
+        self.assertEqual(load_metadata_index(self.bucket_name, 'shards/0-of-2/'), {'1', '2'})
+        mock_load_bytes.assert_called_once_with(self.bucket_name, 'shards/0-of-2/metadata_index.bin')
+        mock_load.assert_not_called()
+
+    @patch('utils.save_bytes_to_s3')
     def test_save_metadata_index(self, mock_save):
         metadata = {'1', '2', '3'}
         save_metadata_index(self.bucket_name, metadata)
         mock_save.assert_called_once()
         # Check that the correct bucket and file name were used
         self.assertEqual(mock_save.call_args[0][0], self.bucket_name)
-        self.assertEqual(mock_save.call_args[0][1], config.METADATA_FILE)
-        # Check that the saved data is a list containing the same elements as the metadata set
+        self.assertEqual(mock_save.call_args[0][1], 'metadata_index.bin')
+        # Check that the saved data is an AppIDSet containing the same elements as the metadata set
         saved_data = mock_save.call_args[0][2]
-        self.assertIsInstance(saved_data, list)
-        self.assertEqual(set(saved_data), metadata)
+        self.assertEqual(AppIDSet.from_bytes(saved_data), metadata)
+
+    @patch('utils.s3_client')
+    def test_list_and_delete_s3_keys(self, mock_s3):
+        mock_s3.get_paginator.return_value.paginate.return_value = [
+            {'Contents': [{'Key': 'journal/b'}]}, {'Contents': [{'Key': 'journal/a'}]}, {}]
+        self.assertEqual(list_s3_keys(self.bucket_name, 'journal/'), ['journal/a', 'journal/b'])
+        delete_from_s3(self.bucket_name, [f'key_{n}' for n in range(1500)])
+        self.assertEqual(mock_s3.delete_objects.call_count, 2)
+        self.assertEqual(len(mock_s3.delete_objects.call_args[1]['Delete']['Objects']), 500)
+
+    @patch('utils.s3_client')
+    def test_load_bytes_from_s3(self, mock_s3):
+        mock_s3.download_fileobj.side_effect = lambda bucket, key, file_obj: file_obj.write(b'data')
+        self.assertEqual(load_bytes_from_s3(self.bucket_name, 'test.bin'), b'data')
+        mock_s3.download_fileobj.side_effect = ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        self.assertIsNone(load_bytes_from_s3(self.bucket_name, 'test.bin'))
 
     def test_update_metadata_index(self):
         metadata = {'1', '2'}
@@ -103,5 +205,64 @@ class TestUtils(unittest.TestCase):
         result = update_metadata_index(metadata, chunk)
         self.assertEqual(result, {'1', '2', '3', '4'})
 
+    @patch('utils.load_from_s3')
+    def test_load_app_state(self, mock_load):
+        mock_load.return_value = None
+        self.assertEqual(load_app_state(self.bucket_name), {})
+        mock_load.assert_called_once_with(self.bucket_name, config.STATE_FILE)
+
+    @patch('utils.save_to_s3')
+    def test_save_app_state(self, mock_save):
+        state = {'1': {'scraped_at': 100, 'hash': 'abc'}}
+        save_app_state(self.bucket_name, state)
+        mock_save.assert_called_once_with(self.bucket_name, config.STATE_FILE, state)
+
+    def test_record_hash(self):
+        self.assertEqual(RecordHash({'a': 1, 'b': [1, 2]}), RecordHash({'b': [1, 2], 'a': 1}))
+        self.assertNotEqual(RecordHash({'a': 1}), RecordHash({'a': 2}))
+
+    def test_update_app_state(self):
+        state = {}
+        update_app_state(state, '1', 100.5, 90, 'abc')
+        self.assertEqual(state['1'], {'scraped_at': 100, 'last_modified': 90, 'hash': 'abc'})
+        update_app_state(state, '1', 200)
+        self.assertEqual(state['1'], {'scraped_at': 200, 'last_modified': 90, 'hash': 'abc'})
+
+    def test_stale_apps(self):
+        state = {
+            '1': {'scraped_at': 1000, 'last_modified': 500},  # Fresh and unchanged
+            '2': {'scraped_at': 1000, 'last_modified': 500},  # Changed upstream
+            '3': {'scraped_at': 10},                          # Too old
+            '5': {'scraped_at': 1000},                        # Unknown upstream time, fresh
+        }
+        modified = {'1': 500, '2': 800, '5': 900}
+        result = stale_apps({'1', '2', '3', '4', '5'}, state, modified, max_age=100, now=1050)
+        self.assertEqual(sorted(result), ['2', '3', '4'])
+
+    def test_seed_app_state(self):
+        state = {'1': {'scraped_at': 10}, '2': {'expected_release': 20}}
+        self.assertEqual(seed_app_state({'1', '2', '3'}, state, {'3': 900}, now=1000.5), 2)
+        self.assertEqual(state, {'1': {'scraped_at': 10}, '2': {'expected_release': 20, 'scraped_at': 1000},
+                                 '3': {'scraped_at': 1000, 'last_modified': 900}})
+
+        # Seeded apps are fresh until they age out or change upstream
+        self.assertEqual(stale_apps({'1', '2', '3'}, state, {'3': 900}, max_age=100, now=1050), ['1'])
+        self.assertEqual(sorted(stale_apps({'1', '2', '3'}, state, {'3': 950}, max_age=100, now=1050)), ['1', '3'])
+
+    @patch('boto3.client')
+    def test_lazy_s3_client(self, mock_client):
+        client = LazyS3Client()
+        mock_client.assert_not_called()
+
+        client.put_object(Bucket=self.bucket_name, Key='a', Body=b'')
+        client.get_object(Bucket=self.bucket_name, Key='a')
+        mock_client.assert_called_once()
+        mock_client.return_value.put_object.assert_called_once()
+        mock_client.return_value.get_object.assert_called_once()
+
+    def test_s3_error_code(self):
+        self.assertEqual(s3_error_code(ClientError({'Error': {'Code': '404'}}, 'HeadObject')), '404')
+        self.assertIsNone(s3_error_code(ValueError('not an S3 error')))
+
 if __name__ == '__main__':
     unittest.main()
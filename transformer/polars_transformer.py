@@ -1,47 +1,24 @@
-import polars as pl
+import argparse
 import json
 import os
+import re
+import shutil
+import tempfile
+import msgspec
+import polars as pl
 
-# Load the JSON data
-data_path = os.path.join(os.path.dirname(__file__), '../data/steam_games.json')
-with open(data_path, 'r') as f:
-    data = json.load(f)
-
-# Initialize an empty list to hold processed game data
-data_list = [
-    {
-        'app_id': app_id,
-        'name': game_data.get('name', ''),
-        'release_date': game_data.get('release_date', ''),
-        'required_age': game_data.get('required_age', 0),
-        'price': game_data.get('price', 0.0),
-        'dlc_count': game_data.get('dlc_count', 0),
-        'support_email': game_data.get('support_email', False),
-        'windows': game_data.get('windows', False),
-        'mac': game_data.get('mac', False),
-        'linux': game_data.get('linux', False),
-        'metacritic_score': game_data.get('metacritic_score', 0),
-        'achievements': game_data.get('achievements', 0),
-        'recommendations': game_data.get('recommendations', 0),
-        'supported_languages': ', '.join(game_data.get('supported_languages', [])),
-        'full_audio_languages': ', '.join(game_data.get('full_audio_languages', [])),
-        'developers': ', '.join(game_data.get('developers', [])),
-        'publishers': ', '.join(game_data.get('publishers', [])),
-        'categories': ', '.join(game_data.get('categories', [])),
-        'genres': ', '.join(game_data.get('genres', [])),
-        'user_score': game_data.get('user_score', 0),
-        'score_rank': game_data.get('score_rank', ''),
-        'positive': game_data.get('positive', 0),
-        'negative': game_data.get('negative', 0),
-        'estimated_owners': game_data.get('estimated_owners', ''),
-        'average_playtime_forever': game_data.get('average_playtime_forever', 0),
-        'average_playtime_2weeks': game_data.get('average_playtime_2weeks', 0),
-        'median_playtime_forever': game_data.get('median_playtime_forever', 0),
-        'median_playtime_2weeks': game_data.get('median_playtime_2weeks', 0),
-        'peak_ccu': game_data.get('peak_ccu', 0)
-    }
-    for app_id, game_data in data.items()
-]
+DATA_PATH = os.path.join(os.path.dirname(__file__), '../data/steam_games.json')
+OUTPUT_DIR = './parquet_tables'
+NDJSON_EXTENSIONS = ('.jsonl', '.ndjson')
+CHUNK_RE = re.compile(r'chunk_(\d+)\.json$')
+GAMES_FILE = 'steam_games.parquet'
+
+# Layout of steam_games.parquet (see write_games)
+PARTITION_BY = None           # Hive partition column, e.g. 'release_year' (None for a single file)
+SORT_BY = 'app_id'            # Rows are sorted by this column, so lookups by it skip most row groups
+ROW_GROUP_SIZE = 65536        # Rows per row group
+COMPRESSION = 'zstd'
+COMPRESSION_LEVEL = 3
 
 # Define the schema based on the provided types
 schema = {
@@ -58,12 +35,12 @@ schema = {
     'metacritic_score': pl.Int64,
     'achievements': pl.Int64,
     'recommendations': pl.Int64,
-    'supported_languages': pl.Utf8,
-    'full_audio_languages': pl.Utf8,
-    'developers': pl.Utf8,
-    'publishers': pl.Utf8,
-    'categories': pl.Utf8,
-    'genres': pl.Utf8,
+    'supported_languages': pl.List(pl.Categorical),
+    'full_audio_languages': pl.List(pl.Categorical),
+    'developers': pl.List(pl.Utf8),
+    'publishers': pl.List(pl.Utf8),
+    'categories': pl.List(pl.Categorical),
+    'genres': pl.List(pl.Categorical),
     'user_score': pl.Int64,
     'score_rank': pl.Utf8,
     'positive': pl.Int64,
@@ -76,148 +53,526 @@ schema = {
     'peak_ccu': pl.Int64
 }
 
-# Convert to Polars DataFrame with the specified schema
-df = pl.DataFrame(data_list, schema=schema)
+# The schema of the scraped records, applied while they are read. The lists of
+# few distinct values (genres, categories, languages) are then made categorical,
+# which Parquet stores dictionary encoded.
+record_schema = {name: pl.List(pl.Utf8) if dtype.base_type() == pl.List else dtype for name, dtype in schema.items()}
 
-# Function to generate additional DataFrames
-def generate_dataframes(df):
-    dataframes = {
+def default(dtype):
+    '''
+    Value of a field missing from a record.
+    '''
+    if dtype.base_type() == pl.List:
+        return pl.lit([], dtype=dtype)
+    return {pl.Utf8: '', pl.Int64: 0, pl.Float64: 0.0, pl.Boolean: False}[dtype]
+
+def input_files(paths):
+    '''
+    Expand the input paths into a list of files. A directory stands for the chunk
+    files it holds, in the order of its manifest.json if there is one, otherwise
+    in chunk number order.
+    '''
+    files = []
+    for path in [paths] if isinstance(paths, str) else paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        manifest_path = os.path.join(path, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                files += [os.path.join(path, os.path.basename(key)) for key in json.load(f)['chunks']]
+        else:
+            chunks = [name for name in os.listdir(path) if CHUNK_RE.search(name)]
+            files += [os.path.join(path, name) for name in sorted(chunks, key=lambda name: int(CHUNK_RE.search(name).group(1)))]
+    return files
+
+def to_ndjson(files, out):
+    '''
+    Write the records of JSON files keyed by AppID (chunk files or the merged
+    file) to a binary file object as newline-delimited JSON, one file at a time,
+    adding the AppID to each record as 'app_id'. Records are copied as raw bytes,
+    without being decoded into Python objects.
+    '''
+    decoder = msgspec.json.Decoder(dict[str, msgspec.Raw])
+    for path in files:
+        with open(path, 'rb') as f:
+            records = decoder.decode(f.read())
+        for app_id, record in records.items():
+            # Strings in JSON have their line breaks escaped, so the only ones are indentation
+            body = bytes(record).replace(b'\n', b'').replace(b'\r', b'')[1:].lstrip()
+            out.write(b'{"app_id":' + msgspec.json.encode(app_id) + (b'' if body.startswith(b'}') else b',') + body + b'\n')
+
+def scan_games(paths=DATA_PATH, workdir=None):
+    '''
+    Lazily read scraped games into a LazyFrame with the columns of `schema`.
+
+    Newline-delimited JSON files (.jsonl or .ndjson, with an 'app_id' field) are
+    scanned directly. JSON files keyed by AppID (chunk files, directories of
+    chunk files or the merged steam_games.json) are first copied record by
+    record into a newline-delimited file in `workdir`, which must exist until the
+    frame is collected. The schema is applied while reading, and a game in more
+    than one file keeps its record from the last one.
+
+    :param paths: A path or a list of paths to files or chunk directories.
+    :param workdir: Directory for the newline-delimited copy of keyed JSON files.
+    '''
+    files = input_files(paths)
+    sources = [path for path in files if path.endswith(NDJSON_EXTENSIONS)]
+    keyed = [path for path in files if not path.endswith(NDJSON_EXTENSIONS)]
+    if keyed:
+        if workdir is None:
+            raise ValueError('A workdir is needed to read JSON files keyed by AppID')
+        converted = os.path.join(workdir, 'games.jsonl')
+        with open(converted, 'wb') as out:
+            to_ndjson(keyed, out)
+        sources.append(converted)
+
+    games = pl.scan_ndjson(sources, schema=record_schema)
+    if len(files) > 1:
+        games = games.unique(subset='app_id', keep='last', maintain_order=True)
+    return games.select([pl.col(name).cast(dtype).fill_null(default(dtype)) for name, dtype in schema.items()])
+
+# Mergeable aggregate states: additive counts and sums by key. The states of two
+# sets of games are merged by summing them, and a game is taken out by adding
+# its state with the opposite sign.
+STATE_KEYS = {
+    'genres': ['genre'],
+    'developers': ['developer'],
+    'languages': ['language'],
+    'years': ['release_year'],
+    'ages': ['age_category'],
+    'prices': ['price'],  # Games per price: the price distribution, exactly
+    'totals': [],
+}
+
+# Top-k states: the games with the highest value of a column, from which the
+# top 10 tables are taken. Keeping more than 10 lets games leave the state
+# without a rescan of every game.
+TOP_K_STATES = {'dlc': 'dlc_count', 'peak_ccu': 'peak_ccu', 'owners': 'estimated_owners_num'}
+TOP_K_SIZE = 1000
+
+STATE_DIR = 'state'          # Directory of the aggregate states, under the output directory
+CHUNKS_FILE = 'chunks.json'  # Signatures of the input files folded into the states
+
+RELEASE_YEAR = pl.col('release_date').str.extract(r', (\d{4})$', 1).cast(pl.Int64).alias('release_year')
+ESTIMATED_OWNERS = pl.col('estimated_owners').str.replace_all(',', '').str.extract(r'(\d+)$', 1).cast(pl.Int64).alias('estimated_owners_num')
+REQUIRED_AGE = pl.col('required_age').fill_null(0).cast(pl.Int64)
+AGE_CATEGORY = (
+    pl.when(REQUIRED_AGE.is_between(-1, 8)).then(pl.lit('1. Everyone'))
+    .when(REQUIRED_AGE.is_between(8, 12)).then(pl.lit('2. PG'))
+    .when(REQUIRED_AGE.is_between(12, 16)).then(pl.lit('3. Teen'))
+    .when(REQUIRED_AGE >= 17).then(pl.lit('4. Mature'))
+    .otherwise(pl.lit('Everyone'))
+).alias('age_category')
+
+def top_k_order(column):
+    # Ties are broken by app_id, so the top games do not depend on the order of the input files
+    return {'by': [column, 'app_id'], 'descending': [True, False]}
+
+def explode_list(games, column, alias, *columns):
+    '''
+    One row per game and item of a list column, with the given columns of the
+    game. Games with an empty list have no row.
+    '''
+    return (
+        games
+        .select(pl.col(column).alias(alias), *columns)
+        .explode(alias)
+        .drop_nulls(alias)
+    )
+
+def aggregate_state(games, sign=1):
+    '''
+    Return the additive aggregate states of a set of games by name, as LazyFrames.
+
+    The list columns are exploded once into dimensions (game-genre,
+    game-developer, game-language) shared by the states that group by them.
+    When the states are collected together with collect_all, Polars computes
+    each shared dimension once and runs the group-bys in parallel.
+
+    :param games: LazyFrame with the columns of `schema`.
+    :param sign: -1 for the state that takes the games out of a merged state.
+    '''
+    game_genres = explode_list(games, 'genres', 'genre', 'price', 'positive', 'negative')
+    game_developers = explode_list(games, 'developers', 'developer', 'price', 'recommendations')
+    game_languages = explode_list(games, 'supported_languages', 'language')
+
+    def total(expr, dtype=pl.Int64):
+        return expr.sum().cast(dtype) * sign
+
+    count = (pl.len().cast(pl.Int64) * sign).alias('games')
+    reviewed = (pl.col('positive') > 0) & (pl.col('negative') > 0)
+    return {
+        'genres': game_genres.group_by('genre').agg(
+            count,
+            total(pl.col('price'), pl.Float64).alias('price_sum'),
+            total(reviewed).alias('reviewed'),
+            total(pl.col('positive').filter(reviewed)).alias('positive_sum'),
+            total(pl.col('negative').filter(reviewed)).alias('negative_sum'),
+        ),
+        'developers': game_developers.group_by('developer').agg(
+            count,
+            total(pl.col('price'), pl.Float64).alias('price_sum'),
+            total(pl.col('recommendations')).alias('recommendations_sum'),
+        ),
+        'languages': game_languages.group_by('language').agg(count),
+        'years': games.group_by(RELEASE_YEAR).agg(count),
+        'ages': games.group_by(AGE_CATEGORY).agg(count),
+        'prices': games.group_by('price').agg(count),
+        'totals': games.select(count, *(total(pl.col(platform)).alias(platform) for platform in ('windows', 'mac', 'linux'))),
+    }
+
+def top_k_state(games, size=TOP_K_SIZE):
+    '''
+    Return the top-k states of a set of games by name, as LazyFrames.
+    '''
+    return {
+        name: (
+            games
+            .select('app_id', 'name', ESTIMATED_OWNERS if column == 'estimated_owners_num' else column)
+            .sort(**top_k_order(column))
+            .head(size)
+        )
+        for name, column in TOP_K_STATES.items()
+    }
+
+def build_state(games):
+    '''
+    Return every aggregate state of a set of games by name, as LazyFrames.
+    '''
+    return {**aggregate_state(games), **top_k_state(games)}
+
+def merge_states(*states):
+    '''
+    Merge additive aggregate states, dropping the keys no game has any more.
+    '''
+    merged = {}
+    for name, keys in STATE_KEYS.items():
+        rows = pl.concat([state[name].lazy() for state in states], how='vertical_relaxed')
+        merged[name] = rows.group_by(keys).agg(pl.all().sum()).filter(pl.col('games') != 0) if keys else rows.sum()
+    return merged
+
+def merge_top_k(state, added, removed, games, size=TOP_K_SIZE):
+    '''
+    Update top-k states: the games in `removed` (a Series of app_ids) leave, and
+    the rows of `added` come in. A state that lost games and is left with fewer
+    than `size` rows while there are more games is rebuilt from `games`, since
+    the games that would enter it are not known.
+
+    :return: Dict of the updated states, as DataFrames.
+    '''
+    merged = {}
+    for name, column in TOP_K_STATES.items():
+        rows = pl.concat([state[name].lazy().filter(~pl.col('app_id').is_in(removed.implode())), added[name].lazy()], how='vertical_relaxed')
+        merged[name] = rows.sort(**top_k_order(column)).head(size).collect()
+        if len(merged[name]) < min(size, len(games)):
+            merged[name] = top_k_state(games.lazy(), size)[name].collect()
+    return merged
+
+def describe_histogram(histogram, column):
+    '''
+    The statistics of DataFrame.select(column).describe(), computed from the
+    number of games per value of the column.
+    '''
+    values = histogram.lazy().filter(pl.col(column).is_not_null() & (pl.col('games') > 0)).sort(column)
+    count = pl.col('games').sum()
+    mean = (pl.col(column) * pl.col('games')).sum() / count
+    rank = pl.col('games').cum_sum()
+
+    def quantile(fraction):
+        # The value at the index the 'nearest' interpolation of Series.quantile picks
+        return pl.col(column).filter(rank > (fraction * (count - 1) + 0.5).floor()).first()
+
+    statistics = values.select(
+        count.alias('count'),
+        mean.alias('mean'),
+        ((pl.col('games') * (pl.col(column) - mean) ** 2).sum() / (count - 1)).sqrt().alias('std'),
+        pl.col(column).first().alias('min'),
+        quantile(0.25).alias('25%'),
+        quantile(0.5).alias('50%'),
+        quantile(0.75).alias('75%'),
+        pl.col(column).last().alias('max'),
+    )
+    nulls = histogram.lazy().select(pl.col('games').filter(pl.col(column).is_null()).sum().alias('null_count'))
+    return (
+        pl.concat([statistics, nulls], how='horizontal')
+        .select([pl.col(name).cast(pl.Float64) for name in ('count', 'null_count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max')])
+        .unpivot(variable_name='statistic', value_name=column)
+    )
+
+def build_queries(state):
+    '''
+    Return the lazy query of every aggregate table by name, computed from the
+    aggregate states of the games. A new aggregate over a dimension only adds a
+    group-by to aggregate_state.
+
+    :param state: Dict of the states of build_state, as DataFrames or LazyFrames.
+    '''
+    state = {name: frame.lazy() for name, frame in state.items()}
+    genres, developers = state['genres'], state['developers']
+
+    def count(column, alias):
+        return pl.col(column).cast(pl.UInt32).alias(alias)
+
+    return {
         'genre_counts': (
-            df
-            .select(pl.col('genres').str.split(',').alias('genre_list'))
-            .explode('genre_list')
-            .select(pl.col('genre_list').str.replace_all(r'^\s+|\s+$', '').alias('genre'))
-            .group_by('genre')
-            .agg(pl.len().alias('count'))
+            genres
+            .select('genre', count('games', 'count'))
             .sort('count', descending=True)
         ),
         'avg_price_by_genre': (
-            df
-            .select(pl.col('genres').str.split(',').alias('genre_list'), pl.col('price'))
-            .explode('genre_list')
-            .with_columns(pl.col('genre_list').str.replace_all(r'^\s+|\s+$', '').alias('genre'))
-            .group_by('genre')
-            .agg(pl.mean('price').alias('avg_price'))
+            genres
+            .select('genre', (pl.col('price_sum') / pl.col('games')).alias('avg_price'))
             .sort('avg_price', descending=True)
         ),
         'top_10_dlc': (
-            df
+            state['dlc']
+            .sort(**top_k_order('dlc_count'))
+            .unique(subset=['name'], keep='first', maintain_order=True)
             .select(['name', 'dlc_count'])
-            .unique(subset=['name'])
-            .sort('dlc_count', descending=True)
             .head(10)
         ),
         'top_10_peak_ccu': (
-            df
-            .sort('peak_ccu', descending=True)
+            state['peak_ccu']
+            .sort(**top_k_order('peak_ccu'))
             .select(['name', 'peak_ccu'])
             .head(10)
         ),
         'platform_distribution': (
-            df
-            .select([
-                pl.col('windows').alias('Windows'),
-                pl.col('mac').alias('Mac'),
-                pl.col('linux').alias('Linux')
-            ])
-            .sum()
+            state['totals']
+            .select([count('windows', 'Windows'), count('mac', 'Mac'), count('linux', 'Linux')])
         ),
         'top_10_languages': (
-            df
-            .select(pl.col('supported_languages').str.split(',').alias('language_list'))
-            .explode('language_list')
-            .select(pl.col('language_list').str.replace_all(r'^\s+|\s+$', '').alias('language'))
-            .group_by('language')
-            .agg(pl.len().alias('count'))
+            state['languages']
+            .select('language', count('games', 'count'))
             .sort('count', descending=True)
             .head(10)
         ),
         'top_10_developers': (
-            df
-            .select(pl.col('developers').str.split(';').alias('developer_list'), pl.col('price'))
-            .explode('developer_list')
-            .select(pl.col('developer_list').str.replace_all(r'^\s+|\s+$', '').alias('developer'), 'price')
-            .filter(pl.col('developer') != '')
-            .group_by('developer')
-            .agg([
-                pl.len().alias('game_count'),
-                pl.mean('price').alias('average_price')
-            ])
+            developers
+            .select('developer', count('games', 'game_count'), (pl.col('price_sum') / pl.col('games')).alias('average_price'))
             .sort('game_count', descending=True)
             .head(10)
         ),
         'games_per_year': (
-            df
-            .with_columns(pl.col('release_date').str.extract(r', (\d{4})$', 1).cast(pl.Int64).alias('release_year'))
-            .group_by('release_year')
-            .agg(pl.len().alias('game_count'))
+            state['years']
+            .select('release_year', count('games', 'game_count'))
             .sort('release_year')
         ),
         'games_highest_ownership': (
-            df
-            .with_columns(pl.col('estimated_owners').str.replace_all(',', '').str.extract(r'(\d+)$', 1).cast(pl.Int64).alias('estimated_owners_num'))
-            .sort('estimated_owners_num', descending=True)
+            state['owners']
+            .sort(**top_k_order('estimated_owners_num'))
             .select(['name', 'estimated_owners_num'])
             .head(10)
         ),
         'avg_positive_negative_by_genre': (
-            df
-            .select(pl.col('genres').str.split(',').alias('genre_list'), pl.col('positive'), pl.col('negative'))
-            .filter(pl.col('positive') > 0)
-            .filter(pl.col('negative') > 0)
-            .explode('genre_list')
-            .select(pl.col('genre_list').str.replace_all(r'^\s+|\s+$', '').alias('genre'), 'positive', 'negative')
-            .group_by('genre')
-            .agg([
-                pl.mean('positive').alias('average_positive_reviews'),
-                pl.mean('negative').alias('average_negative_reviews'),
-                pl.len().alias('game_count')
+            genres
+            .filter(pl.col('reviewed') > 0)
+            .select([
+                'genre',
+                (pl.col('positive_sum') / pl.col('reviewed')).alias('average_positive_reviews'),
+                (pl.col('negative_sum') / pl.col('reviewed')).alias('average_negative_reviews'),
+                count('reviewed', 'game_count')
             ])
             .sort('average_positive_reviews', descending=True)
             .filter(pl.col('game_count') >= 10)
         ),
-        'price_distribution': df.select(['price']).describe(),
+        'price_distribution': describe_histogram(state['prices'], 'price'),
         'top_developers_user_score': (
-            df
-            .select(pl.col('developers').str.split(',').alias('developer_list'), pl.col('recommendations'))
-            .explode('developer_list')
-            .select(pl.col('developer_list').str.replace_all(r'^\s+|\s+$', '').alias('developer'), 'recommendations')
-            .group_by('developer')
-            .agg([
-                pl.mean('recommendations').alias('average_recommendations'),
-                pl.len().alias('game_count')
-            ])
+            developers
+            .select('developer', (pl.col('recommendations_sum') / pl.col('games')).alias('average_recommendations'), count('games', 'game_count'))
             .filter(pl.col('game_count') >= 10)
             .sort('average_recommendations', descending=True)
             .head(10)
         ),
         'age_distribution': (
-            df
-            .select(pl.col('required_age').fill_null(0).cast(pl.Int64).alias('required_age'))
-            .with_columns([
-                (
-                    pl.when(pl.col('required_age').is_between(-1, 8)).then(pl.lit('1. Everyone'))
-                    .when(pl.col('required_age').is_between(8, 12)).then(pl.lit('2. PG'))
-                    .when(pl.col('required_age').is_between(12, 16)).then(pl.lit('3. Teen'))
-                    .when(pl.col('required_age') >= 17).then(pl.lit('4. Mature'))
-                    .otherwise(pl.lit('Everyone'))
-                ).alias('age_category')
-            ])
-            .group_by('age_category')
-            .agg(pl.len().alias('number_of_games'))
+            state['ages']
+            .select('age_category', count('games', 'number_of_games'))
             .sort('age_category')
         )
     }
-    return dataframes
 
-# Generate all DataFrames
-dataframes = generate_dataframes(df)
+def collect(frames):
+    '''
+    Collect a dict of LazyFrames with a single collect_all.
+    '''
+    return dict(zip(frames, pl.collect_all(list(frames.values()))))
+
+def generate_dataframes(df):
+    '''
+    Compute every aggregate table of build_queries in a single collect_all.
+
+    :param df: DataFrame or LazyFrame with the columns of `schema`.
+    :return: Dict mapping each table name to its DataFrame.
+    '''
+    return collect(build_queries(build_state(df.lazy())))
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
 
-# Save the main DataFrame and additional DataFrames to Parquet files
-df.write_parquet('./parquet_tables/steam_games.parquet')
-for name, dataframe in dataframes.items():
-    dataframe.write_parquet(f'./parquet_tables/{name}.parquet')
+def load_state(state_dir):
+    '''
+    Load the aggregate states and the signatures of the input files they hold.
 
-print("All data has been successfully transformed and saved to Parquet files.")
+    :return: (states, signatures), or (None, {}) if there is no complete state.
+    '''
+    try:
+        with open(os.path.join(state_dir, CHUNKS_FILE), 'r') as f:
+            signatures = json.load(f)
+        states = {name: pl.read_parquet(os.path.join(state_dir, f'{name}.parquet')) for name in (*STATE_KEYS, *TOP_K_STATES)}
+    except (OSError, ValueError):
+        return None, {}
+    return states, signatures
 
+def save_state(state_dir, states, files):
+    os.makedirs(state_dir, exist_ok=True)
+    chunks_path = os.path.join(state_dir, CHUNKS_FILE)
+    if os.path.exists(chunks_path):
+        os.remove(chunks_path)  # An interrupted save leaves no state rather than a mismatched one
+    for name, frame in states.items():
+        frame.write_parquet(os.path.join(state_dir, f'{name}.parquet'))
+    with open(chunks_path, 'w') as f:
+        json.dump({os.path.abspath(path): file_signature(path) for path in files}, f)
 
+def pending_files(files, signatures):
+    '''
+    Return the input files that are not folded into the state yet, or None if
+    the state cannot be updated: a file it holds changed or is gone, or a new
+    file comes before one it holds, so its records would not be the last ones.
+    '''
+    paths = [os.path.abspath(path) for path in files]
+    held = [index for index, path in enumerate(paths) if path in signatures]
+    if len(held) != len(signatures) or any(file_signature(files[index]) != signatures[paths[index]] for index in held):
+        return None
+    new = [index for index, path in enumerate(paths) if path not in signatures]
+    if held and new and new[0] < held[-1]:
+        return None
+    return [files[index] for index in new]
+
+def write_games(df, path, partition_by=PARTITION_BY, sort_by=SORT_BY, row_group_size=ROW_GROUP_SIZE,
+                compression=COMPRESSION, compression_level=COMPRESSION_LEVEL):
+    '''
+    Write the games to `path`, with a release_year column, replacing the previous
+    file or partitions, and return them as written.
+
+    By default `path` is a single file. Rows are sorted by `sort_by` and every
+    row group has min/max statistics, so a lookup by that column only decodes
+    the row groups that may hold it. With `partition_by`, `path` is a directory
+    of Hive partitions (release_year=2020/00000000.parquet, ...), so a filter on
+    that column only opens the matching files, but a lookup by `sort_by` opens
+    every one of them.
+    '''
+    games = df.with_columns(RELEASE_YEAR)
+    if sort_by:
+        games = games.sort(sort_by)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    games.write_parquet(path, compression=compression, compression_level=compression_level, statistics=True,
+                        row_group_size=row_group_size, partition_by=partition_by, mkdir=True)
+    return games
+
+def scan_games_table(output_dir=OUTPUT_DIR):
+    '''
+    LazyFrame of the games saved by transform, in either layout. Filters and
+    column selections are pushed into the scan: a filter on the partition
+    column prunes partitions, row groups whose statistics rule out a filter are
+    skipped, and only the selected columns are read.
+    '''
+    return pl.scan_parquet(os.path.join(output_dir, GAMES_FILE))
+
+def read_games(output_dir=OUTPUT_DIR, app_ids=None, years=None, columns=None):
+    '''
+    Read the games saved by transform, e.g. read_games(years=[2020], columns=['app_id', 'name']).
+
+    :param app_ids: Only read these games.
+    :param years: Only read the games released in these years.
+    :param columns: Only read these columns, all of them by default.
+    '''
+    games = scan_games_table(output_dir)
+    if app_ids is not None:
+        games = games.filter(pl.col('app_id').is_in([str(app_id) for app_id in app_ids]))
+    if years is not None:
+        games = games.filter(pl.col('release_year').is_in(list(years)))
+    if columns is not None:
+        games = games.select(columns)
+    return games.collect()
+
+def transform(paths=DATA_PATH, output_dir=OUTPUT_DIR, incremental=False, **layout):
+    '''
+    Read the scraped games, and save them and the DataFrames of generate_dataframes
+    to Parquet files in `output_dir`. The aggregate states are saved as well,
+    under `output_dir`/state.
+
+    With `incremental`, only the input files that the previous run did not read
+    (e.g. the new chunks of a chunk directory) are parsed. Their games are folded
+    into the saved states, the previous records of the games they replace are
+    taken out, and the aggregate tables are computed from the states. Only the
+    aggregates are incremental: the previous steam_games.parquet is read in full
+    and rewritten with the new games. The whole input is read again if a file
+    read before has changed.
+
+    :param paths: Input files or chunk directories, see scan_games.
+    :param layout: Keyword arguments of write_games, e.g. partition_by='release_year'.
+    :return: Dict mapping each table name, 'steam_games' included, to its
+        DataFrame; empty if an incremental run found no new input.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    state_dir = os.path.join(output_dir, STATE_DIR)
+    games_path = os.path.join(output_dir, GAMES_FILE)
+    files = input_files(paths)
+
+    states, pending = None, None
+    if incremental and os.path.exists(games_path):
+        states, signatures = load_state(state_dir)
+        pending = pending_files(files, signatures) if states else None
+        if pending == []:
+            return {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if pending is None:
+            df = scan_games(files, workdir).collect(engine='streaming')
+            states = collect(build_state(df.lazy()))
+        else:
+            added = scan_games(pending, workdir).collect(engine='streaming')
+            previous = read_games(output_dir, columns=list(schema))
+            replaced = pl.col('app_id').is_in(added['app_id'].implode())
+            df = pl.concat([previous.filter(~replaced), added], how='vertical_relaxed')
+            states = {
+                **collect(merge_states(states, aggregate_state(added.lazy()), aggregate_state(previous.lazy().filter(replaced), sign=-1))),
+                **merge_top_k(states, collect(top_k_state(added.lazy())), added['app_id'], df),
+            }
+
+    # Generate all DataFrames
+    dataframes = {'steam_games': df, **collect(build_queries(states))}
+
+    # Save the main DataFrame and additional DataFrames to Parquet files
+    dataframes['steam_games'] = write_games(df, games_path, **layout)
+    for name, dataframe in dataframes.items():
+        if name != 'steam_games':
+            dataframe.write_parquet(os.path.join(output_dir, f'{name}.parquet'))
+    save_state(state_dir, states, files)
+    return dataframes
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Transform scraped Steam games into Parquet tables.')
+    parser.add_argument('paths', nargs='*', default=[DATA_PATH], help='Merged JSON file, chunk files or chunk directories, or newline-delimited JSON files')
+    parser.add_argument('-o', '--output-dir', type=str, default=OUTPUT_DIR, help='Directory the Parquet files are written to')
+    parser.add_argument('--incremental', action='store_true', help='Only parse the input files the previous run did not read, and update the aggregate tables from the saved states')
+    parser.add_argument('--partition-by', type=str, default=PARTITION_BY, help="Hive partition column of steam_games.parquet, e.g. release_year, or 'none' for a single file")
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE, help='Rows per row group of steam_games.parquet')
+    parser.add_argument('--compression', type=str, default=COMPRESSION, help='Parquet compression codec of steam_games.parquet')
+    args = parser.parse_args()
+
+    layout = {
+        'partition_by': None if (args.partition_by or 'none').lower() == 'none' else args.partition_by,
+        'row_group_size': args.row_group_size,
+        'compression': args.compression,
+        'compression_level': COMPRESSION_LEVEL if args.compression == COMPRESSION else None,
+    }
+    if transform(args.paths, args.output_dir, args.incremental, **layout):
+        print("All data has been successfully transformed and saved to Parquet files.")
+    else:
+        print("No new input, the Parquet files are up to date.")